@@ -2,6 +2,7 @@ import math
 import logging
 from .models import VolunteerAvailability, MatchResult, RideRequest
 from django.utils import timezone
+from stransport.geo import haversine_meters, haversine_one_to_many
 
 logger = logging.getLogger(__name__)
 
@@ -14,23 +15,19 @@ def send_notification(user, message):
 
 def _haversine(lat1, lon1, lat2, lon2):
     # Calculate distance in kilometers between two lat/lon pairs
-    R = 6371.0  # Earth radius in km
     try:
-        from math import radians, sin, cos, sqrt, atan2
-        dlat = radians(lat2 - lat1)
-        dlon = radians(lon2 - lon1)
-        a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        return R * c
+        return haversine_meters(lat1, lon1, lat2, lon2) / 1000.0
     except Exception:
         return float('inf')
 
 
-def _distance_score(request, volunteer):
-    # Prefer volunteers with numeric coords if available, else fallback to text match
+def _distance_score(request, volunteer, dist_km=None):
+    # Prefer volunteers with numeric coords if available, else fallback to text match.
+    # dist_km may be precomputed for all candidates at once (see match_request_to_volunteers).
     try:
         if request.pickup_lat is not None and request.pickup_lng is not None and volunteer.current_lat is not None and volunteer.current_lng is not None:
-            dist_km = _haversine(request.pickup_lat, request.pickup_lng, volunteer.current_lat, volunteer.current_lng)
+            if dist_km is None:
+                dist_km = _haversine(request.pickup_lat, request.pickup_lng, volunteer.current_lat, volunteer.current_lng)
             # score in [0,1] where closer gets higher score (clamp)
             score = max(0.0, 1.0 - (dist_km / 50.0))
             return score
@@ -63,13 +60,25 @@ def match_request_to_volunteers(request: RideRequest):
     - compute score = distance_score + time_score + experience_score
     - return best volunteer (VolunteerAvailability instance) and score
     """
-    candidates = VolunteerAvailability.objects.filter(status__iexact='available')
+    candidates = list(VolunteerAvailability.objects.filter(status__iexact='available'))
     best = None
     best_score = -math.inf
 
-    for vol in candidates:
+    # all pickup->volunteer distances in one vectorised call (NaN where coords are missing)
+    distances_km = [None] * len(candidates)
+    if candidates and request.pickup_lat is not None and request.pickup_lng is not None:
+        distances_km = (
+            haversine_one_to_many(
+                request.pickup_lat,
+                request.pickup_lng,
+                [(vol.current_lat, vol.current_lng) for vol in candidates],
+            )
+            / 1000.0
+        ).tolist()
+
+    for vol, dist_km in zip(candidates, distances_km):
         try:
-            dscore = _distance_score(request.pickup_location, vol.current_location)
+            dscore = _distance_score(request, vol, dist_km)
             tscore = _time_compatibility_score(request.requested_time, vol.available_from, vol.available_until)
             escore = _experience_score(vol)
             score = dscore + tscore + escore
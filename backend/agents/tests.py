@@ -36,6 +36,16 @@ class MatchingServiceTests(TestCase):
         # Alice is same location so should score higher
         self.assertEqual(vol.volunteer_name, 'Alice')
 
+    def test_match_prefers_nearest_volunteer_by_coordinates(self):
+        self.vol1.current_lat, self.vol1.current_lng = 32.80, 35.00
+        self.vol1.save()
+        self.vol2.current_lat, self.vol2.current_lng = 32.09, 34.78
+        self.vol2.save()
+        self.request.pickup_lat, self.request.pickup_lng = 32.08, 34.78
+        self.request.save()
+        vol, _ = match_request_to_volunteers(self.request)
+        self.assertEqual(vol.volunteer_name, 'Bob')
+
     def test_explain_match(self):
         explanation = explain_match(self.request, self.vol1)
         self.assertIsInstance(explanation, str)
@@ -19,6 +19,10 @@ for i in 1 2 3 4 5 6 7 8 9 10; do
   sleep 5
 done
 
+# Fill the request/offer match table (suggestions are read only from it).
+# Full rebuild in one transaction; safe to run every boot (covers rows that existed before the table).
+python manage.py rebuild_matches || echo "rebuild_matches failed; matches fill in as requests/offers are saved"
+
 # Create/update Django admin user in Render if configured.
 # (safe to run every boot; command is idempotent)
 if [ -n "$ADMIN_PASSWORD" ]; then
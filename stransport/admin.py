@@ -1,6 +1,8 @@
 from django.contrib import admin
-from .models import Profile, TransportRequest, TransportAssignment
+from .models import DispatchProposal, GeocodeCacheEntry, Profile, TransportRequest, TransportAssignment
 
 admin.site.register(Profile)
 admin.site.register(TransportRequest)
 admin.site.register(TransportAssignment)
+admin.site.register(GeocodeCacheEntry)
+admin.site.register(DispatchProposal)
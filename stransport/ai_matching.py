@@ -2,17 +2,40 @@
 התאמת הצעות נסיעה (RideOffer) לבקשה באמצעות AI (OpenAI API).
 מקבל סיכום בקשה + רשימת הצעות, מחזיר הצעות ממוינות לפי ציון התאמה + הסבר קצר.
 
+תשובות המודל נשמרות במטמון LRU בזיכרון (עם TTL) לפי hash של סיכום הבקשה המנורמל + מזהי
+וטקסטי ההצעות – שליחה כפולה / ניסיון חוזר מקבלים תשובה מיד בלי קריאה נוספת. קריאות מקבילות
+לאותו מפתח ממתינות לקריאה אחת. match_cache_stats() – hit ratio, זמן וטוקנים שנחסכו.
+
 שלב הבא: חיבור התאמת AI ל־UI – הצגת התאמות למטופל במפה/במודל (נסיעות מתנדבים ממוינות לפי התאמה לבקשה).
 """
+import hashlib
 import json
 import logging
 import os
 import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
 
-import requests
+from . import http_client
 
 logger = logging.getLogger(__name__)
 
+_lock = threading.Lock()
+_memory = OrderedDict()  # key -> (id_to_score, expires_at, latency_ms, tokens)
+_inflight = {}  # key -> threading.Event של הקריאה שרצה כרגע
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "coalesced": 0,
+    "expired": 0,
+    "evictions": 0,
+    "latency_saved_ms": 0.0,
+    "tokens_saved": 0,
+}
+
 
 def _get_api_key():
     try:
@@ -22,6 +45,134 @@ def _get_api_key():
         return (os.environ.get("AI_API_KEY") or "").strip()
 
 
+def _normalize(text):
+    return re.sub(r"\s+", " ", (text or "").strip().casefold())
+
+
+def match_cache_key(request_summary, offers):
+    """מפתח תוכן: סיכום הבקשה המנורמל + (id, טקסט מנורמל) של כל הצעה, בלי תלות בסדר ההצעות."""
+    request_summary = request_summary or {}
+    parts = [_normalize(request_summary.get(field)) for field in ("pickup", "destination", "time_text")]
+    parts += sorted(f"{o.get('id')}={_normalize(o.get('raw_text'))}" for o in offers)
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def match_cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["memory_size"] = len(_memory)
+        stats["inflight"] = len(_inflight)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    stats["latency_saved_ms"] = round(stats["latency_saved_ms"], 1)
+    return stats
+
+
+def clear_match_cache():
+    with _lock:
+        _memory.clear()
+        for name in _stats:
+            _stats[name] = 0
+
+
+def _memory_get(key, now):
+    """תוצאה שמורה (ונרשמת כ-hit) או None. נקרא תחת _lock."""
+    item = _memory.get(key)
+    if item is None:
+        return None
+    id_to_score, expires_at, latency_ms, tokens = item
+    if expires_at <= now:
+        del _memory[key]
+        _stats["expired"] += 1
+        return None
+    _memory.move_to_end(key)
+    _stats["hits"] += 1
+    _stats["latency_saved_ms"] += latency_ms
+    _stats["tokens_saved"] += tokens
+    return id_to_score
+
+
+def _memory_put(key, id_to_score, latency_ms, tokens):
+    max_size = int(getattr(settings, "AI_MATCH_CACHE_SIZE", 512))
+    ttl = int(getattr(settings, "AI_MATCH_CACHE_TTL_SECONDS", 900))
+    with _lock:
+        _memory[key] = (id_to_score, time.monotonic() + ttl, latency_ms, tokens)
+        _memory.move_to_end(key)
+        while len(_memory) > max_size:
+            _memory.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def _cached_scores(key, fetch):
+    """
+    id_to_score מהמטמון, או מ-fetch() -> (id_to_score או None, tokens) שנשמר רק בהצלחה.
+    קריאה מקבילה לאותו מפתח ממתינה לקריאה שכבר רצה במקום לשלוח prompt נוסף.
+    """
+    while True:
+        with _lock:
+            id_to_score = _memory_get(key, time.monotonic())
+            if id_to_score is not None:
+                return id_to_score
+            event = _inflight.get(key)
+            if event is None:
+                event = _inflight[key] = threading.Event()
+                _stats["misses"] += 1
+                break
+            _stats["coalesced"] += 1
+        # אם הקריאה שרצה נכשלה – הלולאה הבאה מריצה קריאה משלה
+        event.wait(timeout=float(getattr(settings, "AI_MATCH_INFLIGHT_WAIT_SECONDS", 30)))
+
+    started = time.perf_counter()
+    try:
+        id_to_score, tokens = fetch()
+        if id_to_score is not None:
+            _memory_put(key, id_to_score, (time.perf_counter() - started) * 1000, tokens)
+        return id_to_score
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        event.set()
+
+
+def _fetch_ai_scores(api_key, prompt):
+    """קריאה ל-OpenAI. מחזיר ({id: (score, reason)} או None בכשל, מספר הטוקנים)."""
+    resp = http_client.post(
+        "openai",
+        "https://api.openai.com/v1/chat/completions",
+        headers={
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        },
+        json={
+            "model": "gpt-4o-mini",
+            "messages": [
+                {"role": "system", "content": "You respond only with valid JSON array. No markdown."},
+                {"role": "user", "content": prompt},
+            ],
+            "temperature": 0.2,
+            "max_tokens": 800,
+        },
+    )
+    if resp.status_code != 200:
+        return None, 0
+    data = resp.json()
+    tokens = int((data.get("usage") or {}).get("total_tokens") or 0)
+    choices = data.get("choices") or []
+    if not choices:
+        return None, tokens
+    text = (choices[0].get("message") or {}).get("content") or ""
+    text = text.strip()
+    if text.startswith("```"):
+        text = re.sub(r"^```\w*\n?", "", text).rstrip("`\n")
+    try:
+        arr = json.loads(text)
+        id_to_score = {int(x.get("id", 0)): (float(x.get("score", 0)), (x.get("reason") or "")) for x in arr if isinstance(x, dict)}
+    except (json.JSONDecodeError, ValueError, TypeError, AttributeError) as e:
+        logger.warning("AI response parse failed: %s", e)
+        return None, tokens
+    return id_to_score, tokens
+
+
 def _fallback_score(request_summary: dict, offer_text: str) -> float:
     """התאמה פשוטה בלי API: חפיפה מילות מפתח (מוצא, יעד)."""
     pickup = (request_summary.get("pickup") or "").lower().replace("-", " ")
@@ -69,47 +220,21 @@ def ai_match_offers_to_request(request_summary: dict, offers: list) -> list:
 מיין מההתאמה הגבוהה לנמוכה. רק הצעות רלוונטיות (score >= 0.3).
 דוגמה: [{"id":1,"score":0.9,"reason":"מוצא ויעד תואמים וזמן קרוב."}]
 """
-            resp = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": "gpt-4o-mini",
-                    "messages": [
-                        {"role": "system", "content": "You respond only with valid JSON array. No markdown."},
-                        {"role": "user", "content": prompt},
-                    ],
-                    "temperature": 0.2,
-                    "max_tokens": 800,
-                },
-                timeout=15,
+            id_to_score = _cached_scores(
+                match_cache_key(request_summary, offers), lambda: _fetch_ai_scores(api_key, prompt)
             )
-            if resp.status_code == 200:
-                data = resp.json()
-                choices = data.get("choices") or []
-                if choices:
-                    text = (choices[0].get("message") or {}).get("content") or ""
-                    text = text.strip()
-                    if text.startswith("```"):
-                        text = re.sub(r"^```\w*\n?", "", text).rstrip("`\n")
-                    try:
-                        arr = json.loads(text)
-                        id_to_score = {int(x.get("id", 0)): (float(x.get("score", 0)), (x.get("reason") or "")) for x in arr if isinstance(x, dict)}
-                        result = []
-                        for o in offers:
-                            oid = o.get("id")
-                            score, reason = id_to_score.get(oid, (0.0, ""))
-                            result.append({
-                                **o,
-                                "score": round(score, 2),
-                                "reason": reason or "התאמה לפי AI",
-                            })
-                        result.sort(key=lambda x: x.get("score", 0), reverse=True)
-                        return result
-                    except (json.JSONDecodeError, ValueError) as e:
-                        logger.warning("AI response parse failed: %s", e)
+            if id_to_score is not None:
+                result = []
+                for o in offers:
+                    oid = o.get("id")
+                    score, reason = id_to_score.get(oid, (0.0, ""))
+                    result.append({
+                        **o,
+                        "score": round(score, 2),
+                        "reason": reason or "התאמה לפי AI",
+                    })
+                result.sort(key=lambda x: x.get("score", 0), reverse=True)
+                return result
         except Exception as e:
             logger.warning("AI matching request failed: %s", e, exc_info=True)
 
@@ -0,0 +1,110 @@
+"""
+שיבוץ אופטימלי גלובלי של בקשות להצעות (ולא "הכי טוב לכל משתמש בנפרד"):
+- min_cost_assignment – האלגוריתם ההונגרי (shortest augmenting path, O(n^2 m)) על מטריצת עלויות,
+  עם הלולאה הפנימית על העמודות ב-NumPy.
+- capacitated_matching – התאמה במשקל מקסימלי בגרף דו-צדדי דליל (זוגות עם ציון) עם קיבולת
+  לכל הצעה (מקומות פנויים): כל רכיב קשירות נפתר בנפרד, וכל הצעה משוכפלת לעמודה לכל מקום.
+"""
+import numpy as np
+
+
+def min_cost_assignment(cost):
+    """
+    שיבוץ בעלות מינימלית: מחזיר רשימה באורך מספר השורות – אינדקס העמודה של כל שורה,
+    או None לשורה שלא שובצה (כשיש יותר שורות מעמודות). כל עמודה משובצת לשורה אחת לכל היותר.
+    """
+    cost = np.asarray(cost, dtype=float)
+    n, m = cost.shape if cost.ndim == 2 else (0, 0)
+    if not n or not m:
+        return [None] * n
+    if n > m:
+        # האלגוריתם מניח שורות <= עמודות – פותרים את המשוחלפת והופכים
+        result = [None] * n
+        for col, row in enumerate(min_cost_assignment(cost.T)):
+            result[row] = col
+        return result
+
+    # אינדקסים מ-1; עמודה 0 היא עמודת עזר לשורה שמשובצת כרגע
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            used_cols = np.nonzero(used)[0]
+            u[p[used_cols]] += delta
+            v[used_cols] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    result = [None] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            result[p[j] - 1] = j - 1
+    return result
+
+
+def _components(pairs):
+    """רכיבי קשירות (union-find) של הגרף הדו-צדדי: רשימת רשימות זוגות."""
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for left, right in pairs:
+        parent[find(("l", left))] = find(("r", right))
+    groups = {}
+    for left, right in pairs:
+        groups.setdefault(find(("l", left)), []).append((left, right))
+    return list(groups.values())
+
+
+def capacitated_matching(scores, capacities):
+    """
+    scores: {(left, right): ציון > 0}, capacities: {right: מספר מקומות}.
+    מחזיר {left: right} שממקסם את סכום הציונים, כשכל left משובץ לכל היותר פעם אחת
+    וכל right לכל היותר capacities[right] פעמים (זוג בלי ציון לא משובץ לעולם).
+    """
+    result = {}
+    for component in _components([pair for pair, score in scores.items() if score > 0]):
+        lefts = sorted({left for left, _ in component})
+        rights = sorted({right for _, right in component})
+        # עמודה לכל מקום פנוי; מעבר למספר השורות אין טעם בעוד מקומות
+        slots = [right for right in rights for _ in range(min(max(0, capacities.get(right, 1)), len(lefts)))]
+        if not slots:
+            continue
+        row_of = {left: i for i, left in enumerate(lefts)}
+        cols_of = {}
+        for col, right in enumerate(slots):
+            cols_of.setdefault(right, []).append(col)
+        # עלות = -ציון; זוג שאינו קיים = 0, כלומר שיבוץ אליו שקול ל"לא משובץ"
+        cost = np.zeros((len(lefts), len(slots)))
+        for left, right in component:
+            cost[row_of[left], cols_of.get(right, [])] = -scores[(left, right)]
+        for row, col in enumerate(min_cost_assignment(cost)):
+            if col is not None and cost[row, col] < 0:
+                result[lefts[row]] = slots[col]
+    return result
@@ -22,6 +22,7 @@ class RequestsConsumer(AsyncJsonWebsocketConsumer):
         role = await get_user_role(user.id)
         if role == "volunteer":
             await self.channel_layer.group_add("volunteers", self.channel_name)
+            await self.channel_layer.group_add(f"volunteer_{user.id}", self.channel_name)
         elif role == "sick":
             await self.channel_layer.group_add(f"patient_{user.id}", self.channel_name)
 
@@ -35,6 +36,7 @@ class RequestsConsumer(AsyncJsonWebsocketConsumer):
         role = await get_user_role(user.id)
         if role == "volunteer":
             await self.channel_layer.group_discard("volunteers", self.channel_name)
+            await self.channel_layer.group_discard(f"volunteer_{user.id}", self.channel_name)
         elif role == "sick":
             await self.channel_layer.group_discard(f"patient_{user.id}", self.channel_name)
 
@@ -45,3 +47,21 @@ class RequestsConsumer(AsyncJsonWebsocketConsumer):
                 "request": event.get("request"),
             }
         )
+
+    async def dispatch_proposals(self, event):
+        await self.send_json(
+            {
+                "event": "dispatch_proposals",
+                "proposals": event.get("proposals", []),
+            }
+        )
+
+    async def route_plan(self, event):
+        await self.send_json(
+            {
+                "event": "route_plan",
+                "job_id": event.get("job_id"),
+                "status": event.get("status"),
+                "result": event.get("result"),
+            }
+        )
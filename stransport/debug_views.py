@@ -4,6 +4,7 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
+from . import ai_matching, geocoding, http_client
 from .models import TransportRequest, VolunteerLocation
 
 
@@ -29,6 +30,25 @@ def debug_health(request):
     return JsonResponse({"ok": True, "debug": True})
 
 
+@require_http_methods(["GET"])
+def debug_cache_stats(request):
+    """
+    Staff-only snapshot of the in-process caches and outbound providers:
+    http_client.provider_stats, geocoding.geocode_cache_stats, ai_matching.match_cache_stats.
+    Counters are per worker process (each gunicorn/daphne worker reports its own).
+    """
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return _forbidden()
+    return JsonResponse(
+        {
+            "ok": True,
+            "providers": http_client.provider_stats(),
+            "geocoding": geocoding.geocode_cache_stats(),
+            "ai_matching": ai_matching.match_cache_stats(),
+        }
+    )
+
+
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
 def debug_request_location(request, req_id: int):
@@ -0,0 +1,406 @@
+"""
+Dispatch optimizer: שיבוץ גלובלי של בקשות פתוחות למתנדבים בחלון זמן (DISPATCH_HORIZON_HOURS).
+
+רכבים:
+- נסיעה שפורסמה (RideOffer פתוח עם קואורדינטות) – מסלול from -> to עם יעד קבוע.
+- מתנדב עם מיקום עדכני (VolunteerLocation) – מסלול פתוח מהמיקום הנוכחי.
+
+שיבוץ ב-regret insertion: בכל צעד נבחרת הבקשה שהכי "תפסיד" אם לא תקבל את הרכב הזול ביותר שלה
+(ההפרש בין ההכנסה הזולה לשנייה), ומוכנסת למסלול שלו (best_pair_insertion – קדימות + קיבולת).
+אחרי כל הכנסה מחושבות מחדש רק עלויות הרכב שהשתנה.
+המטרה – סך עקיפות (detour) מינימלי, עם תקרת עקיפה ומספר בקשות לרכב.
+
+עדכון אינקרמנטלי (dispatch_request_changed): בקשה חדשה מוכנסת למסלולים הקיימים (מתוך DispatchProposal),
+בקשה שבוטלה/נתפסה מוסרת – בלי הרצה מלאה.
+"""
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from .models import DispatchProposal, RideOffer, TransportRequest, VolunteerLocation
+from .geo import haversine_matrix
+from .route_optimizer import best_pair_insertion, insert_pair, route_cost, route_loads
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def offer_departure(offer):
+    """departure_at המנורמל; הצעה עם תאריך בלי שעה – חצות של אותו יום (date_only)."""
+    if offer.departure_at is not None:
+        return offer.departure_at
+    if not offer.parsed_date:
+        return None
+    dt = datetime.combine(offer.parsed_date, datetime.min.time())
+    return timezone.make_aware(dt, timezone.get_current_timezone())
+
+
+def collect_vehicles(now, horizon_end):
+    """רשימת רכבים: dict עם key, volunteer_id, offer_id, start, end (או None), departure, date_only."""
+    vehicles = []
+    offers = RideOffer.objects.filter(
+        status="open",
+        from_lat__isnull=False,
+        from_lng__isnull=False,
+        to_lat__isnull=False,
+        to_lng__isnull=False,
+    ).filter(
+        # חלון הימים מסונן ב-DB על departure_at; הצעות בלי שעה (date_only) לפי parsed_date
+        models.Q(departure_at__date__range=(now.date(), horizon_end.date()))
+        | models.Q(departure_at__isnull=True, parsed_date__range=(now.date(), horizon_end.date()))
+        | models.Q(departure_at__isnull=True, parsed_date__isnull=True)
+    ).only("id", "volunteer_id", "from_lat", "from_lng", "to_lat", "to_lng", "parsed_date", "departure_at")
+    for offer in offers:
+        departure = offer_departure(offer)
+        vehicles.append(
+            {
+                "key": f"offer:{offer.id}",
+                "volunteer_id": offer.volunteer_id,
+                "offer_id": offer.id,
+                "start": (offer.from_lat, offer.from_lng),
+                "end": (offer.to_lat, offer.to_lng),
+                "departure": departure,
+                "date_only": offer.departure_at is None,
+            }
+        )
+
+    fresh = now - timedelta(minutes=int(_setting("DISPATCH_LOCATION_MAX_AGE_MINUTES", 30)))
+    seen = {v["volunteer_id"] for v in vehicles}
+    locations = (
+        VolunteerLocation.objects.filter(updated_at__gte=fresh)
+        .select_related("assignment")
+        .order_by("-updated_at")
+    )
+    for location in locations:
+        volunteer_id = location.assignment.volunteer_id
+        if volunteer_id in seen:
+            continue
+        seen.add(volunteer_id)
+        vehicles.append(
+            {
+                "key": f"volunteer:{volunteer_id}",
+                "volunteer_id": volunteer_id,
+                "offer_id": None,
+                "start": (location.lat, location.lng),
+                "end": None,
+                "departure": None,
+                "date_only": False,
+            }
+        )
+    return vehicles
+
+
+def collect_requests(now, horizon_end):
+    return list(
+        TransportRequest.objects.filter(
+            status="open",
+            no_volunteers_available=False,
+            requested_time__gte=now,
+            requested_time__lte=horizon_end,
+            pickup_lat__isnull=False,
+            pickup_lng__isnull=False,
+            dest_lat__isnull=False,
+            dest_lng__isnull=False,
+        ).only("id", "pickup_lat", "pickup_lng", "dest_lat", "dest_lng", "requested_time", "sick_id")
+    )
+
+
+def time_compatible(vehicle, req):
+    departure = vehicle["departure"]
+    if departure is None:
+        return True
+    if vehicle["date_only"]:
+        return timezone.localtime(req.requested_time).date() == timezone.localtime(departure).date()
+    tolerance = int(_setting("DISPATCH_TIME_TOLERANCE_MINUTES", 90)) * 60
+    return abs((req.requested_time - departure).total_seconds()) <= tolerance
+
+
+class Plan:
+    """מסלולי הרכבים על מטריצה משותפת. nodes: 2i/2i+1 = מוצא/יעד רכב i; אחריהם זוגות הבקשות."""
+
+    def __init__(self, vehicles, requests):
+        self.vehicles = vehicles
+        self.requests = {r.id: r for r in requests}
+        points = []
+        for vehicle in vehicles:
+            points.append(vehicle["start"])
+            points.append(vehicle["end"] or vehicle["start"])
+        self.nodes = {}
+        for req in requests:
+            self.nodes[req.id] = (len(points), len(points) + 1)
+            points.append((req.pickup_lat, req.pickup_lng))
+            points.append((req.dest_lat, req.dest_lng))
+        self.matrix = haversine_matrix(points)
+        self.routes = []
+        for index, vehicle in enumerate(vehicles):
+            route = [2 * index]
+            if vehicle["end"]:
+                route.append(2 * index + 1)
+            self.routes.append(route)
+        self.base_cost = [route_cost(route, self.matrix) for route in self.routes]
+        self.assigned = [[] for _ in vehicles]
+        self.deltas = {}
+        for pickup, dropoff in self.nodes.values():
+            self.deltas[pickup] = 1
+            self.deltas[dropoff] = -1
+        self.capacity = int(_setting("ROUTE_VEHICLE_CAPACITY", 3))
+        self.max_detour = float(_setting("DISPATCH_MAX_DETOUR_M", 20000))
+        self.max_requests = int(_setting("DISPATCH_MAX_REQUESTS_PER_VEHICLE", 4))
+
+    def detour(self, index):
+        return route_cost(self.routes[index], self.matrix) - self.base_cost[index]
+
+    def insertion(self, index, req_id):
+        """(delta, p, q) להכנסת הבקשה לרכב index, או None אם אסור."""
+        vehicle = self.vehicles[index]
+        if len(self.assigned[index]) >= self.max_requests or not time_compatible(vehicle, self.requests[req_id]):
+            return None
+        pickup, dropoff = self.nodes[req_id]
+        route = self.routes[index]
+        best = best_pair_insertion(
+            route,
+            self.matrix,
+            pickup,
+            dropoff,
+            route_loads(route, self.deltas),
+            self.capacity,
+            fixed_end=bool(vehicle["end"]),
+        )
+        if best is None or self.detour(index) + best[0] > self.max_detour:
+            return None
+        return best
+
+    def insert(self, index, req_id, p, q):
+        pickup, dropoff = self.nodes[req_id]
+        insert_pair(self.routes[index], pickup, dropoff, p, q)
+        self.assigned[index].append(req_id)
+
+    def restore(self, index, route_req_ids):
+        """שחזור מסלול קיים: route_req_ids = רשימת (req_id, 'pickup'/'dropoff') לפי הסדר."""
+        route = self.routes[index]
+        body = [
+            self.nodes[req_id][0 if kind == "pickup" else 1]
+            for req_id, kind in route_req_ids
+            if req_id in self.nodes
+        ]
+        route[1:1] = body
+        self.assigned[index] = list(dict.fromkeys(req_id for req_id, _ in route_req_ids if req_id in self.nodes))
+
+    def proposals(self, run_id, indices=None):
+        out = []
+        for index, vehicle in enumerate(self.vehicles):
+            if indices is not None and index not in indices:
+                continue
+            route = self.routes[index]
+            position = {node: k for k, node in enumerate(route)}
+            for req_id in self.assigned[index]:
+                pickup, dropoff = self.nodes[req_id]
+                # עלות העקיפה של הבקשה = מה שנחסך בהוצאתה מהמסלול
+                without = [node for node in route if node not in (pickup, dropoff)]
+                out.append(
+                    DispatchProposal(
+                        run_id=run_id,
+                        request_id=req_id,
+                        volunteer_id=vehicle["volunteer_id"],
+                        offer_id=vehicle["offer_id"],
+                        pickup_index=position[pickup] - 1,
+                        dropoff_index=position[dropoff] - 1,
+                        detour_m=route_cost(route, self.matrix) - route_cost(without, self.matrix),
+                    )
+                )
+        return out
+
+
+def regret_assign(plan, req_ids):
+    """שיבוץ regret-2. מחזיר את רשימת הבקשות שלא שובצו."""
+    options = {}
+    for req_id in req_ids:
+        options[req_id] = {}
+        for index in range(len(plan.vehicles)):
+            best = plan.insertion(index, req_id)
+            if best is not None:
+                options[req_id][index] = best
+
+    unassigned = []
+    while options:
+        pick, pick_key = None, None
+        for req_id, by_vehicle in options.items():
+            if not by_vehicle:
+                continue
+            costs = sorted(option[0] for option in by_vehicle.values())
+            regret = costs[1] - costs[0] if len(costs) > 1 else float("inf")
+            key = (regret, -costs[0])
+            if pick_key is None or key > pick_key:
+                pick, pick_key = req_id, key
+        if pick is None:
+            unassigned.extend(options)
+            break
+        index, (_, p, q) = min(options.pop(pick).items(), key=lambda item: item[1][0])
+        plan.insert(index, pick, p, q)
+        for req_id, by_vehicle in options.items():
+            best = plan.insertion(index, req_id)
+            if best is None:
+                by_vehicle.pop(index, None)
+            else:
+                by_vehicle[index] = best
+    return unassigned
+
+
+def publish_proposals(volunteer_ids):
+    channel_layer = get_channel_layer()
+    if not channel_layer or not volunteer_ids:
+        return
+    rows = DispatchProposal.objects.filter(volunteer_id__in=volunteer_ids).values(
+        "volunteer_id", "request_id", "offer_id", "pickup_index", "dropoff_index", "detour_m"
+    )
+    grouped = {volunteer_id: [] for volunteer_id in volunteer_ids}
+    for row in rows:
+        grouped[row.pop("volunteer_id")].append(row)
+    try:
+        for volunteer_id, proposals in grouped.items():
+            async_to_sync(channel_layer.group_send)(
+                f"volunteer_{volunteer_id}",
+                {"type": "dispatch.proposals", "proposals": proposals},
+            )
+    except Exception:
+        logger.warning("Failed to publish dispatch proposals", exc_info=True)
+
+
+def run_dispatch(now=None):
+    """הרצה מלאה: מחליפה את כל ההצעות הקיימות. מחזיר סטטיסטיקה."""
+    now = now or timezone.now()
+    horizon_end = now + timedelta(hours=int(_setting("DISPATCH_HORIZON_HOURS", 24)))
+    vehicles = collect_vehicles(now, horizon_end)
+    requests = collect_requests(now, horizon_end)
+    plan = Plan(vehicles, requests)
+    unassigned = regret_assign(plan, sorted(plan.requests))
+    run_id = uuid.uuid4().hex
+    proposals = plan.proposals(run_id)
+
+    previous = set(DispatchProposal.objects.values_list("volunteer_id", flat=True).distinct())
+    with transaction.atomic():
+        _lock_vehicles(vehicles)
+        DispatchProposal.objects.all().delete()
+        DispatchProposal.objects.bulk_create(proposals)
+    publish_proposals(previous | {p.volunteer_id for p in proposals})
+    return {
+        "run_id": run_id,
+        "vehicles": len(vehicles),
+        "requests": len(requests),
+        "assigned": len(proposals),
+        "unassigned": len(unassigned),
+        "total_detour_m": round(sum(p.detour_m for p in proposals), 1),
+    }
+
+
+def _vehicle_key(offer_id, volunteer_id):
+    """מפתח הרכב (כמו vehicle["key"] ב-collect_vehicles) של הצעת שיבוץ שמורה."""
+    return f"offer:{offer_id}" if offer_id else f"volunteer:{volunteer_id}"
+
+
+def _existing_routes(plan):
+    """שחזור המסלולים מההצעות השמורות (לפי pickup_index/dropoff_index)."""
+    index_by_key = {vehicle["key"]: index for index, vehicle in enumerate(plan.vehicles)}
+    stops = {}
+    for proposal in DispatchProposal.objects.all():
+        index = index_by_key.get(_vehicle_key(proposal.offer_id, proposal.volunteer_id))
+        if index is None:
+            continue
+        stops.setdefault(index, []).append((proposal.pickup_index, proposal.request_id, "pickup"))
+        stops.setdefault(index, []).append((proposal.dropoff_index, proposal.request_id, "dropoff"))
+    for index, items in stops.items():
+        plan.restore(index, [(req_id, kind) for _, req_id, kind in sorted(items)])
+
+
+def _lock_vehicles(vehicles):
+    """
+    נעילת שורות הרכבים (RideOffer / VolunteerLocation, לפי pk) עד סוף הטרנזקציה: עדכונים מקבילים
+    על אותם רכבים ממתינים זה לזה, והבא בתור קורא את ההצעות אחרי ה-commit של הקודם.
+    """
+    offer_ids = sorted(v["offer_id"] for v in vehicles if v["offer_id"])
+    volunteer_ids = sorted(v["volunteer_id"] for v in vehicles if not v["offer_id"])
+    list(RideOffer.objects.select_for_update().filter(id__in=offer_ids).order_by("id").values_list("id", flat=True))
+    list(
+        VolunteerLocation.objects.select_for_update()
+        .filter(assignment__volunteer_id__in=volunteer_ids)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+
+def dispatch_request_changed(request_id, now=None):
+    """
+    עדכון אינקרמנטלי אחרי יצירה/ביטול/תפיסה של בקשה:
+    בקשה שכבר לא פתוחה – ההצעה שלה נמחקת ושאר העצירות באותו רכב מסודרות מחדש;
+    בקשה פתוחה חדשה – מוכנסת למסלולים הקיימים.
+    קריאת ההצעות, התכנון והכתיבה בטרנזקציה אחת תחת נעילת הרכבים (_lock_vehicles).
+    """
+    now = now or timezone.now()
+    horizon_end = now + timedelta(hours=int(_setting("DISPATCH_HORIZON_HOURS", 24)))
+    with transaction.atomic():
+        vehicles = collect_vehicles(now, horizon_end)
+        _lock_vehicles(vehicles)
+        result, volunteer_ids = _apply_request_change(request_id, vehicles, now, horizon_end)
+    publish_proposals(volunteer_ids)
+    return result
+
+
+def _apply_request_change(request_id, vehicles, now, horizon_end):
+    """גוף dispatch_request_changed (בתוך הטרנזקציה). מחזיר (תוצאה, מתנדבים לעדכון)."""
+    removed = list(DispatchProposal.objects.filter(request_id=request_id).values_list("volunteer_id", "offer_id"))
+    DispatchProposal.objects.filter(request_id=request_id).delete()
+    removed_volunteers = {volunteer_id for volunteer_id, _ in removed}
+
+    # רק הבקשה החדשה והבקשות שכבר משובצות – המטריצה קטנה גם כשיש מאות בקשות פתוחות
+    wanted = set(DispatchProposal.objects.values_list("request_id", flat=True)) | {request_id}
+    requests = [r for r in collect_requests(now, horizon_end) if r.id in wanted]
+    is_open = request_id in {r.id for r in requests}
+    if not is_open and not removed:
+        return {"action": "removed", "request_id": request_id}, set()
+
+    plan = Plan(vehicles, requests)
+    _existing_routes(plan)
+    if removed:
+        _resequence(plan, {_vehicle_key(offer_id, volunteer_id) for volunteer_id, offer_id in removed})
+    if not is_open:
+        return {"action": "removed", "request_id": request_id}, removed_volunteers
+
+    if regret_assign(plan, [request_id]):
+        return {"action": "unassigned", "request_id": request_id}, removed_volunteers
+
+    run_id = uuid.uuid4().hex
+    index = next(i for i, assigned in enumerate(plan.assigned) if request_id in assigned)
+    vehicle_proposals = plan.proposals(run_id, indices={index})
+    # אינדקסים של שאר הבקשות ברכב זזו – מחליפים את כל ההצעות של הרכב
+    DispatchProposal.objects.filter(request_id__in=[p.request_id for p in vehicle_proposals]).delete()
+    DispatchProposal.objects.bulk_create(vehicle_proposals)
+    volunteer_id = plan.vehicles[index]["volunteer_id"]
+    return {"action": "assigned", "request_id": request_id, "volunteer_id": volunteer_id}, removed_volunteers | {volunteer_id}
+
+
+def _resequence(plan, keys):
+    """
+    אחרי הסרת בקשה מרכב: pickup_index / dropoff_index ועלות העקיפה של שאר הבקשות ברכב
+    מחושבים מחדש מהמסלול המשוחזר (בלי העצירות שהוסרו) ונשמרים ב-bulk_update.
+    """
+    index_by_key = {vehicle["key"]: index for index, vehicle in enumerate(plan.vehicles)}
+    indices = {index_by_key[key] for key in keys if key in index_by_key}
+    if not indices:
+        return
+    fresh = {proposal.request_id: proposal for proposal in plan.proposals(run_id="", indices=indices)}
+    stored = list(DispatchProposal.objects.filter(request_id__in=fresh))
+    for proposal in stored:
+        update = fresh[proposal.request_id]
+        proposal.pickup_index = update.pickup_index
+        proposal.dropoff_index = update.dropoff_index
+        proposal.detour_m = update.detour_m
+    DispatchProposal.objects.bulk_update(stored, ["pickup_index", "dropoff_index", "detour_m"])
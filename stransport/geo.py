@@ -0,0 +1,124 @@
+"""
+חישובי מרחק גיאוגרפיים (haversine) – סקלרי ווקטורי (NumPy).
+
+- haversine_meters – זוג נקודות בודד.
+- haversine_one_to_many – נקודה אחת מול מערך נקודות.
+- haversine_many_to_many – מטריצת מרחקים מלאה (n x m) בקריאה אחת, בלי לולאות Python.
+- haversine_matrix – אותה מטריצה כרשימת רשימות, לאלגוריתמים שניגשים לתא-תא (route_optimizer):
+  גישה ל-list מהירה מגישה לתא בודד של ndarray.
+
+קואורדינטה חסרה (None) הופכת ל-NaN, והמרחק שלה NaN (כל השוואה איתו False).
+
+geohash – תא רשת לכל נקודה (נשמר על TransportRequest / RideOffer באינדקס), ו-geohash_cells_within
+מחזיר את כל התאים שמכסים עיגול ברדיוס נתון, לשליפת מועמדים בשאילתת `cell__in` במקום סריקה.
+"""
+import math
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+# דיוק התאים שנשמרים במודלים: 6 תווים ≈ 1.2 ק"מ x 0.6 ק"מ (שינוי מחייב חישוב מחדש של השדות)
+GEOHASH_PRECISION = 6
+METERS_PER_DEGREE_LAT = 111320.0
+
+
+def haversine_meters(lat1, lng1, lat2, lng2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS_M * c
+
+
+def as_points(points):
+    """רשימת (lat, lng) / ndarray -> מערך float בגודל (n, 2), None -> NaN."""
+    if isinstance(points, np.ndarray):
+        return points.astype(float, copy=False).reshape(-1, 2)
+    return np.array(
+        [(np.nan if lat is None else lat, np.nan if lng is None else lng) for lat, lng in points],
+        dtype=float,
+    ).reshape(-1, 2)
+
+
+def _haversine(lat1, lng1, lat2, lng2):
+    """נוסחת haversine על מערכים ברדיאנים (עם broadcasting)."""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_one_to_many(lat, lng, points):
+    """מרחקים (מטרים) מנקודה אחת לכל הנקודות – ndarray בגודל n."""
+    pts = np.radians(as_points(points))
+    return _haversine(math.radians(lat), math.radians(lng), pts[:, 0], pts[:, 1])
+
+
+def haversine_many_to_many(sources, destinations=None):
+    """מטריצת מרחקים (מטרים) – ndarray בגודל (len(sources), len(destinations))."""
+    src = np.radians(as_points(sources))
+    dst = src if destinations is None else np.radians(as_points(destinations))
+    return _haversine(src[:, 0, None], src[:, 1, None], dst[None, :, 0], dst[None, :, 1])
+
+
+def haversine_matrix(coords):
+    """מטריצה ריבועית כרשימת רשימות (float) – לשימוש בלולאות של route_optimizer."""
+    if not len(coords):
+        return []
+    return haversine_many_to_many(coords).tolist()
+
+
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    """geohash של נקודה; "" כשחסרה קואורדינטה."""
+    if lat is None or lng is None:
+        return ""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision=GEOHASH_PRECISION):
+    """(גובה, רוחב) של תא במעלות."""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def geohash_cells_within(lat, lng, radius_m, precision=GEOHASH_PRECISION):
+    """כל התאים שנחתכים עם הריבוע החוסם של עיגול ברדיוס radius_m סביב הנקודה (set ריק אם חסרה קואורדינטה)."""
+    if lat is None or lng is None:
+        return set()
+    cell_lat, cell_lng = geohash_cell_size(precision)
+    d_lat = radius_m / METERS_PER_DEGREE_LAT
+    d_lng = radius_m / (METERS_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-6))
+
+    def samples(center, half, step):
+        # דגימה בצעדים של גודל תא + הקצה – כל תא שנחתך עם הקטע מכיל דגימה
+        count = int(2 * half // step) + 1
+        return [center - half + k * step for k in range(count)] + [center + half]
+
+    return {
+        geohash_encode(max(-90.0, min(90.0, a)), ((b + 180.0) % 360.0) - 180.0, precision)
+        for a in samples(lat, d_lat, cell_lat)
+        for b in samples(lng, d_lng, cell_lng)
+    }
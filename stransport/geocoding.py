@@ -0,0 +1,219 @@
+"""
+גיאוקודינג כתובות (Google Geocoding API) עם מטמון דו-שכבתי:
+1. LRU בזיכרון התהליך – תשובה במיקרו-שניות לכתובות חוזרות (בתי חולים, מרפאות).
+2. טבלת GeocodeCacheEntry ב-DB – שורד הפעלה מחדש ומשותף בין workers.
+
+תוצאות שליליות (ZERO_RESULTS) נשמרות ל-TTL קצר יותר; כשלים זמניים (timeout, שגיאת רשת) לא נשמרים.
+"""
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import http_client
+from .models import GeocodeCacheEntry
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+_MISSING = object()
+_lock = threading.Lock()
+_memory = OrderedDict()  # key -> (coords or None, expires_at)
+_stats = {"memory_hits": 0, "db_hits": 0, "negative_hits": 0, "misses": 0, "errors": 0}
+
+
+def normalize_address(address):
+    return re.sub(r"\s+", " ", (address or "").strip().casefold())
+
+
+def cache_key(address=None, place_id=None):
+    raw = f"place:{place_id.strip()}" if place_id else f"addr:{normalize_address(address)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def geocode_cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["memory_size"] = len(_memory)
+    lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+    stats["hit_ratio"] = round((stats["memory_hits"] + stats["db_hits"]) / lookups, 3) if lookups else 0.0
+    return stats
+
+
+def clear_memory_cache():
+    with _lock:
+        _memory.clear()
+        for name in _stats:
+            _stats[name] = 0
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def _memory_get(key, now):
+    with _lock:
+        item = _memory.get(key)
+        if item is None:
+            return _MISSING
+        coords, expires_at = item
+        if expires_at <= now:
+            del _memory[key]
+            return _MISSING
+        _memory.move_to_end(key)
+        return coords
+
+
+def _memory_put(key, coords, expires_at):
+    max_size = int(getattr(settings, "GEOCODE_MEMORY_CACHE_SIZE", 2048))
+    with _lock:
+        _memory[key] = (coords, expires_at)
+        _memory.move_to_end(key)
+        while len(_memory) > max_size:
+            _memory.popitem(last=False)
+
+
+def _ttl(coords):
+    if coords is None:
+        return timedelta(seconds=int(getattr(settings, "GEOCODE_NEGATIVE_TTL_SECONDS", 3600)))
+    return timedelta(seconds=int(getattr(settings, "GEOCODE_CACHE_TTL_SECONDS", 30 * 24 * 3600)))
+
+
+def _fetch(address=None, place_id=None, api_key=""):
+    """
+    קריאה ל-Google. מחזיר (coords או None, cacheable) – cacheable=False לכשל זמני.
+    """
+    params = {"key": api_key, "region": "IL"}
+    if place_id:
+        params["place_id"] = place_id
+    else:
+        params["address"] = address
+    try:
+        resp = http_client.get("google_geocoding", GEOCODE_URL, params=params)
+        resp.raise_for_status()
+        data = resp.json()
+    except Exception:
+        logger.warning("Geocoding failed", exc_info=True)
+        _count("errors")
+        return None, False
+
+    status = data.get("status")
+    if status == "ZERO_RESULTS":
+        return None, True
+    if status != "OK":
+        # OVER_QUERY_LIMIT / REQUEST_DENIED וכו' – לא לשמור במטמון
+        _count("errors")
+        return None, False
+    result = (data.get("results") or [None])[0]
+    location = (result or {}).get("geometry", {}).get("location")
+    if not location:
+        return None, True
+    return (location.get("lat"), location.get("lng")), True
+
+
+def _cached(key, now):
+    """חיפוש בשתי שכבות המטמון. מחזיר coords / None (שלילי) / _MISSING."""
+    coords = _memory_get(key, now)
+    if coords is not _MISSING:
+        _count("memory_hits")
+        if coords is None:
+            _count("negative_hits")
+        return coords
+
+    try:
+        entry = GeocodeCacheEntry.objects.filter(key=key, expires_at__gt=now).first()
+    except Exception:
+        logger.warning("Geocode cache read failed", exc_info=True)
+        entry = None
+    if entry is None:
+        _count("misses")
+        return _MISSING
+    coords = None if entry.is_negative else (entry.lat, entry.lng)
+    _memory_put(key, coords, entry.expires_at)
+    _count("db_hits")
+    if coords is None:
+        _count("negative_hits")
+    return coords
+
+
+def _store(key, query, coords, now):
+    expires_at = now + _ttl(coords)
+    _memory_put(key, coords, expires_at)
+    try:
+        GeocodeCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={
+                "query": query[:300],
+                "lat": coords[0] if coords else None,
+                "lng": coords[1] if coords else None,
+                "expires_at": expires_at,
+            },
+        )
+    except Exception:
+        logger.warning("Geocode cache write failed", exc_info=True)
+
+
+def geocode_address(address=None, place_id=None):
+    api_key = getattr(settings, "GOOGLE_PLACES_API_KEY", "")
+    if not api_key or (not address and not place_id):
+        return None
+
+    key = cache_key(address, place_id)
+    now = timezone.now()
+    coords = _cached(key, now)
+    if coords is not _MISSING:
+        return coords
+
+    coords, cacheable = _fetch(address, place_id, api_key)
+    if cacheable:
+        _store(key, place_id or normalize_address(address), coords, now)
+    return coords
+
+
+def geocode_many(addresses):
+    """
+    גיאוקודינג לכמה כתובות בבת אחת: מטמון קודם, ואז הכתובות החסרות במקביל
+    (ThreadPoolExecutor חסום ב-GEOCODE_MAX_WORKERS, Session משותף של http_client).
+    הזמן הכולל חסום ע"י הקריאה האיטית ביותר ולא ע"י סכום הקריאות.
+    גישה ל-DB (קריאה/כתיבה למטמון) נעשית רק ב-thread הקורא.
+    מחזיר dict: address -> coords או None.
+    """
+    api_key = getattr(settings, "GOOGLE_PLACES_API_KEY", "")
+    results = {}
+    if not api_key:
+        return {address: None for address in addresses}
+
+    now = timezone.now()
+    pending = {}
+    for address in addresses:
+        if not address or address in results:
+            results.setdefault(address, None)
+            continue
+        key = cache_key(address)
+        if key in pending:
+            pending[key][1].append(address)
+            continue
+        coords = _cached(key, now)
+        if coords is _MISSING:
+            pending[key] = (address, [address])
+        else:
+            results[address] = coords
+
+    if pending:
+        workers = max(1, min(int(getattr(settings, "GEOCODE_MAX_WORKERS", 6)), len(pending)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            fetched = list(pool.map(lambda item: _fetch(item[0], None, api_key), pending.values()))
+        for (key, (address, aliases)), (coords, cacheable) in zip(pending.items(), fetched):
+            if cacheable:
+                _store(key, normalize_address(address), coords, now)
+            for alias in aliases:
+                results[alias] = coords
+    return results
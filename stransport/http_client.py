@@ -0,0 +1,169 @@
+"""
+לקוח HTTP משותף לכל האינטגרציות החיצוניות (OSRM, Google Geocoding, OpenAI, Groq).
+
+- Session אחד לכל ספק: connection pool עם keep-alive, בלי handshake של TCP+TLS לכל קריאה.
+- timeout ברירת מחדל לכל ספק, ו-retry עם backoff (ל-GET בלבד כברירת מחדל – POST ל-LLM לא חוזר).
+- Circuit breaker: אחרי N כשלים רצופים הספק "פתוח" ל-cooldown וקריאות נכשלות מיד (CircuitOpenError).
+- מדדי latency/שגיאות לכל ספק – provider_stats().
+
+הגדרות ב-settings.OUTBOUND_HTTP (דורסות את PROVIDER_DEFAULTS לפי שם ספק),
+OUTBOUND_FAILURE_THRESHOLD / OUTBOUND_COOLDOWN_SECONDS לכל הספקים.
+"""
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_DEFAULTS = {
+    "osrm": {"timeout": 6, "retries": 1, "pool_size": 10},
+    "google_geocoding": {"timeout": 6, "retries": 1, "pool_size": 10},
+    "openai": {"timeout": 15, "retries": 0, "pool_size": 4},
+    "groq": {"timeout": 40, "retries": 0, "pool_size": 4},
+}
+DEFAULT_CONFIG = {
+    "timeout": 10,
+    "retries": 0,
+    "backoff": 0.3,
+    "pool_size": 10,
+    "retry_methods": ("GET",),
+    "failure_threshold": 5,
+    "cooldown_seconds": 30,
+}
+
+
+class CircuitOpenError(requests.RequestException):
+    """הספק מסומן כלא זמין (circuit פתוח) – נכשלים מיד בלי לפנות לרשת."""
+
+
+_lock = threading.Lock()
+_sessions = {}
+_circuits = {}  # provider -> {"failures": int, "opened_at": float | None}
+_stats = {}
+
+
+def provider_config(provider):
+    config = dict(DEFAULT_CONFIG)
+    config["failure_threshold"] = int(getattr(settings, "OUTBOUND_FAILURE_THRESHOLD", config["failure_threshold"]))
+    config["cooldown_seconds"] = int(getattr(settings, "OUTBOUND_COOLDOWN_SECONDS", config["cooldown_seconds"]))
+    config.update(PROVIDER_DEFAULTS.get(provider, {}))
+    config.update((getattr(settings, "OUTBOUND_HTTP", {}) or {}).get(provider, {}))
+    return config
+
+
+def get_session(provider):
+    session = _sessions.get(provider)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(provider)
+        if session is None:
+            config = provider_config(provider)
+            retry = Retry(
+                total=config["retries"],
+                connect=config["retries"],
+                read=config["retries"],
+                status=config["retries"],
+                backoff_factor=config["backoff"],
+                status_forcelist=(429, 502, 503, 504),
+                allowed_methods=frozenset(config["retry_methods"]),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config["pool_size"], max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[provider] = session
+    return session
+
+
+def _stat(provider):
+    return _stats.setdefault(
+        provider,
+        {"requests": 0, "errors": 0, "short_circuited": 0, "total_ms": 0.0, "max_ms": 0.0},
+    )
+
+
+def _check_circuit(provider, config):
+    with _lock:
+        circuit = _circuits.setdefault(provider, {"failures": 0, "opened_at": None})
+        opened_at = circuit["opened_at"]
+        if opened_at is None:
+            return
+        if time.monotonic() - opened_at >= config["cooldown_seconds"]:
+            # half-open: הקריאה הבאה היא ניסיון; כשל יחיד יפתח שוב
+            circuit["opened_at"] = None
+            circuit["failures"] = config["failure_threshold"] - 1
+            return
+        _stat(provider)["short_circuited"] += 1
+    raise CircuitOpenError(f"{provider} circuit is open")
+
+
+def _record(provider, config, elapsed_ms, failed):
+    with _lock:
+        stat = _stat(provider)
+        stat["requests"] += 1
+        stat["total_ms"] += elapsed_ms
+        stat["max_ms"] = max(stat["max_ms"], elapsed_ms)
+        circuit = _circuits.setdefault(provider, {"failures": 0, "opened_at": None})
+        if not failed:
+            circuit["failures"] = 0
+            return
+        stat["errors"] += 1
+        circuit["failures"] += 1
+        if circuit["failures"] >= config["failure_threshold"] and circuit["opened_at"] is None:
+            circuit["opened_at"] = time.monotonic()
+            logger.warning("Outbound circuit opened for %s after %s failures", provider, circuit["failures"])
+
+
+def request(provider, method, url, **kwargs):
+    config = provider_config(provider)
+    _check_circuit(provider, config)
+    kwargs.setdefault("timeout", config["timeout"])
+    started = time.monotonic()
+    try:
+        response = get_session(provider).request(method, url, **kwargs)
+    except requests.RequestException:
+        _record(provider, config, (time.monotonic() - started) * 1000, failed=True)
+        raise
+    # 5xx/429 = הספק בבעיה; 4xx אחר = בעיה בבקשה שלנו, לא סיבה לפתוח circuit
+    failed = response.status_code >= 500 or response.status_code == 429
+    _record(provider, config, (time.monotonic() - started) * 1000, failed=failed)
+    return response
+
+
+def get(provider, url, **kwargs):
+    return request(provider, "GET", url, **kwargs)
+
+
+def post(provider, url, **kwargs):
+    return request(provider, "POST", url, **kwargs)
+
+
+def provider_stats():
+    with _lock:
+        out = {}
+        for provider, stat in _stats.items():
+            circuit = _circuits.get(provider, {})
+            out[provider] = {
+                **stat,
+                "avg_ms": round(stat["total_ms"] / stat["requests"], 1) if stat["requests"] else 0.0,
+                "error_rate": round(stat["errors"] / stat["requests"], 3) if stat["requests"] else 0.0,
+                "circuit_open": circuit.get("opened_at") is not None,
+            }
+        return out
+
+
+def reset():
+    """ניקוי מצב (לבדיקות)."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _circuits.clear()
+        _stats.clear()
@@ -0,0 +1,47 @@
+"""
+Micro-benchmark: haversine סקלרי (לולאות Python) מול geo.haversine_many_to_many (NumPy)
+במטריצות n x n, מ-10x10 ועד 2000x2000. נקודות אקראיות בתחום ישראל (seed קבוע).
+"""
+import random
+
+from django.core.management.base import BaseCommand
+
+from stransport.geo import haversine_many_to_many, haversine_meters
+from stransport.route_bench import best_of
+
+
+class Command(BaseCommand):
+    help = "Benchmark: haversine סקלרי מול וקטורי (NumPy) במטריצות 10x10..2000x2000"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10,100,500,1000,2000")
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        sizes = [int(x) for x in options["sizes"].split(",") if x.strip()]
+        rng = random.Random(options["seed"])
+        repeat = max(1, options["repeat"])
+
+        self.stdout.write(f"{'size':>11} {'scalar_ms':>12} {'numpy_ms':>10} {'speedup':>9} {'max_err_m':>10}")
+        for size in sizes:
+            points = [(rng.uniform(29.5, 33.3), rng.uniform(34.2, 35.9)) for _ in range(size)]
+
+            def scalar():
+                return [[haversine_meters(a[0], a[1], b[0], b[1]) for b in points] for a in points]
+
+            def vectorized():
+                return haversine_many_to_many(points)
+
+            # הגרסה הסקלרית איטית – ב-1000 ומעלה מריצים פעם אחת
+            scalar_s, reference = best_of(1 if size >= 1000 else repeat, scalar)
+            numpy_s, result = best_of(repeat, vectorized)
+            max_err = max(
+                abs(result[i, j] - reference[i][j])
+                for i in range(0, size, max(1, size // 50))
+                for j in range(0, size, max(1, size // 50))
+            )
+            self.stdout.write(
+                f"{f'{size}x{size}':>11} {scalar_s * 1000:>12.1f} {numpy_s * 1000:>10.2f} "
+                f"{scalar_s / numpy_s if numpy_s else float('inf'):>8.1f}x {max_err:>10.2e}"
+            )
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark: ניקוד התאמה סקלרי (score_request_against_offer לכל זוג) מול matching.score_matrix
+(NumPy) במטריצות בקשות x הצעות, מ-10x10 ועד 500x500. נתונים אקראיים סביב כמה ערים (seed קבוע).
+"""
+import random
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from stransport.matching import offer_distance_matrices, score_matrix, score_request_against_offer
+from stransport.route_bench import best_of
+
+PLACES = ["תל אביב", "ירושלים", "חיפה", "בית חולים שיבא", "איכילוב", "רמב\"ם", "באר שבע", "נתניה"]
+CENTERS = [(32.0853, 34.7818), (31.7683, 35.2137), (32.7940, 34.9896), (32.0460, 34.8420)]
+
+
+def _point(rng):
+    lat, lng = rng.choice(CENTERS)
+    return lat + rng.uniform(-0.05, 0.05), lng + rng.uniform(-0.05, 0.05)
+
+
+def _instance(rng, size):
+    now = timezone.now()
+    reqs, offers, whens = [], [], []
+    for _ in range(size):
+        (p_lat, p_lng), (d_lat, d_lng) = _point(rng), _point(rng)
+        reqs.append(SimpleNamespace(
+            pickup_address=f"{rng.choice(PLACES)} {rng.randint(1, 80)}", destination=rng.choice(PLACES),
+            requested_time=now + timedelta(minutes=rng.randint(0, 48 * 60)),
+            pickup_lat=p_lat, pickup_lng=p_lng, dest_lat=d_lat, dest_lng=d_lng,
+        ))
+        (f_lat, f_lng), (t_lat, t_lng) = _point(rng), _point(rng)
+        offers.append(SimpleNamespace(
+            parsed_from=rng.choice(PLACES), parsed_to=rng.choice(PLACES),
+            from_lat=f_lat, from_lng=f_lng, to_lat=t_lat, to_lng=t_lng,
+        ))
+        whens.append(now + timedelta(minutes=rng.randint(0, 48 * 60)))
+    return reqs, offers, whens
+
+
+class Command(BaseCommand):
+    help = "Benchmark: ניקוד התאמה סקלרי מול מטריצת ציונים (NumPy) בגדלים 10x10..500x500"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10,100,500")
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        sizes = [int(x) for x in options["sizes"].split(",") if x.strip()]
+        rng = random.Random(options["seed"])
+        repeat = max(1, options["repeat"])
+
+        self.stdout.write(f"{'size':>11} {'scalar_ms':>12} {'numpy_ms':>10} {'speedup':>9} {'mismatches':>11}")
+        for size in sizes:
+            reqs, offers, whens = _instance(rng, size)
+
+            def scalar():
+                # כמו בנתיב הישן: מטריצות המרחקים וקטוריות, הניקוד זוג-זוג
+                pickup, dest = offer_distance_matrices(reqs, offers)
+                return [
+                    [score_request_against_offer(r, o, whens[j], pickup[i, j], dest[i, j]) for j, o in enumerate(offers)]
+                    for i, r in enumerate(reqs)
+                ]
+
+            scalar_s, reference = best_of(1 if size >= 500 else repeat, scalar)
+            numpy_s, result = best_of(repeat, lambda: score_matrix(reqs, offers, whens))
+            mismatches = sum(
+                result[i, j] != reference[i][j] for i in range(size) for j in range(size)
+            )
+            self.stdout.write(
+                f"{f'{size}x{size}':>11} {scalar_s * 1000:>12.1f} {numpy_s * 1000:>10.2f} "
+                f"{scalar_s / numpy_s if numpy_s else float('inf'):>8.1f}x {mismatches:>11}"
+            )
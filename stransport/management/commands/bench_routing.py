@@ -0,0 +1,119 @@
+"""
+Benchmark של פותרי המסלולים (route_bench): אורך מסלול, פער מאופטימום וזמן ריצה לכל פותר,
+על מופעים סינתטיים בישראל (סביב בתי חולים / בין ערים), 5-200 עצירות.
+
+פלט json / csv לשמירה והשוואה בין גרסאות, או טבלה לקריאה:
+    python manage.py bench_routing --format json --output bench/routing.json
+    python manage.py bench_routing --matrix osrm --fixture bench/osrm_matrices.json
+    python manage.py bench_routing --record-osrm bench/osrm_matrices.json --sizes 5,10,20,40
+"""
+import csv
+import json
+import platform
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from stransport import route_bench
+
+FIELDS = (
+    "instance", "scenario", "variant", "size", "matrix", "solver",
+    "length_m", "wall_ms", "feasible", "reference", "gap_pct",
+)
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+class Command(BaseCommand):
+    help = "Benchmark: איכות ומהירות של פותרי המסלולים על מופעים סינתטיים (haversine / OSRM מוקלט / גרף מקומי)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="5,10,20,50,100,200")
+        parser.add_argument("--scenarios", default=",".join(route_bench.SCENARIOS))
+        parser.add_argument("--variants", default=",".join(route_bench.VARIANTS))
+        parser.add_argument("--matrix", choices=("haversine", "osrm", "local"), default="haversine")
+        parser.add_argument("--fixture", help="קובץ JSON של מטריצות OSRM מוקלטות (--matrix osrm)")
+        parser.add_argument("--road-graph", help="גרף כבישים מקומי (--matrix local); ברירת מחדל ROAD_GRAPH_PATH")
+        parser.add_argument("--record-osrm", help="הקלטת מטריצות OSRM לקובץ (במקום הרצה)")
+        parser.add_argument("--seed", type=int, default=7)
+        parser.add_argument("--repeat", type=int, default=1)
+        parser.add_argument("--capacity", type=int, default=4)
+        parser.add_argument("--time-budget-ms", type=int, default=None)
+        parser.add_argument("--format", choices=("table", "json", "csv"), default="table")
+        parser.add_argument("--output", help="כתיבת הפלט לקובץ במקום stdout")
+
+    def handle(self, *args, **options):
+        sizes = [int(x) for x in options["sizes"].split(",") if x.strip()]
+        scenarios = [x.strip() for x in options["scenarios"].split(",") if x.strip()]
+        variants = [x.strip() for x in options["variants"].split(",") if x.strip()]
+        unknown = (set(scenarios) - set(route_bench.SCENARIOS)) | (set(variants) - set(route_bench.VARIANTS))
+        if unknown:
+            raise CommandError(f"unknown scenario/variant: {', '.join(sorted(unknown))}")
+
+        if options["record_osrm"]:
+            instances = [route_bench.make_instance(s, n, options["seed"]) for s in scenarios for n in sizes]
+            count = route_bench.record_osrm_fixture(instances, settings.OSRM_BASE_URL, options["record_osrm"], variants)
+            self.stdout.write(f"recorded {count} matrices to {options['record_osrm']}")
+            return
+
+        fixture = None
+        if options["matrix"] == "osrm":
+            if not options["fixture"]:
+                raise CommandError("--matrix osrm requires --fixture")
+            fixture = route_bench.load_osrm_fixture(options["fixture"])
+
+        rows = route_bench.run_benchmark(
+            sizes,
+            scenarios=scenarios,
+            variants=variants,
+            matrix=options["matrix"],
+            fixture=fixture,
+            road_graph_path=options["road_graph"],
+            seed=options["seed"],
+            repeat=max(1, options["repeat"]),
+            capacity=options["capacity"],
+            time_budget_ms=options["time_budget_ms"],
+        )
+
+        out = open(options["output"], "w", encoding="utf-8", newline="") if options["output"] else self.stdout
+        try:
+            if options["format"] == "json":
+                meta = {
+                    "created_at": timezone.now().isoformat(),
+                    "git_revision": _git_revision(),
+                    "python": sys.version.split()[0],
+                    "platform": platform.platform(),
+                    "seed": options["seed"],
+                    "capacity": options["capacity"],
+                    "time_budget_ms": options["time_budget_ms"],
+                }
+                out.write(json.dumps({"meta": meta, "results": rows}, indent=2) + "\n")
+            elif options["format"] == "csv":
+                writer = csv.DictWriter(out, fieldnames=FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                out.write(
+                    f"{'instance':<22} {'variant':<20} {'solver':<17} {'length_m':>11} "
+                    f"{'gap_pct':>8} {'ref':<10} {'wall_ms':>10}\n"
+                )
+                for row in rows:
+                    gap = "-" if row["gap_pct"] is None else f"{row['gap_pct']:.2f}"
+                    flag = "" if row["feasible"] else "  (infeasible)"
+                    out.write(
+                        f"{row['instance']:<22} {row['variant']:<20} {row['solver']:<17} {row['length_m']:>11.1f} "
+                        f"{gap:>8} {row['reference']:<10} {row['wall_ms']:>10.2f}{flag}\n"
+                    )
+        finally:
+            if options["output"]:
+                out.close()
@@ -0,0 +1,82 @@
+"""
+השוואת זמני serialize_request (מופעי מודל) מול serialize_request_values (values()).
+יוצר שורות סינתטיות בתוך טרנזקציה ומגלגל אותה לאחור בסוף – לא משאיר נתונים.
+"""
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from stransport.models import Profile, TransportAssignment, TransportRequest
+from stransport.views import serialize_request, serialize_request_values, serializer_queryset
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark: serialize_request מול serialize_request_values ב-1k/10k שורות"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000")
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        sizes = [int(x) for x in options["sizes"].split(",") if x.strip()]
+        try:
+            with transaction.atomic():
+                self._run(sizes, options["repeat"])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _run(self, sizes, repeat):
+        sick = User.objects.create(username="__bench_sick__")
+        volunteer = User.objects.create(username="__bench_volunteer__")
+        Profile.objects.create(user=sick, role="sick", phone="050-1234567")
+        Profile.objects.create(user=volunteer, role="volunteer", phone="052-7654321")
+        now = timezone.now()
+        created = 0
+        for size in sorted(sizes):
+            batch = [
+                TransportRequest(
+                    sick=sick,
+                    pickup_address=f"Pickup {i}",
+                    destination=f"Destination {i}",
+                    requested_time=now + timedelta(minutes=i),
+                    notes="bench",
+                    status="accepted" if i % 3 == 0 else "open",
+                )
+                for i in range(created, size)
+            ]
+            TransportRequest.objects.bulk_create(batch, batch_size=1000)
+            TransportAssignment.objects.bulk_create(
+                [
+                    TransportAssignment(request=r, volunteer=volunteer)
+                    for r in TransportRequest.objects.filter(sick=sick, status="accepted", transportassignment__isnull=True)
+                ],
+                batch_size=1000,
+            )
+            created = size
+            qs = TransportRequest.objects.filter(sick=sick).order_by("-created_at")
+
+            model_path = self._best(repeat, lambda: [serialize_request(r) for r in serializer_queryset(qs)])
+            values_path = self._best(repeat, lambda: serialize_request_values(qs))
+            self.stdout.write(
+                f"rows={size:>6}  models={model_path * 1000:8.1f}ms  values={values_path * 1000:8.1f}ms  "
+                f"speedup={model_path / values_path:4.1f}x"
+            )
+
+    @staticmethod
+    def _best(repeat, fn):
+        best = None
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
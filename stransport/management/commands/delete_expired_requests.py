@@ -1,10 +1,22 @@
 from django.core.management.base import BaseCommand
-from stransport.views import delete_expired_requests
+from stransport.tasks import purge_expired_requests
 
 
 class Command(BaseCommand):
     help = "מחיקת בקשות הסעה שמועד האיסוף שלהן עבר (לפחות 30 דקות)"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--max-batches", type=int, default=None)
+
     def handle(self, *args, **options):
-        delete_expired_requests()
-        self.stdout.write(self.style.SUCCESS("ניקוי בקשות ישנות הושלם."))
+        metrics = purge_expired_requests(
+            batch_size=options.get("batch_size"),
+            max_batches=options.get("max_batches"),
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"ניקוי בקשות ישנות הושלם: נמחקו {metrics['deleted']} ב־{metrics['batches']} מנות "
+                f"({metrics['duration_ms']}ms)."
+            )
+        )
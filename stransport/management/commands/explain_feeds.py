@@ -0,0 +1,56 @@
+"""
+מדפיס EXPLAIN לכל שאילתת feed (אותן שאילתות שה-API מריץ), כדי לזהות רגרסיות באינדקסים.
+עובד גם על SQLite וגם על Postgres (QuerySet.explain).
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from stransport.models import RideOffer, TransportRequest, expired_requests_q
+from stransport.views import (
+    accepted_feed_queryset,
+    closed_feed_queryset,
+    open_feed_queryset,
+)
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN לשאילתות ה-feeds (requests/accepted/closed/rides/offers/purge)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sick", help="שם משתמש של מטופל (ברירת מחדל: הראשון שנמצא)")
+        parser.add_argument("--volunteer", help="שם משתמש של מתנדב (ברירת מחדל: הראשון שנמצא)")
+        parser.add_argument("--analyze", action="store_true", help="EXPLAIN ANALYZE (Postgres בלבד)")
+
+    def handle(self, *args, **options):
+        sick = self._user(options.get("sick"), "sick")
+        volunteer = self._user(options.get("volunteer"), "volunteer")
+        now = timezone.now()
+
+        queries = [
+            ("requests_api (volunteer)", open_feed_queryset("volunteer", volunteer, now)),
+            ("requests_api (sick)", open_feed_queryset("sick", sick, now)),
+            ("requests_api (guest)", open_feed_queryset("volunteer", None, now)),
+            ("accepted_requests_api", accepted_feed_queryset(volunteer, now)),
+            ("closed_requests_api", closed_feed_queryset(sick, now)),
+            ("rides_api", TransportRequest.objects.order_by("-created_at")[:100]),
+            ("ai_offers_list_api", RideOffer.objects.filter(status="open").order_by("-created_at")[:50]),
+            ("purge_expired_requests", TransportRequest.objects.filter(expired_requests_q(now)).order_by("id")[:500]),
+        ]
+
+        explain_options = {}
+        if options.get("analyze") and connection.vendor == "postgresql":
+            explain_options["analyze"] = True
+
+        self.stdout.write(f"database: {connection.vendor}")
+        for label, qs in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n== {label} =="))
+            self.stdout.write(qs.explain(**explain_options))
+
+    @staticmethod
+    def _user(username, role):
+        if username:
+            return User.objects.get(username=username)
+        # מזהה לא קיים עדיין מייצר את אותה תוכנית שאילתה
+        return User.objects.filter(profile__role=role).first() or User(id=0)
@@ -0,0 +1,35 @@
+"""
+הכנת גרף כבישים למנוע הניתוב המקומי (road_graph): קריאת OSM XML, כיווץ (Contraction Hierarchies)
+ושמירה בפורמט מוכן, כך שהשרת טוען את הקובץ בלי לכווץ מחדש:
+    python manage.py prepare_road_graph israel-roads.osm.gz data/roads.json.gz
+ואז ROAD_GRAPH_PATH=data/roads.json.gz.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stransport.road_graph import RoadGraph, parse_osm
+
+
+class Command(BaseCommand):
+    help = "הכנת גרף כבישים (OSM XML -> פורמט מוכן עם CH) לניתוב מקומי"
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="קובץ ‎.osm / ‎.osm.gz")
+        parser.add_argument("output", help="קובץ יעד (‎.json / ‎.json.gz)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            nodes, edges = parse_osm(options["source"])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"failed to read {options['source']}: {e}")
+        if not nodes:
+            raise CommandError("no drivable roads found")
+        parsed = time.perf_counter()
+        graph = RoadGraph(nodes, edges)
+        graph.save(options["output"])
+        self.stdout.write(
+            f"{len(nodes)} nodes, {len(edges)} edges, {len(graph.ch_edges)} CH edges "
+            f"(parse {parsed - started:.1f}s, contract {time.perf_counter() - parsed:.1f}s) -> {options['output']}"
+        )
@@ -0,0 +1,21 @@
+"""
+בנייה מחדש של טבלת ההתאמות (RequestOfferMatch) מכל הבקשות וההצעות הפתוחות.
+הטבלה מתעדכנת ב-save של בקשה/הצעה; הפקודה נדרשת אחרי המיגרציה (נתונים קיימים),
+אחרי שינוי בניקוד, או אחרי עדכונים גורפים שלא עוברים ב-save (update / bulk_update).
+רצה בכל עלייה אחרי migrate (docker-entrypoint.sh, render.yaml):
+    python manage.py rebuild_matches
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from stransport.matching import rebuild_all_matches
+
+
+class Command(BaseCommand):
+    help = "בנייה מחדש של טבלת ההתאמות בין בקשות פתוחות להצעות פתוחות"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = rebuild_all_matches()
+        self.stdout.write(f"{total} matches ({time.perf_counter() - started:.1f}s)")
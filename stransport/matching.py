@@ -0,0 +1,408 @@
+"""
+ניקוד התאמה בין בקשות הסעה (TransportRequest) להצעות נסיעה (RideOffer), וטבלת ההתאמות המוחזקת
+(RequestOfferMatch) שמתעדכנת ב-worker אחרי כל יצירה/עדכון/ביטול של בקשה או הצעה.
+
+בכל שינוי מנוקדים מחדש רק הזוגות של הרשומה שהשתנתה מול קבוצת המועמדים שלה (תאי geohash
+סמוכים, חלון זמן, והרשומות האחרונות להתאמת טקסט) – כך שההצעות למטופל/למתנדב הן קריאת top-k
+מהאינדקס ולא סריקה וניקוד בכל בקשה. הניקוד עצמו רץ כמטריצה (score_matrix) – אותם ציונים
+כמו score_request_against_offer, בחישוב NumPy אחד לכל קבוצת זוגות.
+
+מעל הטבלה – שיבוץ גלובלי (recommended_pairing): התאמה במשקל מקסימלי עם מקומות פנויים לכל הצעה,
+כך ששני מטופלים לא "מכוונים" לאותו מקום יחיד.
+"""
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from .geo import geohash_cells_within, haversine_many_to_many, haversine_meters
+from .assignment import capacitated_matching
+from .models import RequestOfferMatch, RideOffer, TransportRejection, TransportRequest
+
+logger = logging.getLogger(__name__)
+
+# מרחק (מטרים) שעד אליו איסוף/יעד נחשבים "קרובים" בניקוד ההתאמה – וגם רדיוס שליפת המועמדים
+MATCH_DISTANCE_M = 2000
+# חלון זמן (שעות) בין מועד האיסוף למועד היציאה של ההצעה – בניקוד ובשליפת המועמדים
+MATCH_TIME_WINDOW_HOURS = 3
+# ציון מינימלי להצגה כהצעה
+MATCH_MIN_SCORE = 0.2
+# רכיב הזמן בניקוד (מועד האיסוף בחלון MATCH_TIME_WINDOW_HOURS ממועד היציאה)
+TIME_SCORE = 0.2
+# כמה רשומות אחרונות נכנסות תמיד למועמדים (גם בלי קואורדינטות – התאמת טקסט)
+RECENT_OFFERS = 30
+RECENT_REQUESTS = 20
+# גודל מנה (הצעות) בבנייה מחדש מלאה – מטריצת בקשות x מנה אחת בזיכרון
+REBUILD_CHUNK = 500
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def offer_distance_matrices(reqs, offers):
+    """
+    מרחקי איסוף<->מוצא ויעד<->יעד לכל זוג (בקשה, הצעה) – מטריצה וקטורית אחת לכל סוג
+    במקום קריאת haversine לכל זוג. קואורדינטה חסרה = NaN (לא עובר אף סף).
+    """
+    pickup = haversine_many_to_many(
+        [(r.pickup_lat, r.pickup_lng) for r in reqs], [(o.from_lat, o.from_lng) for o in offers]
+    )
+    dest = haversine_many_to_many(
+        [(r.dest_lat, r.dest_lng) for r in reqs], [(o.to_lat, o.to_lng) for o in offers]
+    )
+    return pickup, dest
+
+
+def score_request_against_offer(req, offer, offer_when, dist_pickup=None, dist_dest=None):
+    """
+    ציון התאמה פשוט כדי לזהות אם יש ללקוח כבר TransportRequest פתוחה תואמת,
+    כדי שלא ניצור בקשה כפולה.
+    dist_pickup / dist_dest – מרחקים שחושבו מראש (offer_distance_matrices); אחרת מחושבים כאן.
+    """
+    score = 0.0
+    pickup_req = (getattr(req, "pickup_address", "") or "").strip()
+    dest_req = (getattr(req, "destination", "") or "").strip()
+    pickup_offer = (getattr(offer, "parsed_from", "") or "").strip()
+    dest_offer = (getattr(offer, "parsed_to", "") or "").strip()
+
+    if pickup_req and pickup_offer:
+        a = pickup_req.lower()
+        b = pickup_offer.lower()
+        if b in a or a in b:
+            score += 0.45
+
+    if dest_req and dest_offer:
+        a = dest_req.lower()
+        b = dest_offer.lower()
+        if b in a or a in b:
+            score += 0.45
+
+    # ציון לפי מרחק קואורדינטות (אם קיימות)
+    try:
+        if dist_pickup is None and (
+            getattr(req, "pickup_lat", None) is not None
+            and getattr(req, "pickup_lng", None) is not None
+            and getattr(offer, "from_lat", None) is not None
+            and getattr(offer, "from_lng", None) is not None
+        ):
+            dist_pickup = haversine_meters(req.pickup_lat, req.pickup_lng, offer.from_lat, offer.from_lng)
+        if dist_pickup is not None and dist_pickup <= MATCH_DISTANCE_M:
+            score += 0.15
+    except Exception:
+        pass
+
+    try:
+        if dist_dest is None and (
+            getattr(req, "dest_lat", None) is not None
+            and getattr(req, "dest_lng", None) is not None
+            and getattr(offer, "to_lat", None) is not None
+            and getattr(offer, "to_lng", None) is not None
+        ):
+            dist_dest = haversine_meters(req.dest_lat, req.dest_lng, offer.to_lat, offer.to_lng)
+        if dist_dest is not None and dist_dest <= MATCH_DISTANCE_M:
+            score += 0.15
+    except Exception:
+        pass
+
+    # זמן (חלון ±3 שעות)
+    try:
+        if offer_when and getattr(req, "requested_time", None):
+            if timezone.is_naive(req.requested_time):
+                req_time = timezone.make_aware(req.requested_time, timezone.get_current_timezone())
+            else:
+                req_time = req.requested_time
+            delta_hours = abs((req_time - offer_when).total_seconds()) / 3600.0
+            if delta_hours <= MATCH_TIME_WINDOW_HOURS:
+                score += TIME_SCORE
+    except Exception:
+        pass
+
+    return min(1.0, score)
+
+
+
+def _normalised_addresses(values):
+    return [(v or "").strip().lower() for v in values]
+
+
+def _contains_matrix(left, right):
+    """
+    m[i, j] = שתי הכתובות לא ריקות ואחת מכילה את השנייה (כמו בניקוד הסקלרי).
+    הבדיקה רצה פעם אחת לכל זוג ערכים ייחודיים – כתובות חוזרות (בית חולים, עיר) הן הרוב.
+    """
+    if not left or not right:
+        return np.zeros((len(left), len(right)), dtype=bool)
+    left_ids, right_ids = {}, {}
+    li = [left_ids.setdefault(v, len(left_ids)) for v in left]
+    ri = [right_ids.setdefault(v, len(right_ids)) for v in right]
+    unique = np.array(
+        [[bool(a and b and (b in a or a in b)) for b in right_ids] for a in left_ids], dtype=bool
+    ).reshape(len(left_ids), len(right_ids))
+    return unique[np.ix_(li, ri)]
+
+
+def _epoch_microseconds(values, make_aware):
+    """
+    (מיקרו-שניות מ-epoch כ-int64, מסכת תקפות). naive: make_aware=True – באזור הזמן הנוכחי
+    (כמו requested_time בניקוד הסקלרי), אחרת לא תקף (חיסור aware - naive נכשל שם).
+    """
+    micros = np.zeros(len(values), dtype=np.int64)
+    valid = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        if not value:
+            continue
+        if timezone.is_naive(value):
+            if not make_aware:
+                continue
+            value = timezone.make_aware(value, timezone.get_current_timezone())
+        micros[i] = (value - _EPOCH) // _MICROSECOND
+        valid[i] = True
+    return micros, valid
+
+
+def score_matrix(reqs, offers, offer_whens, pickup_dist=None, dest_dist=None):
+    """
+    מטריצת ציונים (len(reqs), len(offers)) – אותם ציונים בדיוק כמו score_request_against_offer
+    לכל זוג, בחישוב אחד ב-NumPy: התאמת כתובות, מרחקים (offer_distance_matrices) וחלון הזמן.
+    offer_whens[j] – מועד היציאה של offers[j] (departure_at או default_offer_when()).
+    """
+    if pickup_dist is None or dest_dist is None:
+        pickup_dist, dest_dist = offer_distance_matrices(reqs, offers)
+    req_us, req_ok = _epoch_microseconds([getattr(r, "requested_time", None) for r in reqs], True)
+    offer_us, offer_ok = _epoch_microseconds(offer_whens, False)
+    hours = np.abs(req_us[:, None] - offer_us[None, :]) / 1e6 / 3600.0
+
+    # אותו סדר חיבור כמו בגרסה הסקלרית, כדי שגם ה-float יהיה זהה
+    score = np.zeros((len(reqs), len(offers)))
+    score += 0.45 * _contains_matrix(
+        _normalised_addresses(getattr(r, "pickup_address", "") for r in reqs),
+        _normalised_addresses(getattr(o, "parsed_from", "") for o in offers),
+    )
+    score += 0.45 * _contains_matrix(
+        _normalised_addresses(getattr(r, "destination", "") for r in reqs),
+        _normalised_addresses(getattr(o, "parsed_to", "") for o in offers),
+    )
+    with np.errstate(invalid="ignore"):
+        score += 0.15 * (np.asarray(pickup_dist) <= MATCH_DISTANCE_M)
+        score += 0.15 * (np.asarray(dest_dist) <= MATCH_DISTANCE_M)
+    score += TIME_SCORE * (req_ok[:, None] & offer_ok[None, :] & (hours <= MATCH_TIME_WINDOW_HOURS))
+    return np.minimum(score, 1.0)
+
+
+def nearby_cells_q(cell_field, lat, lng):
+    """Q לתאי ה-geohash שמכסים את רדיוס ההתאמה סביב הנקודה (Q ריק אם אין קואורדינטות)."""
+    cells = geohash_cells_within(lat, lng, MATCH_DISTANCE_M)
+    return models.Q(**{f"{cell_field}__in": sorted(cells)}) if cells else models.Q()
+
+
+def candidate_limit():
+    return int(getattr(settings, "MATCH_MAX_CANDIDATES", 500))
+
+
+def default_offer_when(now=None):
+    """מועד יציאה משוער להצעה בלי departure_at (כמו בניקוד המקורי: בעוד שעה ממועד החישוב)."""
+    return (now or timezone.now()) + timedelta(hours=1)
+
+
+def live_score(now=None):
+    """
+    ביטוי לציון בזמן קריאה מ-RequestOfferMatch: score השמור + רכיב הזמן להצעות בלי departure_at.
+    רכיב זה תלוי ב"עכשיו" (default_offer_when), ולכן לא נשמר בטבלה אלא מחושב בכל קריאה.
+    """
+    when = default_offer_when(now)
+    window = timedelta(hours=MATCH_TIME_WINDOW_HOURS)
+    time_term = models.Case(
+        models.When(
+            offer__departure_at__isnull=True,
+            request__requested_time__range=(when - window, when + window),
+            then=models.Value(TIME_SCORE),
+        ),
+        default=models.Value(0.0),
+        output_field=models.FloatField(),
+    )
+    return Least(models.F("score") + time_term, models.Value(1.0), output_field=models.FloatField())
+
+
+def _candidate_ids(qs, recent_order, nearby, recent_count, existing):
+    """
+    המועמדים לניקוד: הרשומות האחרונות, הרשומות הסמוכות (nearby) וגם הזוגות שכבר בטבלה –
+    כך שזוג שנוסף מהצד השני (למשל התאמת טקסט בלבד) מנוקד מחדש ולא נמחק סתם.
+    """
+    ids = set(qs.order_by(recent_order).values_list("id", flat=True)[:recent_count])
+    ids.update(qs.filter(id__in=existing).values_list("id", flat=True))
+    if nearby:
+        ids.update(qs.filter(nearby).order_by(recent_order).values_list("id", flat=True)[:candidate_limit()])
+    return ids
+
+
+def _store_matches(reqs, offers):
+    """
+    מנקד את כל הזוגות (score_matrix) ושומר את אלה שעשויים לעבור את הסף. מחזיר את מספר השורות.
+    להצעה בלי departure_at נשמר רק החלק שאינו תלוי בזמן (רכיב הזמן – live_score בקריאה),
+    ולכן כל זוג מועמד שלה נשמר: גם עם 0 הוא עשוי לעבור את הסף כשהבקשה נכנסת לחלון הזמן.
+    upsert ולא insert: ריענון מקביל של הצד השני (או של אותה שורה) עשוי להכניס את אותו זוג במקביל.
+    """
+    scores = score_matrix(reqs, offers, [o.departure_at for o in offers])
+    thresholds = np.array([MATCH_MIN_SCORE - (TIME_SCORE if o.departure_at is None else 0.0) for o in offers])
+    rows = [
+        RequestOfferMatch(request_id=reqs[i].pk, offer_id=offers[j].pk, score=round(float(scores[i, j]), 4))
+        for i, j in zip(*np.nonzero(scores >= thresholds[None, :]))
+    ]
+    RequestOfferMatch.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=["request", "offer"], update_fields=["score", "updated_at"]
+    )
+    return len(rows)
+
+
+def _is_matchable_request(req):
+    return req.pk is not None and req.status == "open" and not req.no_volunteers_available
+
+
+def refresh_request_matches(req):
+    """מנקד מחדש את הבקשה מול ההצעות הפתוחות המועמדות ומחליף את שורותיה בטבלה. מחזיר מספר שורות."""
+    with transaction.atomic():
+        existing = RequestOfferMatch.objects.filter(request_id=req.pk)
+        existing_ids = list(existing.values_list("offer_id", flat=True))
+        existing.delete()
+        if not _is_matchable_request(req):
+            return 0
+        window = timedelta(hours=MATCH_TIME_WINDOW_HOURS)
+        nearby = (
+            nearby_cells_q("from_cell", req.pickup_lat, req.pickup_lng)
+            | nearby_cells_q("to_cell", req.dest_lat, req.dest_lng)
+            | models.Q(departure_at__range=(req.requested_time - window, req.requested_time + window))
+        )
+        open_offers = RideOffer.objects.filter(status="open")
+        offers = list(
+            RideOffer.objects.filter(
+                id__in=_candidate_ids(open_offers, "-created_at", nearby, RECENT_OFFERS, existing_ids)
+            )
+        )
+        return _store_matches([req], offers)
+
+
+def refresh_offer_matches(offer):
+    """מנקד מחדש את ההצעה מול הבקשות הפתוחות המועמדות ומחליף את שורותיה בטבלה. מחזיר מספר שורות."""
+    with transaction.atomic():
+        existing = RequestOfferMatch.objects.filter(offer_id=offer.pk)
+        existing_ids = list(existing.values_list("request_id", flat=True))
+        existing.delete()
+        if offer.pk is None or offer.status != "open":
+            return 0
+        nearby = nearby_cells_q("pickup_cell", offer.from_lat, offer.from_lng) | nearby_cells_q(
+            "dest_cell", offer.to_lat, offer.to_lng
+        )
+        if offer.departure_at:
+            window = timedelta(hours=MATCH_TIME_WINDOW_HOURS)
+            nearby |= models.Q(requested_time__range=(offer.departure_at - window, offer.departure_at + window))
+        open_requests = TransportRequest.objects.filter(status="open", no_volunteers_available=False)
+        reqs = list(
+            TransportRequest.objects.filter(
+                id__in=_candidate_ids(open_requests, "-requested_time", nearby, RECENT_REQUESTS, existing_ids)
+            )
+        )
+        return _store_matches(reqs, [offer])
+
+
+def enqueue_match_refresh(kind, object_id):
+    """
+    ניקוד מחדש של בקשה ("request") / הצעה ("offer") ב-worker, אחרי ה-commit – כך שה-save
+    בנתיב ה-API לא מחכה לניקוד וה-worker רואה את השינוי. אם ה-broker לא זמין – מנקדים כאן.
+    """
+
+    def enqueue():
+        from .tasks import refresh_matches
+
+        try:
+            refresh_matches.delay(kind, object_id)
+        except Exception:
+            logger.warning("Failed to enqueue refresh_matches, running inline", exc_info=True)
+            refresh_matches(kind, object_id)
+
+    transaction.on_commit(enqueue)
+
+
+def refresh_matches_for(kind, object_id):
+    """טוען את הבקשה/ההצעה ומנקד אותה מחדש. רשומה שנמחקה – השורות שלה כבר נמחקו ב-cascade."""
+    model = TransportRequest if kind == "request" else RideOffer
+    instance = model.objects.filter(pk=object_id).first()
+    if instance is None:
+        return 0
+    if kind == "request":
+        return refresh_request_matches(instance)
+    return refresh_offer_matches(instance)
+
+
+def rebuild_all_matches():
+    """
+    בנייה מחדש מלאה של הטבלה (נתונים קיימים / אחרי שינוי בניקוד): כל הבקשות הפתוחות מול כל
+    ההצעות הפתוחות, במנות של REBUILD_CHUNK הצעות (score_matrix). מחזיר את מספר השורות.
+    """
+    reqs = list(TransportRequest.objects.filter(status="open", no_volunteers_available=False))
+    offers = list(RideOffer.objects.filter(status="open"))
+    total = 0
+    with transaction.atomic():
+        RequestOfferMatch.objects.all().delete()
+        if reqs:
+            for start in range(0, len(offers), REBUILD_CHUNK):
+                total += _store_matches(reqs, offers[start:start + REBUILD_CHUNK])
+    return total
+
+
+def assignment_stamp(now=None):
+    """
+    חותמת זולה לקלט השיבוץ: שורות הטבלה, המקומות בהצעות הפתוחות, הדחיות, וחלון של 10 דקות
+    (live_score תלוי בשעה הנוכחית).
+    """
+    bucket = int((now or timezone.now()).timestamp() // 600)
+    matches = RequestOfferMatch.objects.aggregate(total=models.Count("id"), last=models.Max("updated_at"))
+    seats = RideOffer.objects.filter(status="open").aggregate(total=models.Sum("seats"))
+    rejections = TransportRejection.objects.aggregate(total=models.Count("id"), last=models.Max("id"))
+    return (
+        f"{matches['total']}:{matches['last']}:{seats['total']}:{rejections['total']}:{rejections['last']}:{bucket}"
+    )
+
+
+def compute_pairing():
+    """
+    שיבוץ גלובלי מעל טבלת ההתאמות: {request_id: (offer_id, score)} שממקסם את סך הציונים,
+    כל בקשה להצעה אחת לכל היותר וכל הצעה עד seats בקשות. זוג שהמתנדב דחה לא משובץ.
+    """
+    rows = (
+        RequestOfferMatch.objects.filter(
+            request__status="open", request__no_volunteers_available=False, offer__status="open"
+        )
+        .annotate(live=live_score())
+        .filter(live__gte=MATCH_MIN_SCORE)
+        .values_list("request_id", "offer_id", "live", "offer__volunteer_id", "offer__seats")
+    )
+    rejected = set(
+        TransportRejection.objects.filter(request__status="open").values_list("request_id", "volunteer_id")
+    )
+    scores, seats = {}, {}
+    for request_id, offer_id, score, volunteer_id, offer_seats in rows:
+        if (request_id, volunteer_id) in rejected:
+            continue
+        scores[(request_id, offer_id)] = score
+        seats[offer_id] = offer_seats
+    return {
+        request_id: (offer_id, scores[(request_id, offer_id)])
+        for request_id, offer_id in capacitated_matching(scores, seats).items()
+    }
+
+
+def recommended_pairing(stamp=None):
+    """compute_pairing מה-cache לפי assignment_stamp (מחושב מחדש רק כשהקלט השתנה)."""
+    stamp = stamp or assignment_stamp()
+    key = "match-assignment:" + hashlib.sha1(stamp.encode("utf-8")).hexdigest()[:24]
+    pairing = cache.get(key)
+    if pairing is None:
+        pairing = compute_pairing()
+        cache.set(key, pairing, int(getattr(settings, "MATCH_ASSIGNMENT_CACHE_SECONDS", 600)))
+    return pairing
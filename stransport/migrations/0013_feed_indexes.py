@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stransport', '0012_rideoffer_coords'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rideoffer',
+            index=models.Index(fields=['status', '-created_at'], name='offer_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transportrequest',
+            index=models.Index(condition=models.Q(('no_volunteers_available', False), ('status', 'open')), fields=['-created_at'], name='treq_open_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transportrequest',
+            index=models.Index(fields=['status', 'no_volunteers_available', '-created_at'], name='treq_status_nova_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transportrequest',
+            index=models.Index(fields=['-created_at'], name='treq_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transportrequest',
+            index=models.Index(fields=['sick', 'status', 'requested_time'], name='treq_sick_status_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transportrequest',
+            index=models.Index(fields=['requested_time'], name='treq_requested_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transportrequest',
+            index=models.Index(condition=models.Q(('status', 'cancelled')), fields=['cancelled_at'], name='treq_cancelled_at_idx'),
+        ),
+    ]
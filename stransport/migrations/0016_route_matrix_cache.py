@@ -0,0 +1,26 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stransport', '0015_geocode_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteMatrixCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=32)),
+                ('destination', models.CharField(max_length=32)),
+                ('distance_m', models.FloatField(blank=True, null=True)),
+                ('duration_s', models.FloatField(blank=True, null=True)),
+                ('fetched_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'unique_together': {('source', 'destination')},
+            },
+        ),
+    ]
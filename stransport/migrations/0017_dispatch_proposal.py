@@ -0,0 +1,31 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stransport', '0016_route_matrix_cache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DispatchProposal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_id', models.CharField(db_index=True, max_length=32)),
+                ('pickup_index', models.PositiveSmallIntegerField()),
+                ('dropoff_index', models.PositiveSmallIntegerField()),
+                ('detour_m', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('offer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='dispatch_proposals', to='stransport.rideoffer')),
+                ('request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='dispatch_proposal', to='stransport.transportrequest')),
+                ('volunteer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dispatch_proposals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['volunteer_id', 'offer_id', 'pickup_index'],
+            },
+        ),
+    ]
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.db import migrations, models
+
+# עותק קפוא של geo.geohash_encode (דיוק 6) – לא לייבא קוד חי של האפליקציה למיגרציה
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 6
+
+
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    if lat is None or lng is None:
+        return ""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def backfill_cells(apps, schema_editor):
+    """חישוב תאי geohash לשורות קיימות (save של המודל לא רץ במיגרציה)."""
+    specs = [
+        ("TransportRequest", {"pickup_cell": ("pickup_lat", "pickup_lng"), "dest_cell": ("dest_lat", "dest_lng")}),
+        ("RideOffer", {"from_cell": ("from_lat", "from_lng"), "to_cell": ("to_lat", "to_lng")}),
+    ]
+    for model_name, cells in specs:
+        model = apps.get_model("stransport", model_name)
+        batch = []
+        for obj in model.objects.only("pk", *[f for coords in cells.values() for f in coords]).iterator(chunk_size=2000):
+            for cell_field, (lat_field, lng_field) in cells.items():
+                setattr(obj, cell_field, geohash_encode(getattr(obj, lat_field), getattr(obj, lng_field)))
+            batch.append(obj)
+            if len(batch) >= 2000:
+                model.objects.bulk_update(batch, list(cells))
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, list(cells))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stransport', '0018_route_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rideoffer',
+            name='from_cell',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='rideoffer',
+            name='to_cell',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='transportrequest',
+            name='dest_cell',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='transportrequest',
+            name='pickup_cell',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='rideoffer',
+            index=models.Index(fields=['from_cell', 'status'], name='offer_from_cell_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rideoffer',
+            index=models.Index(fields=['to_cell', 'status'], name='offer_to_cell_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transportrequest',
+            index=models.Index(fields=['pickup_cell', 'status'], name='treq_pickup_cell_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transportrequest',
+            index=models.Index(fields=['dest_cell', 'status'], name='treq_dest_cell_idx'),
+        ),
+        migrations.RunPython(backfill_cells, migrations.RunPython.noop),
+    ]
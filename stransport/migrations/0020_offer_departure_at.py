@@ -0,0 +1,59 @@
+import re
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+# עותק קפוא של models.parse_offer_departure כפי שהיה במיגרציה הזו – לא לייבא קוד חי של האפליקציה
+OFFER_TEXT_DATETIME_RE = re.compile(r"בתאריך\s+(\d{4}-\d{2}-\d{2})\s+בשעה\s+(\d{2}:\d{2})")
+
+
+def parse_offer_departure(offer):
+    if offer.parsed_date and offer.parsed_time:
+        dt = datetime.combine(offer.parsed_date, offer.parsed_time)
+    else:
+        m = OFFER_TEXT_DATETIME_RE.search(offer.raw_text or "")
+        if not m:
+            return None
+        try:
+            dt = datetime.strptime(f"{m.group(1)} {m.group(2)}", "%Y-%m-%d %H:%M")
+        except ValueError:
+            return None
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt, timezone.get_current_timezone())
+    return dt
+
+
+def backfill_departure_at(apps, schema_editor):
+    RideOffer = apps.get_model("stransport", "RideOffer")
+    batch = []
+    for offer in RideOffer.objects.only("pk", "parsed_date", "parsed_time", "raw_text").iterator(chunk_size=2000):
+        offer.departure_at = parse_offer_departure(offer)
+        batch.append(offer)
+        if len(batch) >= 2000:
+            RideOffer.objects.bulk_update(batch, ["departure_at"])
+            batch = []
+    if batch:
+        RideOffer.objects.bulk_update(batch, ["departure_at"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stransport', '0019_geo_cells'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rideoffer',
+            name='departure_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='rideoffer',
+            index=models.Index(fields=['status', 'departure_at'], name='offer_status_departure_idx'),
+        ),
+        migrations.RunPython(backfill_departure_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stransport', '0020_offer_departure_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestOfferMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('offer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='request_matches', to='stransport.rideoffer')),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='offer_matches', to='stransport.transportrequest')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['request', '-score'], name='match_request_score_idx'), models.Index(fields=['offer', '-score'], name='match_offer_score_idx')],
+                'unique_together': {('request', 'offer')},
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stransport', '0021_request_offer_match'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rideoffer',
+            name='seats',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
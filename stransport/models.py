@@ -2,8 +2,11 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from datetime import datetime, timedelta
 import re
 
+from .geo import geohash_encode
+
 class Profile(models.Model):
     ROLE_CHOICES = [
         ('sick', 'מטופל'),
@@ -43,6 +46,26 @@ def normalize_israeli_phone(value):
     return f"+972{digits}"
 
 
+def refresh_geo_cells(instance, cells, save_kwargs):
+    """
+    מעדכן את שדות ה-geohash של instance מהקואורדינטות (cells: {שדה תא: (שדה lat, שדה lng)}).
+    save(update_fields=...) שכולל קואורדינטה – מקבל גם את שדה התא, כדי שהאינדקס לא יתיישן.
+    """
+    for cell_field, (lat_field, lng_field) in cells.items():
+        setattr(instance, cell_field, geohash_encode(getattr(instance, lat_field), getattr(instance, lng_field)))
+    update_fields = save_kwargs.get("update_fields")
+    if update_fields is not None:
+        fields = set(update_fields)
+        fields.update(cell for cell, coords in cells.items() if fields.intersection(coords))
+        save_kwargs["update_fields"] = fields
+
+
+def affects_matches(instance, save_kwargs):
+    """האם ה-save משנה שדה שנכנס לניקוד ההתאמה (instance.MATCH_FIELDS) – save מלא תמיד כן."""
+    update_fields = save_kwargs.get("update_fields")
+    return update_fields is None or bool(instance.MATCH_FIELDS.intersection(update_fields))
+
+
 class TransportRequest(models.Model):
     STATUS_CHOICES = [
         ('open', 'פתוחה'),
@@ -58,18 +81,63 @@ class TransportRequest(models.Model):
     destination = models.CharField(max_length=255)
     dest_lat = models.FloatField(null=True, blank=True)
     dest_lng = models.FloatField(null=True, blank=True)
+    # תאי geohash (geo.GEOHASH_PRECISION) לשליפת מועמדים לפי שכנות – מתעדכנים ב-save
+    pickup_cell = models.CharField(max_length=12, blank=True, editable=False)
+    dest_cell = models.CharField(max_length=12, blank=True, editable=False)
     requested_time = models.DateTimeField()
     notes = models.TextField(blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="open")
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     no_volunteers_available = models.BooleanField(default=False)
     cancel_reason = models.CharField(max_length=50, blank=True)
     cancelled_at = models.DateTimeField(null=True, blank=True, help_text="מועד הביטול – בקשה מבוטלת מוצגת עד למחרת")
     ai_summary = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            # feed פתוח (מתנדבים/אורח) ממוין לפי created_at
+            models.Index(
+                fields=["-created_at"],
+                condition=models.Q(status="open", no_volunteers_available=False),
+                name="treq_open_feed_idx",
+            ),
+            models.Index(fields=["status", "no_volunteers_available", "-created_at"], name="treq_status_nova_created_idx"),
+            # rides_api – האחרונות לפי created_at
+            models.Index(fields=["-created_at"], name="treq_created_idx"),
+            # היסטוריית בקשות סגורות/פתוחות למטופל
+            models.Index(fields=["sick", "status", "requested_time"], name="treq_sick_status_time_idx"),
+            # תנאי ה-purge (expired_requests_q)
+            models.Index(fields=["requested_time"], name="treq_requested_time_idx"),
+            models.Index(
+                fields=["cancelled_at"],
+                condition=models.Q(status="cancelled"),
+                name="treq_cancelled_at_idx",
+            ),
+            # שליפת מועמדים להתאמה לפי תאים סמוכים
+            models.Index(fields=["pickup_cell", "status"], name="treq_pickup_cell_idx"),
+            models.Index(fields=["dest_cell", "status"], name="treq_dest_cell_idx"),
+        ]
+
+    GEO_CELLS = {"pickup_cell": ("pickup_lat", "pickup_lng"), "dest_cell": ("dest_lat", "dest_lng")}
+    # שדות שמשפיעים על RequestOfferMatch – שינוי בהם מנקד מחדש את הבקשה (matching)
+    MATCH_FIELDS = {
+        "pickup_address", "pickup_lat", "pickup_lng", "destination", "dest_lat", "dest_lng",
+        "requested_time", "status", "no_volunteers_available",
+    }
+
     def __str__(self):
         return f"{self.sick.username} -> {self.destination} ({self.requested_time})"
 
+    def save(self, *args, **kwargs):
+        refresh_geo_cells(self, self.GEO_CELLS, kwargs)
+        rescore = affects_matches(self, kwargs)
+        super().save(*args, **kwargs)
+        if rescore:
+            from .matching import enqueue_match_refresh
+
+            enqueue_match_refresh("request", self.pk)
+
 
 class TransportAssignment(models.Model):
     request = models.OneToOneField(TransportRequest, on_delete=models.CASCADE, related_name="transportassignment")
@@ -105,6 +173,31 @@ class VolunteerLocation(models.Model):
         return f"Location for {self.assignment} @ ({self.lat}, {self.lng})"
 
 
+OFFER_TEXT_DATETIME_RE = re.compile(r"בתאריך\s+(\d{4}-\d{2}-\d{2})\s+בשעה\s+(\d{2}:\d{2})")
+
+
+def parse_offer_departure(offer):
+    """
+    מועד היציאה של הצעת נסיעה (aware), או None.
+    קודם parsed_date + parsed_time, ואז fallback לטקסט:
+    "נסיעה עתידית מ-{from} אל {to} בתאריך YYYY-MM-DD בשעה HH:MM ..."
+    """
+    dt = None
+    if getattr(offer, "parsed_date", None) and getattr(offer, "parsed_time", None):
+        dt = datetime.combine(offer.parsed_date, offer.parsed_time)
+    else:
+        m = OFFER_TEXT_DATETIME_RE.search(getattr(offer, "raw_text", "") or "")
+        if not m:
+            return None
+        try:
+            dt = datetime.strptime(f"{m.group(1)} {m.group(2)}", "%Y-%m-%d %H:%M")
+        except ValueError:
+            return None
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt, timezone.get_current_timezone())
+    return dt
+
+
 class RideOffer(models.Model):
     """הצעת נסיעה ממתנדב (פרסום נסיעה) – טקסט חופשי, נשמר ומוצע למטופלים."""
     volunteer = models.ForeignKey(User, on_delete=models.CASCADE, related_name="ride_offers")
@@ -118,15 +211,169 @@ class RideOffer(models.Model):
     # שדות מפוענחים (אופציונלי, למילוי ע\"י AI/לוגיקה בהמשך)
     parsed_date = models.DateField(null=True, blank=True)
     parsed_time = models.TimeField(null=True, blank=True)
+    # מועד יציאה מנורמל (parse_offer_departure) – מחושב ב-save, לסינון וניקוד ב-DB
+    departure_at = models.DateTimeField(null=True, blank=True, editable=False)
     parsed_from = models.CharField(max_length=255, blank=True)
     parsed_to = models.CharField(max_length=255, blank=True)
+    # מקומות פנויים – הקיבולת בשיבוץ הגלובלי (matching.recommended_pairing)
+    seats = models.PositiveSmallIntegerField(default=1)
     from_lat = models.FloatField(null=True, blank=True)
     from_lng = models.FloatField(null=True, blank=True)
     to_lat = models.FloatField(null=True, blank=True)
     to_lng = models.FloatField(null=True, blank=True)
+    from_cell = models.CharField(max_length=12, blank=True, editable=False)
+    to_cell = models.CharField(max_length=12, blank=True, editable=False)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "-created_at"], name="offer_status_created_idx"),
+            models.Index(fields=["from_cell", "status"], name="offer_from_cell_idx"),
+            models.Index(fields=["to_cell", "status"], name="offer_to_cell_idx"),
+            models.Index(fields=["status", "departure_at"], name="offer_status_departure_idx"),
+        ]
+
+    GEO_CELLS = {"from_cell": ("from_lat", "from_lng"), "to_cell": ("to_lat", "to_lng")}
+    DEPARTURE_SOURCE_FIELDS = {"parsed_date", "parsed_time", "raw_text"}
+    MATCH_FIELDS = {"parsed_from", "parsed_to", "from_lat", "from_lng", "to_lat", "to_lng", "status"}
+    MATCH_FIELDS |= DEPARTURE_SOURCE_FIELDS
 
     def __str__(self):
         return f"{self.volunteer.username}: {self.raw_text[:50]}..."
+
+    def save(self, *args, **kwargs):
+        refresh_geo_cells(self, self.GEO_CELLS, kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or self.DEPARTURE_SOURCE_FIELDS.intersection(update_fields):
+            self.departure_at = parse_offer_departure(self)
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields) | {"departure_at"}
+        rescore = affects_matches(self, kwargs)
+        super().save(*args, **kwargs)
+        if rescore:
+            from .matching import enqueue_match_refresh
+
+            enqueue_match_refresh("offer", self.pk)
+
+
+class RequestOfferMatch(models.Model):
+    """
+    ציון התאמה מחושב מראש בין בקשה פתוחה להצעה פתוחה (matching.score_request_against_offer).
+    מתעדכן אחרי save של הבקשה/ההצעה (רק הזוגות שלה, ב-worker), נמחק ב-cascade; ההצעות
+    למטופל/מתנדב הן קריאת top-k מהאינדקסים. להצעה בלי departure_at score לא כולל את רכיב
+    הזמן – הוא מתווסף בקריאה (matching.live_score).
+    """
+    request = models.ForeignKey(TransportRequest, on_delete=models.CASCADE, related_name="offer_matches")
+    offer = models.ForeignKey(RideOffer, on_delete=models.CASCADE, related_name="request_matches")
+    score = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("request", "offer")
+        indexes = [
+            models.Index(fields=["request", "-score"], name="match_request_score_idx"),
+            models.Index(fields=["offer", "-score"], name="match_offer_score_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.request_id} <-> {self.offer_id}: {self.score:.2f}"
+
+
+def expired_requests_q(now=None):
+    """
+    תנאי לבקשות שפג תוקפן (ומיועדות למחיקה ע"י purge_expired_requests):
+    (1) מועד האיסוף עבר לפני יותר מ־30 דקות, מלבד בקשות שבוטלו לאחרונה.
+    (2) בקשות מבוטלות ישנות – בוטלו לפני יותר מ־48 שעות.
+    נקודות הקריאה משתמשות באותו תנאי כדי לסנן (exclude) בלי למחוק.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(minutes=30)
+    cancel_keep = now - timedelta(days=2)
+    recently_cancelled = models.Q(status="cancelled") & (
+        models.Q(cancelled_at__gte=cancel_keep)
+        | models.Q(cancelled_at__isnull=True, requested_time__gte=cancel_keep)
+    )
+    old_cancelled = models.Q(status="cancelled") & (
+        models.Q(cancelled_at__lt=cancel_keep)
+        | models.Q(cancelled_at__isnull=True, requested_time__lt=cancel_keep)
+    )
+    return (models.Q(requested_time__lt=cutoff) & ~recently_cancelled) | old_cancelled
+
+
+class GeocodeCacheEntry(models.Model):
+    """
+    מטמון גיאוקודינג קבוע (השכבה השנייה אחרי ה-LRU בזיכרון).
+    key = sha1 של כתובת מנורמלת / place_id. lat/lng ריקים = תוצאה שלילית (אין תוצאה).
+    """
+    key = models.CharField(max_length=40, unique=True)
+    query = models.CharField(max_length=300)
+    lat = models.FloatField(null=True, blank=True)
+    lng = models.FloatField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def is_negative(self):
+        return self.lat is None or self.lng is None
+
+    def __str__(self):
+        return f"{self.query} -> ({self.lat}, {self.lng})"
+
+
+class RouteMatrixCell(models.Model):
+    """
+    תא במטריצת מרחקים/זמנים של OSRM בין שתי נקודות "מעוגלות" (snapped).
+    מאפשר להרכיב מטריצה מבוקשת מתאים שכבר נשלפו ולשלוף מ-OSRM רק שורות/עמודות חסרות.
+    """
+    source = models.CharField(max_length=32)
+    destination = models.CharField(max_length=32)
+    distance_m = models.FloatField(null=True, blank=True)
+    duration_s = models.FloatField(null=True, blank=True)
+    fetched_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        unique_together = ("source", "destination")
+
+    def __str__(self):
+        return f"{self.source} -> {self.destination}: {self.distance_m}m / {self.duration_s}s"
+
+
+class DispatchProposal(models.Model):
+    """
+    הצעת שיבוץ של ה-dispatch optimizer: בקשה פתוחה -> מתנדב (ונסיעה שפורסמה, אם יש).
+    pickup_index / dropoff_index = מיקום האיסוף וההורדה במסלול של אותו רכב (בלי נקודת המוצא),
+    כך שאפשר לשחזר את המסלול ולהכניס אליו בקשה חדשה בלי להריץ אופטימיזציה מלאה.
+    """
+    run_id = models.CharField(max_length=32, db_index=True)
+    request = models.OneToOneField(TransportRequest, on_delete=models.CASCADE, related_name="dispatch_proposal")
+    volunteer = models.ForeignKey(User, on_delete=models.CASCADE, related_name="dispatch_proposals")
+    offer = models.ForeignKey(RideOffer, on_delete=models.CASCADE, null=True, blank=True, related_name="dispatch_proposals")
+    pickup_index = models.PositiveSmallIntegerField()
+    dropoff_index = models.PositiveSmallIntegerField()
+    detour_m = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["volunteer_id", "offer_id", "pickup_index"]
+
+    def __str__(self):
+        return f"{self.request_id} -> {self.volunteer.username} (+{self.detour_m:.0f}m)"
+
+
+class RouteJob(models.Model):
+    """
+    עבודת תכנון מסלול אסינכרונית (suggest_route_api עם async).
+    נשמרת ב-DB ולא ב-cache כדי שה-view וה-worker של Celery (תהליכים נפרדים) יראו אותה.
+    """
+    STATUS_CHOICES = [("pending", "ממתין"), ("done", "הושלם"), ("failed", "נכשל")]
+
+    job_id = models.CharField(max_length=32, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="route_jobs")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    http_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.job_id} ({self.status})"
@@ -0,0 +1,172 @@
+"""
+מטריצות מרחק/זמן מ-OSRM (table service) עם מטמון תאים קבוע (RouteMatrixCell).
+
+הקואורדינטות מעוגלות (OSRM_CACHE_PRECISION ספרות אחרי הנקודה, ~11 מ' ב-4) ומשמשות כמפתח.
+מטריצה מבוקשת מורכבת מתאים שכבר נשמרו, ורק השורות/העמודות של נקודות חדשות נשלפות מ-OSRM
+(sources/destinations), כך שתכנון מחדש אחרי הוספת עצירה אחת עולה שורה + עמודה ולא טבלה מלאה.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import http_client
+from .models import RouteMatrixCell
+
+logger = logging.getLogger(__name__)
+
+
+def snap(coord):
+    precision = int(getattr(settings, "OSRM_CACHE_PRECISION", 4))
+    return round(coord[0], precision), round(coord[1], precision)
+
+
+def point_key(coord):
+    precision = int(getattr(settings, "OSRM_CACHE_PRECISION", 4))
+    return f"{coord[0]:.{precision}f},{coord[1]:.{precision}f}"
+
+
+def fetch_table(coords, base_url, sources=None, destinations=None):
+    """
+    קריאה אחת ל-OSRM table. sources/destinations = אינדקסים לתוך coords (None = כולם).
+    מחזיר {"distances", "durations"} בגודל len(sources) x len(destinations), או None בכשל.
+    """
+    coord_str = ";".join([f"{lng},{lat}" for lat, lng in coords])
+    url = f"{base_url.rstrip('/')}/table/v1/driving/{coord_str}"
+    params = {"annotations": "distance,duration"}
+    if sources is not None:
+        params["sources"] = ";".join(str(i) for i in sources)
+    if destinations is not None:
+        params["destinations"] = ";".join(str(i) for i in destinations)
+    try:
+        resp = http_client.get("osrm", url, params=params)
+        resp.raise_for_status()
+        data = resp.json()
+        if not data.get("distances") or not data.get("durations"):
+            return None
+        return {
+            "distances": data.get("distances"),
+            "durations": data.get("durations"),
+        }
+    except Exception:
+        logger.warning("OSRM table failed", exc_info=True)
+        return None
+
+
+def _load_cells(keys, now):
+    ttl = timedelta(seconds=int(getattr(settings, "OSRM_CACHE_TTL_SECONDS", 7 * 24 * 3600)))
+    cells = {}
+    try:
+        rows = RouteMatrixCell.objects.filter(
+            source__in=keys,
+            destination__in=keys,
+            fetched_at__gt=now - ttl,
+        ).values_list("source", "destination", "distance_m", "duration_s")
+        for source, destination, distance, duration in rows:
+            cells[(source, destination)] = (distance, duration)
+    except Exception:
+        logger.warning("Route matrix cache read failed", exc_info=True)
+    return cells
+
+
+def _save_cells(new_cells, now):
+    if not new_cells:
+        return
+    try:
+        RouteMatrixCell.objects.bulk_create(
+            [
+                RouteMatrixCell(
+                    source=source,
+                    destination=destination,
+                    distance_m=distance,
+                    duration_s=duration,
+                    fetched_at=now,
+                )
+                for (source, destination), (distance, duration) in new_cells.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["source", "destination"],
+            update_fields=["distance_m", "duration_s", "fetched_at"],
+            batch_size=500,
+        )
+    except Exception:
+        logger.warning("Route matrix cache write failed", exc_info=True)
+
+
+def _points_to_fetch(keys, cells):
+    """
+    הקבוצה הקטנה (בקירוב, חמדני) של נקודות שצריך לשלוף עבורן שורה+עמודה:
+    מסירים שוב ושוב את הנקודה עם הכי הרבה תאים חסרים עד שכל הנותרות מכוסות ביניהן.
+    ספירת החסרים לכל נקודה מחושבת פעם אחת ומתעדכנת בכל הסרה – O(n^2) ולא O(n^3).
+    """
+    everyone = list(range(len(keys)))
+    if not cells:
+        # מטמון קר – שולפים הכל בלי לחשב כיסוי
+        return everyone
+
+    # missing[i][j] – כמה מהתאים (i, j), (j, i) חסרים; counts[i] – הסכום על כל j
+    missing = [{} for _ in everyone]
+    counts = [0] * len(keys)
+    for i in everyone:
+        for j in range(i, len(keys)):
+            weight = ((keys[i], keys[j]) not in cells) + ((keys[j], keys[i]) not in cells)
+            if weight:
+                missing[i][j] = missing[j][i] = weight
+                counts[i] += weight
+                if j != i:
+                    counts[j] += weight
+
+    known = set(everyone)
+    while known:
+        worst = max(known, key=counts.__getitem__)
+        if counts[worst] == 0:
+            break
+        known.remove(worst)
+        for j, weight in missing[worst].items():
+            if j in known:
+                counts[j] -= weight
+    return [i for i in everyone if i not in known]
+
+
+def osrm_table(coords, base_url):
+    if not coords:
+        return None
+
+    now = timezone.now()
+    snapped = [snap(c) for c in coords]
+    keys = [point_key(c) for c in snapped]
+
+    # נקודות ייחודיות (עצירות כפולות חולקות מפתח)
+    unique_keys = list(dict.fromkeys(keys))
+    unique_coords = [snapped[keys.index(k)] for k in unique_keys]
+    cells = _load_cells(unique_keys, now)
+
+    missing = _points_to_fetch(unique_keys, cells)
+    if missing:
+        new_cells = {}
+        missing_set = set(missing)
+        everyone = list(range(len(unique_keys)))
+        if len(missing) == len(unique_keys):
+            parts = [(everyone, everyone)]
+        else:
+            # שורות של הנקודות החדשות + העמודות שלהן מהנקודות המוכרות
+            known = [i for i in everyone if i not in missing_set]
+            parts = [(missing, everyone), (known, missing)]
+        for sources, destinations in parts:
+            table = fetch_table(unique_coords, base_url, sources, destinations)
+            if table is None:
+                return None
+            for si, src in enumerate(sources):
+                for di, dst in enumerate(destinations):
+                    new_cells[(unique_keys[src], unique_keys[dst])] = (
+                        table["distances"][si][di],
+                        table["durations"][si][di],
+                    )
+        cells.update(new_cells)
+        _save_cells(new_cells, now)
+
+    return {
+        "distances": [[cells[(a, b)][0] for b in keys] for a in keys],
+        "durations": [[cells[(a, b)][1] for b in keys] for a in keys],
+    }
@@ -0,0 +1,364 @@
+"""
+מנוע ניתוב מקומי על גרף כבישים – תחליף ל-OSRM כשהשרת איטי / לא זמין, ולבדיקות ופריסות בלי רשת.
+
+- הגרף נטען מקובץ OSM XML (‎.osm / ‎.osm.gz) או מפורמט מוכן ודחוס (‎.json.gz, prepare_road_graph).
+- המשקל הוא זמן נסיעה (כמו OSRM), והמרחק נסכם לאורך המסלול המהיר ביותר.
+- Contraction Hierarchies: עיבוד מקדים מכווץ צמתים לפי סדר חשיבות ומוסיף shortcuts; שאילתה היא
+  חיפוש דו-כיווני "כלפי מעלה" בלבד, ומטריצה (table) מחושבת באלגוריתם ה-buckets –
+  חיפוש אחורי אחד לכל יעד וחיפוש קדמי אחד לכל מקור, במקום חיפוש לכל זוג.
+- הצמדת נקודה לצומת הקרוב (NumPy); נקודה רחוקה מ-ROAD_GRAPH_MAX_SNAP_M מקבלת None בשורה/עמודה,
+  כמו תא ש-OSRM לא חישב, וה-view משלים אותו בקו אווירי.
+
+local_table(coords) מחזיר {"distances", "durations"} – אותו מבנה כמו osrm.osrm_table.
+"""
+import gzip
+import heapq
+import json
+import logging
+import os
+import threading
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from django.conf import settings
+
+from .geo import haversine_meters, haversine_one_to_many
+
+logger = logging.getLogger(__name__)
+
+FORMAT_NAME = "stransport-road-graph"
+FORMAT_VERSION = 1
+# מהירות ברירת מחדל (קמ"ש) לפי סוג כביש ב-OSM, כשאין maxspeed
+HIGHWAY_SPEEDS_KMH = {
+    "motorway": 100, "motorway_link": 60,
+    "trunk": 80, "trunk_link": 50,
+    "primary": 65, "primary_link": 45,
+    "secondary": 55, "secondary_link": 40,
+    "tertiary": 45, "tertiary_link": 35,
+    "unclassified": 40, "residential": 30,
+    "living_street": 10, "service": 15, "road": 30,
+}
+# מהירות "גישה" מהנקודה המקורית לצומת שאליו הוצמדה
+ACCESS_SPEED_MPS = 15 / 3.6
+WITNESS_SETTLE_LIMIT = 60
+
+
+def _open(path, mode="rb"):
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+def _maxspeed_kmh(value):
+    try:
+        return float(str(value).split()[0])
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_osm(path):
+    """
+    קורא OSM XML ומחזיר (nodes, edges): nodes = [(lat, lng)], edges = [(u, v, duration_s, distance_m)] מכוונות.
+    נלקחות רק דרכים עם highway שנסיעה ברכב מותרת בהן; oneway / junction=roundabout מכובדים.
+    """
+    coords_by_id = {}
+    ways = []
+    for _event, elem in ET.iterparse(_open(path), events=("end",)):
+        if elem.tag == "node":
+            coords_by_id[elem.get("id")] = (float(elem.get("lat")), float(elem.get("lon")))
+            elem.clear()
+        elif elem.tag == "way":
+            tags = {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+            highway = tags.get("highway")
+            if highway in HIGHWAY_SPEEDS_KMH and tags.get("access") not in ("no", "private"):
+                speed = _maxspeed_kmh(tags.get("maxspeed")) or HIGHWAY_SPEEDS_KMH[highway]
+                oneway = tags.get("oneway")
+                if oneway in ("yes", "true", "1") or highway == "motorway" or tags.get("junction") == "roundabout":
+                    direction = 1
+                elif oneway == "-1":
+                    direction = -1
+                else:
+                    direction = 0
+                ways.append(([nd.get("ref") for nd in elem.iter("nd")], speed, direction))
+            elem.clear()
+
+    index = {}
+    nodes = []
+    edges = []
+
+    def node_index(osm_id):
+        if osm_id not in index:
+            index[osm_id] = len(nodes)
+            nodes.append(coords_by_id[osm_id])
+        return index[osm_id]
+
+    for refs, speed_kmh, direction in ways:
+        refs = [ref for ref in refs if ref in coords_by_id]
+        for a, b in zip(refs, refs[1:]):
+            u, v = node_index(a), node_index(b)
+            distance = haversine_meters(*nodes[u], *nodes[v])
+            duration = distance / (speed_kmh / 3.6)
+            if direction >= 0:
+                edges.append((u, v, duration, distance))
+            if direction <= 0:
+                edges.append((v, u, duration, distance))
+    return nodes, edges
+
+
+class RoadGraph:
+    """גרף כבישים מכווץ (CH). נבנה מ-nodes/edges, או נטען מפורמט מוכן עם rank + קשתות מכווצות."""
+
+    def __init__(self, nodes, edges, rank=None, ch_edges=None):
+        self.nodes = [tuple(node) for node in nodes]
+        self.points = np.array(self.nodes, dtype=float).reshape(-1, 2)
+        self.edges = [tuple(edge) for edge in edges]
+        if rank is None:
+            rank, ch_edges = self._contract()
+        self.rank = list(rank)
+        self.ch_edges = [tuple(edge) for edge in ch_edges]
+        # up[u]: קשתות u->v ל-v בדרגה גבוהה יותר; down[v]: קשתות u->v ל-u בדרגה גבוהה יותר (לחיפוש האחורי)
+        self.up = [[] for _ in self.nodes]
+        self.down = [[] for _ in self.nodes]
+        for u, v, w, d in self.ch_edges:
+            if self.rank[v] > self.rank[u]:
+                self.up[u].append((v, w, d))
+            else:
+                self.down[v].append((u, w, d))
+
+    # --- עיבוד מקדים -------------------------------------------------------------------------
+
+    def _contract(self):
+        n = len(self.nodes)
+        out_edges = [dict() for _ in range(n)]
+        in_edges = [dict() for _ in range(n)]
+        for u, v, w, d in self.edges:
+            if u == v:
+                continue
+            if v not in out_edges[u] or w < out_edges[u][v][0]:
+                out_edges[u][v] = (w, d)
+                in_edges[v][u] = (w, d)
+
+        deleted_neighbors = [0] * n
+
+        def witness_costs(source, targets, skip, limit):
+            """עלות המסלול מ-source לכל יעד בלי לעבור ב-skip (Dijkstra מוגבל; inf אם לא נמצא)."""
+            dist = {source: 0.0}
+            heap = [(0.0, source)]
+            remaining = set(targets)
+            settled = 0
+            while heap and remaining and settled < WITNESS_SETTLE_LIMIT:
+                cost, node = heapq.heappop(heap)
+                if cost > dist[node]:
+                    continue
+                if cost > limit:
+                    break
+                remaining.discard(node)
+                settled += 1
+                for nxt, (w, _d) in out_edges[node].items():
+                    if nxt == skip:
+                        continue
+                    new_cost = cost + w
+                    if new_cost < dist.get(nxt, float("inf")):
+                        dist[nxt] = new_cost
+                        heapq.heappush(heap, (new_cost, nxt))
+            return dist
+
+        def shortcuts_for(v):
+            """shortcuts שכיווץ v מחייב: u->v->x שאין לו מסלול עוקף (witness) זול או שווה."""
+            found = []
+            outgoing = out_edges[v]
+            for u, (w_in, d_in) in in_edges[v].items():
+                targets = [x for x in outgoing if x != u]
+                if not targets:
+                    continue
+                limit = w_in + max(outgoing[x][0] for x in targets)
+                dist = witness_costs(u, targets, v, limit)
+                for x in targets:
+                    w_out, d_out = outgoing[x]
+                    via = w_in + w_out
+                    if dist.get(x, float("inf")) > via:
+                        found.append((u, x, via, d_in + d_out))
+            return found
+
+        def priority(v):
+            """(edge difference + שכנים שכבר כווצו, ה-shortcuts עצמם – לשימוש חוזר בכיווץ)."""
+            shortcuts = shortcuts_for(v)
+            edge_difference = len(shortcuts) - len(in_edges[v]) - len(out_edges[v])
+            return edge_difference + deleted_neighbors[v], shortcuts
+
+        heap = [(priority(v)[0], v) for v in range(n)]
+        heapq.heapify(heap)
+        rank = [0] * n
+        ch_edges = []
+        order = 0
+        while heap:
+            _prio, v = heapq.heappop(heap)
+            # עדכון עצל: העדיפות אולי השתנתה מאז שנכנס לערימה
+            current, shortcuts = priority(v)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+            # הקשתות של v לשכנים שנותרו – כולם יקבלו דרגה גבוהה יותר
+            for x, (w, d) in out_edges[v].items():
+                ch_edges.append((v, x, w, d))
+            for u, (w, d) in in_edges[v].items():
+                ch_edges.append((u, v, w, d))
+            for u, x, w, d in shortcuts:
+                if x not in out_edges[u] or w < out_edges[u][x][0]:
+                    out_edges[u][x] = (w, d)
+                    in_edges[x][u] = (w, d)
+            neighbors = set(in_edges[v]) | set(out_edges[v])
+            for u in in_edges[v]:
+                del out_edges[u][v]
+            for x in out_edges[v]:
+                del in_edges[x][v]
+            in_edges[v], out_edges[v] = {}, {}
+            rank[v] = order
+            order += 1
+            for neighbor in neighbors:
+                deleted_neighbors[neighbor] += 1
+        return rank, ch_edges
+
+    # --- שאילתות --------------------------------------------------------------------------------
+
+    def _upward(self, source, adjacency):
+        """חיפוש Dijkstra "כלפי מעלה" בלבד: {node: (duration, distance)}."""
+        best = {source: (0.0, 0.0)}
+        heap = [(0.0, 0.0, source)]
+        while heap:
+            w, d, node = heapq.heappop(heap)
+            if w > best[node][0]:
+                continue
+            for nxt, edge_w, edge_d in adjacency[node]:
+                new_w = w + edge_w
+                if nxt not in best or new_w < best[nxt][0]:
+                    best[nxt] = (new_w, d + edge_d)
+                    heapq.heappush(heap, (new_w, d + edge_d, nxt))
+        return best
+
+    def route(self, source, target):
+        """(duration_s, distance_m) בין שני צמתים – חיפוש דו-כיווני, או None אם אין מסלול."""
+        forward = self._upward(source, self.up)
+        backward = self._upward(target, self.down)
+        best = None
+        for node, (w, d) in forward.items():
+            if node in backward:
+                total = (w + backward[node][0], d + backward[node][1])
+                if best is None or total[0] < best[0]:
+                    best = total
+        return best
+
+    def table(self, sources, targets):
+        """מטריצת (durations, distances) בין צמתים; None כשאין מסלול. buckets: חיפוש אחד לכל צומת."""
+        buckets = {}
+        for j, target in enumerate(targets):
+            for node, (w, d) in self._upward(target, self.down).items():
+                buckets.setdefault(node, []).append((j, w, d))
+        durations = [[None] * len(targets) for _ in sources]
+        distances = [[None] * len(targets) for _ in sources]
+        for i, source in enumerate(sources):
+            row_w, row_d = durations[i], distances[i]
+            for node, (w, d) in self._upward(source, self.up).items():
+                for j, bw, bd in buckets.get(node, ()):
+                    total = w + bw
+                    if row_w[j] is None or total < row_w[j]:
+                        row_w[j] = total
+                        row_d[j] = d + bd
+        return durations, distances
+
+    def snap(self, lat, lng):
+        """(אינדקס הצומת הקרוב, מרחק במטרים)."""
+        dist = haversine_one_to_many(lat, lng, self.points)
+        idx = int(np.argmin(dist))
+        return idx, float(dist[idx])
+
+    # --- שמירה / טעינה ---------------------------------------------------------------------------
+
+    def save(self, path):
+        """שמירה בפורמט המוכן (כולל ה-CH), כדי שטעינה בשרת לא תכווץ מחדש."""
+        data = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "nodes": [[round(lat, 6), round(lng, 6)] for lat, lng in self.nodes],
+            "edges": [[u, v, round(w, 2), round(d, 1)] for u, v, w, d in self.edges],
+            "rank": self.rank,
+            "ch_edges": [[u, v, round(w, 2), round(d, 1)] for u, v, w, d in self.ch_edges],
+        }
+        with _open(path, "wt") as fh:
+            json.dump(data, fh, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith((".osm", ".osm.gz")):
+            return cls(*parse_osm(path))
+        with _open(path, "rt") as fh:
+            data = json.load(fh)
+        if data.get("format") != FORMAT_NAME or data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported road graph format: {path}")
+        return cls(data["nodes"], data["edges"], data.get("rank"), data.get("ch_edges"))
+
+
+_lock = threading.Lock()
+_graphs = {}  # path -> (mtime, RoadGraph)
+
+
+def get_graph(path=None):
+    """הגרף מ-ROAD_GRAPH_PATH, טעון פעם אחת לכל תהליך (נטען מחדש אם הקובץ השתנה). None אם לא מוגדר."""
+    path = path or getattr(settings, "ROAD_GRAPH_PATH", "")
+    if not path:
+        return None
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        logger.warning("Road graph not found: %s", path)
+        return None
+    with _lock:
+        cached = _graphs.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            graph = RoadGraph.load(path)
+        except Exception:
+            logger.exception("Failed to load road graph %s", path)
+            return None
+        _graphs[path] = (mtime, graph)
+        return graph
+
+
+def local_table(coords, path=None):
+    """
+    מטריצת {"distances", "durations"} מהגרף המקומי, באותו מבנה כמו osrm_table.
+    נקודה שלא הוצמדה (רחוקה מדי מהגרף) או זוג בלי מסלול – None בתא. None אם אין גרף.
+    """
+    if not coords:
+        return None
+    graph = get_graph(path)
+    if graph is None:
+        return None
+    max_snap = float(getattr(settings, "ROAD_GRAPH_MAX_SNAP_M", 1000))
+    snapped = [graph.snap(lat, lng) for lat, lng in coords]
+    unique = sorted({idx for idx, offset in snapped if offset <= max_snap})
+    position = {idx: k for k, idx in enumerate(unique)}
+    durations, distances = graph.table(unique, unique)
+
+    size = len(coords)
+    out_dist = [[None] * size for _ in range(size)]
+    out_dur = [[None] * size for _ in range(size)]
+    for i, (a, offset_a) in enumerate(snapped):
+        for j, (b, offset_b) in enumerate(snapped):
+            if i == j:
+                out_dist[i][j] = out_dur[i][j] = 0.0
+                continue
+            if offset_a > max_snap or offset_b > max_snap:
+                continue
+            w = durations[position[a]][position[b]]
+            if w is None:
+                continue
+            access = offset_a + offset_b
+            out_dist[i][j] = distances[position[a]][position[b]] + access
+            out_dur[i][j] = w + access / ACCESS_SPEED_MPS
+    return {"distances": out_dist, "durations": out_dur}
+
+
+def reset():
+    """ניקוי הגרפים הטעונים (לבדיקות)."""
+    with _lock:
+        _graphs.clear()
@@ -0,0 +1,272 @@
+"""
+Benchmark לאיכות ומהירות של פותרי המסלולים ב-route_optimizer, על מופעים סינתטיים עם seed קבוע.
+
+תרחישים:
+- hospital – איסופים מפוזרים סביב בית חולים אחד, ההורדות בבית החולים (המקרה הנפוץ).
+- intercity – איסופים והורדות בערים שונות ברחבי הארץ.
+
+לכל מופע שתי גרסאות: pickup_only (עצירות איסוף בלבד) ו-pickup_then_dropoff (זוגות עם קדימות).
+המטריצה – haversine (geo), מטריצת OSRM מוקלטת מקובץ fixture (record_osrm_fixture),
+או גרף הכבישים המקומי (road_graph).
+פער האופטימליות מחושב מול הפתרון המדויק (Held-Karp) כשהמופע קטן מספיק, אחרת מול הטוב ביותר שנמצא.
+"""
+import json
+import math
+import random
+import time
+
+from . import osrm, road_graph, route_optimizer
+from .geo import haversine_matrix
+
+HOSPITALS = {
+    "sheba": (32.0460, 34.8420),
+    "ichilov": (32.0800, 34.7890),
+    "rambam": (32.8340, 34.9860),
+    "hadassah": (31.7650, 35.1490),
+    "soroka": (31.2580, 34.8000),
+}
+CITIES = {
+    "tel_aviv": (32.0853, 34.7818),
+    "jerusalem": (31.7683, 35.2137),
+    "haifa": (32.7940, 34.9896),
+    "beer_sheva": (31.2518, 34.7913),
+    "netanya": (32.3215, 34.8532),
+    "ashdod": (31.8044, 34.6553),
+    "petah_tikva": (32.0840, 34.8878),
+    "nazareth": (32.6996, 35.3035),
+    "rehovot": (31.8928, 34.8113),
+    "hadera": (32.4340, 34.9196),
+}
+SCENARIOS = ("hospital", "intercity")
+VARIANTS = ("pickup_only", "pickup_then_dropoff")
+EXACT_MAX_STOPS = 10
+# מהירות ממוצעת להמרת מרחק haversine לזמן נסיעה (מטר לשנייה, ~50 קמ"ש)
+HAVERSINE_SPEED_MPS = 50 / 3.6
+
+
+def _jitter(rng, center, sd_km):
+    lat, lng = center
+    d_lat = rng.gauss(0, sd_km) / 111.0
+    d_lng = rng.gauss(0, sd_km) / (111.0 * math.cos(math.radians(lat)))
+    return (round(lat + d_lat, 5), round(lng + d_lng, 5))
+
+
+def make_instance(scenario, size, seed):
+    """מופע סינתטי: {"name", "scenario", "size", "start", "pairs": [(pickup, dropoff), ...]}."""
+    rng = random.Random(f"{scenario}:{size}:{seed}")
+    if scenario == "hospital":
+        name = rng.choice(sorted(HOSPITALS))
+        hospital = HOSPITALS[name]
+        start = _jitter(rng, hospital, 6.0)
+        pairs = [(_jitter(rng, hospital, 5.0), _jitter(rng, hospital, 0.2)) for _ in range(size)]
+    elif scenario == "intercity":
+        cities = sorted(CITIES)
+        start = _jitter(rng, CITIES[rng.choice(cities)], 2.0)
+        pairs = []
+        for _ in range(size):
+            origin, destination = rng.sample(cities, 2)
+            pairs.append((_jitter(rng, CITIES[origin], 2.0), _jitter(rng, CITIES[destination], 2.0)))
+    else:
+        raise ValueError(f"unknown scenario: {scenario}")
+    return {"name": f"{scenario}-{size}-s{seed}", "scenario": scenario, "size": size, "start": start, "pairs": pairs}
+
+
+def instance_coords(instance, variant):
+    """נקודות המטריצה: 0 = המוצא, 1..n = איסופים, n+1..2n = הורדות (ב-pickup_then_dropoff)."""
+    coords = [instance["start"]] + [pickup for pickup, _ in instance["pairs"]]
+    if variant == "pickup_then_dropoff":
+        coords += [dropoff for _, dropoff in instance["pairs"]]
+    return coords
+
+
+def haversine_matrices(coords):
+    distances = haversine_matrix(coords)
+    durations = [[d / HAVERSINE_SPEED_MPS for d in row] for row in distances]
+    return distances, durations
+
+
+def load_osrm_fixture(path):
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def record_osrm_fixture(instances, base_url, path, variants=VARIANTS):
+    """
+    מקליט מטריצות OSRM (table) למופעים ושומר כ-JSON: {"<name>/<variant>": {"coords", "distances", "durations"}}.
+    מופע שהשרת לא החזיר לו מטריצה מלאה (למשל מעל מגבלת הגודל של השרת) מדולג. מחזיר את מספר המטריצות.
+    """
+    recorded = {}
+    for instance in instances:
+        for variant in variants:
+            coords = instance_coords(instance, variant)
+            table = osrm.fetch_table(coords, base_url)
+            if not table or any(cell is None for row in table["distances"] for cell in row):
+                continue
+            recorded[f"{instance['name']}/{variant}"] = {
+                "coords": coords,
+                "distances": table["distances"],
+                "durations": table["durations"],
+            }
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump({"base_url": base_url, "matrices": recorded}, fh)
+    return len(recorded)
+
+
+def exact_open_route(matrix, stops):
+    """מסלול פתוח אופטימלי מ-0 דרך כל העצירות (Held-Karp, O(2^n * n^2)). מחזיר (order, cost)."""
+    n = len(stops)
+    if not n:
+        return [], 0.0
+    full = (1 << n) - 1
+    best = {(1 << j, j): (matrix[0][stops[j]], None) for j in range(n)}
+    for mask in range(1, full + 1):
+        for j in range(n):
+            entry = best.get((mask, j))
+            if entry is None:
+                continue
+            cost = entry[0]
+            for k in range(n):
+                if mask & (1 << k):
+                    continue
+                key = (mask | (1 << k), k)
+                candidate = cost + matrix[stops[j]][stops[k]]
+                if key not in best or candidate < best[key][0]:
+                    best[key] = (candidate, j)
+    last = min(range(n), key=lambda j: best[(full, j)][0])
+    cost = best[(full, last)][0]
+    order, mask = [], full
+    while last is not None:
+        order.append(stops[last])
+        prev = best[(mask, last)][1]
+        mask &= ~(1 << last)
+        last = prev
+    return order[::-1], cost
+
+
+def _two_opt_only(order, matrix, time_budget_ms):
+    deadline = time.monotonic() + time_budget_ms / 1000 if time_budget_ms else None
+    route = [0] + list(order)
+    while route_optimizer._two_opt_pass(route, matrix, deadline):
+        pass
+    return route[1:]
+
+
+def _pickups_first(matrix, pairs):
+    """ההתנהגות הישנה של pickup_then_dropoff: כל האיסופים (שכן קרוב) ואז כל ההורדות, בלי קיבולת."""
+    pickups = route_optimizer.nearest_neighbor_order(matrix, [p for p, _ in pairs])
+    dropoffs = route_optimizer.nearest_neighbor_order(matrix, [d for _, d in pairs], start=pickups[-1])
+    return pickups + dropoffs
+
+
+def solvers_for(variant, capacity, time_budget_ms):
+    """{שם: fn(distances, durations, stops, pairs) -> order}."""
+    if variant == "pickup_only":
+        return {
+            "nearest_neighbor": lambda dist, dur, stops, pairs: route_optimizer.nearest_neighbor_order(dist, stops),
+            "two_opt": lambda dist, dur, stops, pairs: _two_opt_only(
+                route_optimizer.nearest_neighbor_order(dist, stops), dist, time_budget_ms
+            ),
+            "local_search": lambda dist, dur, stops, pairs: route_optimizer.improve_route(
+                route_optimizer.nearest_neighbor_order(dist, stops), dist, time_budget_ms=time_budget_ms
+            )[0],
+            "time_windows": lambda dist, dur, stops, pairs: route_optimizer.solve_time_windows(
+                dur, {}, stops=stops, time_budget_ms=time_budget_ms
+            )[0],
+        }
+    return {
+        "pickups_first": lambda dist, dur, stops, pairs: _pickups_first(dist, pairs),
+        "pickup_delivery": lambda dist, dur, stops, pairs: route_optimizer.solve_pickup_delivery(
+            dist, pairs, capacity, time_budget_ms=time_budget_ms
+        )[0],
+        "time_windows": lambda dist, dur, stops, pairs: route_optimizer.solve_time_windows(
+            dur, {}, pairs=pairs, capacity=capacity, time_budget_ms=time_budget_ms
+        )[0],
+    }
+
+
+def best_of(repeat, fn):
+    """(הזמן הטוב ביותר בשניות, התוצאה האחרונה) – משותף גם ל-bench_geo ול-bench_matching."""
+    best = result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_benchmark(
+    sizes,
+    scenarios=SCENARIOS,
+    variants=VARIANTS,
+    matrix="haversine",
+    fixture=None,
+    road_graph_path=None,
+    seed=7,
+    repeat=1,
+    capacity=4,
+    time_budget_ms=None,
+):
+    """
+    מריץ את כל הפותרים על כל המופעים. מחזיר רשימת שורות (dict) – שורה לכל מופע × פותר:
+    length_m, wall_ms, feasible (קדימות וקיבולת), gap_pct מול reference ("exact" / "best_known").
+    עם matrix="osrm" נלקחות רק מטריצות שקיימות ב-fixture; עם matrix="local" – רק מופעים שהגרף מכסה.
+    """
+    rows = []
+    matrices = (fixture or {}).get("matrices", {})
+    for scenario in scenarios:
+        for size in sizes:
+            instance = make_instance(scenario, size, seed)
+            for variant in variants:
+                if matrix == "osrm":
+                    recorded = matrices.get(f"{instance['name']}/{variant}")
+                    if recorded is None:
+                        continue
+                    distances, durations = recorded["distances"], recorded["durations"]
+                elif matrix == "local":
+                    table = road_graph.local_table(instance_coords(instance, variant), road_graph_path)
+                    if table is None or any(cell is None for row in table["distances"] for cell in row):
+                        continue
+                    distances, durations = table["distances"], table["durations"]
+                else:
+                    distances, durations = haversine_matrices(instance_coords(instance, variant))
+                stops = list(range(1, size + 1))
+                pairs = [(i, i + size) for i in stops] if variant == "pickup_then_dropoff" else []
+
+                deltas = {node: 1 if node <= size else -1 for pair in pairs for node in pair}
+                precedence = {dropoff: pickup for pickup, dropoff in pairs}
+
+                results = {}
+                for name, solve in solvers_for(variant, capacity, time_budget_ms).items():
+                    wall_s, order = best_of(repeat, lambda: solve(distances, durations, stops, pairs))
+                    route = [0] + list(order)
+                    feasible = sorted(order) == sorted(range(1, len(distances))) and route_optimizer._is_feasible(
+                        route, deltas, precedence, capacity if pairs else None
+                    )
+                    results[name] = (route_optimizer.route_cost(route, distances), wall_s, feasible)
+
+                # פתרון שחורג מהקיבולת לא נחשב ל"טוב ביותר שנמצא"
+                reference = "best_known"
+                reference_cost = min((length for length, _, ok in results.values() if ok), default=None)
+                if variant == "pickup_only" and size <= EXACT_MAX_STOPS:
+                    reference, reference_cost = "exact", exact_open_route(distances, stops)[1]
+
+                for name, (length, wall_s, feasible) in results.items():
+                    rows.append(
+                        {
+                            "instance": instance["name"],
+                            "scenario": scenario,
+                            "variant": variant,
+                            "size": size,
+                            "matrix": matrix,
+                            "solver": name,
+                            "length_m": round(length, 1),
+                            "wall_ms": round(wall_s * 1000, 3),
+                            "feasible": feasible,
+                            "reference": reference,
+                            "gap_pct": round(100.0 * (length - reference_cost) / reference_cost, 3)
+                            if reference_cost
+                            else None,
+                        }
+                    )
+    return rows
@@ -0,0 +1,407 @@
+"""
+שיפור מסלולים (local search) למסלול פתוח שמתחיל בנקודת המוצא של המתנדב.
+
+כל מהלך מוערך ב-O(1) לפי הפרש הקשתות (delta) בלבד, בלי לחשב מחדש את אורך המסלול:
+- 2-opt: היפוך קטע. המטריצות של OSRM אינן סימטריות, ולכן עלות הקטע ההפוך נלקחת
+  מסכומים מצטברים (prefix) של הקשתות בכיוון ההפוך, שמחושבים מחדש רק אחרי מהלך שהתקבל.
+- Or-opt: העברת קטע של 1-3 עצירות למקום אחר במסלול (בלי היפוך).
+
+החיפוש נעצר כשאין שיפור, או כשנגמר תקציב הסבבים (max_passes) או הזמן (time_budget_ms).
+"""
+import time
+
+OR_OPT_SEGMENT_LENGTHS = (1, 2, 3)
+EPSILON = 1e-9
+
+
+def nearest_neighbor_order(matrix, stops, start=0):
+    """סדר התחלתי חמדני: בכל צעד העצירה הקרובה ביותר לעצירה הנוכחית."""
+    remaining = set(stops)
+    order = []
+    current = start
+    while remaining:
+        current = min(remaining, key=lambda idx: (matrix[current][idx], idx))
+        order.append(current)
+        remaining.remove(current)
+    return order
+
+
+def route_cost(route, matrix):
+    return sum(matrix[route[k]][route[k + 1]] for k in range(len(route) - 1))
+
+
+def _prefix_sums(route, matrix):
+    """fwd[k] / rev[k] = סכום הקשתות עד המיקום k בכיוון המסלול / בכיוון ההפוך."""
+    fwd = [0.0] * len(route)
+    rev = [0.0] * len(route)
+    for k in range(1, len(route)):
+        fwd[k] = fwd[k - 1] + matrix[route[k - 1]][route[k]]
+        rev[k] = rev[k - 1] + matrix[route[k]][route[k - 1]]
+    return fwd, rev
+
+
+def _two_opt_pass(route, matrix, deadline):
+    """מהלך 2-opt משפר ראשון. route[0] (המוצא) קבוע. מחזיר True אם בוצע שינוי."""
+    n = len(route)
+    fwd, rev = _prefix_sums(route, matrix)
+    for i in range(1, n - 1):
+        if deadline and time.monotonic() > deadline:
+            return False
+        a, b = route[i - 1], route[i]
+        for j in range(i + 1, n):
+            c = route[j]
+            # route[i..j] מתהפך: a->b ... c->d הופך ל- a->c ... b->d
+            delta = matrix[a][c] - matrix[a][b]
+            delta += (rev[j] - rev[i]) - (fwd[j] - fwd[i])
+            if j + 1 < n:
+                d = route[j + 1]
+                delta += matrix[b][d] - matrix[c][d]
+            if delta < -EPSILON:
+                route[i:j + 1] = route[i:j + 1][::-1]
+                return True
+    return False
+
+
+def _or_opt_pass(route, matrix, deadline):
+    """מהלך Or-opt משפר ראשון: העברת קטע route[i..i+L-1] אל אחרי route[k]."""
+    n = len(route)
+    for length in OR_OPT_SEGMENT_LENGTHS:
+        for i in range(1, n - length + 1):
+            if deadline and time.monotonic() > deadline:
+                return False
+            first, last = route[i], route[i + length - 1]
+            prev = route[i - 1]
+            nxt = route[i + length] if i + length < n else None
+
+            removed = matrix[prev][first]
+            if nxt is not None:
+                removed += matrix[last][nxt] - matrix[prev][nxt]
+
+            for k in range(n):
+                if i - 1 <= k <= i + length - 1:
+                    continue
+                left = route[k]
+                right = route[k + 1] if k + 1 < n else None
+                added = matrix[left][first]
+                if right is not None:
+                    added += matrix[last][right] - matrix[left][right]
+                if added - removed < -EPSILON:
+                    segment = route[i:i + length]
+                    del route[i:i + length]
+                    insert_at = k + 1 if k < i else k + 1 - length
+                    route[insert_at:insert_at] = segment
+                    return True
+    return False
+
+
+def improve_route(order, matrix, max_passes=None, time_budget_ms=None):
+    """
+    order – אינדקסים של עצירות (1..n במטריצה; 0 = המוצא, לא חלק מ-order).
+    matrix – מטריצת עלויות (מרחק/זמן) בגודל (n+1)x(n+1).
+    מחזיר (order משופר, stats).
+    """
+    started = time.monotonic()
+    deadline = started + time_budget_ms / 1000 if time_budget_ms else None
+    route = [0] + list(order)
+    initial = route_cost(route, matrix)
+    stats = {"passes": 0, "two_opt_moves": 0, "or_opt_moves": 0, "budget_exhausted": False}
+
+    if len(route) > 2:
+        while max_passes is None or stats["passes"] < max_passes:
+            if deadline and time.monotonic() > deadline:
+                stats["budget_exhausted"] = True
+                break
+            stats["passes"] += 1
+            if _two_opt_pass(route, matrix, deadline):
+                stats["two_opt_moves"] += 1
+                continue
+            if _or_opt_pass(route, matrix, deadline):
+                stats["or_opt_moves"] += 1
+                continue
+            if deadline and time.monotonic() > deadline:
+                stats["budget_exhausted"] = True
+            break
+        else:
+            stats["budget_exhausted"] = True
+
+    stats["initial_cost"] = initial
+    stats["final_cost"] = route_cost(route, matrix)
+    stats["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+    return route[1:], stats
+
+
+def route_loads(route, deltas):
+    """loads[k] = מספר הנוסעים ברכב אחרי היציאה מ-route[k]."""
+    loads = []
+    current = 0
+    for node in route:
+        current += deltas.get(node, 0)
+        loads.append(current)
+    return loads
+
+
+def _edge(matrix, route, k):
+    """עלות הקשת route[k] -> route[k+1] (0 בסוף המסלול הפתוח)."""
+    return matrix[route[k]][route[k + 1]] if k + 1 < len(route) else 0.0
+
+
+def best_pair_insertion(route, matrix, pickup, dropoff, loads, capacity, fixed_end=False):
+    """
+    המיקום הזול ביותר להכנסת זוג איסוף/הורדה: האיסוף אחרי route[p], ההורדה אחרי route[q] (q >= p).
+    הקיבולת נבדקת תוך כדי מעבר על q (מקסימום רץ של העומס בקטע), כך שכל מועמד עולה O(1).
+    fixed_end – route[-1] הוא יעד קבוע (נסיעה שפורסמה) ואין להוסיף אחריו.
+    מחזיר (delta, p, q) או None אם אין מיקום חוקי.
+    """
+    n = len(route)
+    last = n - 1 if fixed_end else n
+    best = None
+    for p in range(last):
+        if loads[p] + 1 > capacity:
+            continue
+        base = _edge(matrix, route, p)
+        nxt = route[p + 1] if p + 1 < n else None
+        # איסוף והורדה צמודים: route[p] -> pickup -> dropoff -> route[p+1]
+        delta = matrix[route[p]][pickup] + matrix[pickup][dropoff] - base
+        if nxt is not None:
+            delta += matrix[dropoff][nxt]
+        if best is None or delta < best[0] - EPSILON:
+            best = (delta, p, p)
+
+        pickup_delta = matrix[route[p]][pickup] - base
+        if nxt is not None:
+            pickup_delta += matrix[pickup][nxt]
+        running_max = loads[p]
+        for q in range(p + 1, last):
+            running_max = max(running_max, loads[q])
+            if running_max + 1 > capacity:
+                break
+            delta = pickup_delta + matrix[route[q]][dropoff] - _edge(matrix, route, q)
+            if q + 1 < n:
+                delta += matrix[dropoff][route[q + 1]]
+            if delta < best[0] - EPSILON:
+                best = (delta, p, q)
+    return best
+
+
+def insert_pair(route, pickup, dropoff, p, q):
+    route.insert(q + 1, dropoff)
+    route.insert(p + 1, pickup)
+
+
+def solve_pickup_delivery(matrix, pairs, capacity, max_passes=None, time_budget_ms=None):
+    """
+    מסלול איסוף-והורדה משולב: כל הורדה אחרי האיסוף שלה, ולא יותר מ-capacity נוסעים ברכב.
+    pairs – רשימת (pickup_node, dropoff_node) במטריצה; 0 = המוצא.
+    1. בנייה בהכנסה זולה ביותר (cheapest insertion) של זוגות, מהקרוב למוצא.
+    2. שיפור: הוצאת זוג והחזרתו למיקום הזול ביותר (pair relocation) עד שאין שיפור או נגמר התקציב.
+    מחזיר (רשימת nodes בלי המוצא, stats).
+    """
+    if capacity < 1:
+        raise ValueError("capacity must be at least 1")
+    started = time.monotonic()
+    deadline = started + time_budget_ms / 1000 if time_budget_ms else None
+    deltas = {}
+    for pickup, dropoff in pairs:
+        deltas[pickup] = 1
+        deltas[dropoff] = -1
+
+    route = [0]
+    for pickup, dropoff in sorted(pairs, key=lambda pair: matrix[0][pair[0]]):
+        _, p, q = best_pair_insertion(route, matrix, pickup, dropoff, route_loads(route, deltas), capacity)
+        insert_pair(route, pickup, dropoff, p, q)
+
+    initial = route_cost(route, matrix)
+    stats = {"passes": 0, "relocations": 0, "budget_exhausted": False}
+    improved = True
+    while improved and len(pairs) > 1:
+        if (max_passes is not None and stats["passes"] >= max_passes) or (
+            deadline and time.monotonic() > deadline
+        ):
+            stats["budget_exhausted"] = True
+            break
+        stats["passes"] += 1
+        improved = False
+        for pickup, dropoff in pairs:
+            if deadline and time.monotonic() > deadline:
+                break
+            current = route_cost(route, matrix)
+            trial = [node for node in route if node != pickup and node != dropoff]
+            delta, p, q = best_pair_insertion(
+                trial, matrix, pickup, dropoff, route_loads(trial, deltas), capacity
+            )
+            if route_cost(trial, matrix) + delta < current - EPSILON:
+                insert_pair(trial, pickup, dropoff, p, q)
+                route = trial
+                stats["relocations"] += 1
+                improved = True
+
+    stats["initial_cost"] = initial
+    stats["final_cost"] = route_cost(route, matrix)
+    stats["max_load"] = max(route_loads(route, deltas))
+    stats["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+    return route[1:], stats
+
+
+def schedule_route(route, durations, windows, service_s=0.0):
+    """
+    לוח זמנים למסלול (route[0] = המוצא, זמן 0). windows: node -> (open_s, close_s) בשניות מהיציאה.
+    הגעה לפני פתיחת החלון = המתנה; הגעה אחרי הסגירה = איחור.
+    מחזיר רשימה (לכל עצירה אחרי המוצא) של dict עם arrival_s / wait_s / lateness_s / departure_s.
+    """
+    schedule = []
+    clock = 0.0
+    for k in range(1, len(route)):
+        arrival = clock + durations[route[k - 1]][route[k]]
+        window = windows.get(route[k])
+        wait = lateness = 0.0
+        if window:
+            wait = max(0.0, window[0] - arrival)
+            lateness = max(0.0, arrival - window[1])
+        clock = arrival + wait + service_s
+        schedule.append({"arrival_s": arrival, "wait_s": wait, "lateness_s": lateness, "departure_s": clock})
+    return schedule
+
+
+def _schedule_state(route, durations, windows, service_s):
+    """clock[k] / late[k] = זמן היציאה מ-route[k] וסכום האיחורים עד אליו (לחישוב מחדש מאמצע המסלול)."""
+    clock = [0.0] * len(route)
+    late = [0.0] * len(route)
+    for k in range(1, len(route)):
+        arrival = clock[k - 1] + durations[route[k - 1]][route[k]]
+        window = windows.get(route[k])
+        lateness = 0.0
+        if window:
+            if arrival < window[0]:
+                arrival = window[0]
+            elif arrival > window[1]:
+                lateness = arrival - window[1]
+        clock[k] = arrival + service_s
+        late[k] = late[k - 1] + lateness
+    return clock, late
+
+
+def _tail_objective(route, start, clock, late, durations, windows, service_s, lateness_weight):
+    """מטרת המסלול כשהקידומת route[:start] זהה למסלול שעבורו חושבו clock/late."""
+    current = clock[start - 1]
+    total_late = late[start - 1]
+    for k in range(start, len(route)):
+        arrival = current + durations[route[k - 1]][route[k]]
+        window = windows.get(route[k])
+        if window:
+            if arrival < window[0]:
+                arrival = window[0]
+            elif arrival > window[1]:
+                total_late += arrival - window[1]
+        current = arrival + service_s
+    return current + lateness_weight * total_late
+
+
+def _is_feasible(route, deltas, precedence, capacity):
+    if precedence:
+        seen = set()
+        for node in route:
+            before = precedence.get(node)
+            if before is not None and before not in seen:
+                return False
+            seen.add(node)
+    if capacity is not None:
+        load = 0
+        for node in route:
+            load += deltas.get(node, 0)
+            if load > capacity:
+                return False
+    return True
+
+
+def solve_time_windows(
+    durations,
+    windows,
+    stops=None,
+    pairs=None,
+    capacity=None,
+    service_s=0.0,
+    lateness_weight=10.0,
+    max_passes=None,
+    time_budget_ms=None,
+):
+    """
+    VRP עם חלונות זמן לרכב אחד. מטרה: זמן סיום + lateness_weight * סך האיחורים (שניות).
+    stops – עצירות בלי זוגות (pickup_only); pairs – זוגות (pickup, dropoff) עם קדימות וקיבולת.
+    התחלה: הטוב מבין סדר לפי פתיחת החלון ופתרון המרחק; שיפור: העברת עצירה בודדת (relocate),
+    וכל מועמד מחושב רק מנקודת השינוי והלאה. חסום ב-max_passes / time_budget_ms.
+    מחזיר (רשימת nodes בלי המוצא, schedule של schedule_route, stats).
+    """
+    started = time.monotonic()
+    deadline = started + time_budget_ms / 1000 if time_budget_ms else None
+    pairs = list(pairs or [])
+    deltas, precedence = {}, {}
+    for pickup, dropoff in pairs:
+        deltas[pickup] = 1
+        deltas[dropoff] = -1
+        precedence[dropoff] = pickup
+
+    def window_open(node):
+        window = windows.get(node)
+        return window[0] if window else float("inf")
+
+    def objective(route):
+        clock, late = _schedule_state(route, durations, windows, service_s)
+        return clock[-1] + lateness_weight * late[-1]
+
+    candidates = []
+    if pairs:
+        # לפי זמן: כל מטופל נאסף ומורד לפני הבא – תמיד חוקי
+        by_time = sorted(pairs, key=lambda pair: window_open(pair[0]))
+        candidates.append([0] + [node for pair in by_time for node in pair])
+        candidates.append([0] + solve_pickup_delivery(durations, pairs, capacity or len(pairs))[0])
+    else:
+        stops = list(stops or [])
+        candidates.append([0] + sorted(stops, key=window_open))
+        candidates.append([0] + improve_route(nearest_neighbor_order(durations, stops), durations)[0])
+    route = min(candidates, key=objective)
+
+    initial = objective(route)
+    best = initial
+    stats = {"passes": 0, "relocations": 0, "budget_exhausted": False}
+    n = len(route)
+    improved = True
+    while improved and n > 2:
+        if (max_passes is not None and stats["passes"] >= max_passes) or (
+            deadline and time.monotonic() > deadline
+        ):
+            stats["budget_exhausted"] = True
+            break
+        stats["passes"] += 1
+        improved = False
+        clock, late = _schedule_state(route, durations, windows, service_s)
+        for i in range(1, n):
+            if deadline and time.monotonic() > deadline:
+                break
+            node = route[i]
+            rest = route[:i] + route[i + 1:]
+            for j in range(1, n):
+                if j == i:
+                    continue
+                trial = rest[:j] + [node] + rest[j:]
+                if not _is_feasible(trial, deltas, precedence, capacity):
+                    continue
+                value = _tail_objective(
+                    trial, min(i, j), clock, late, durations, windows, service_s, lateness_weight
+                )
+                if value < best - EPSILON:
+                    route, best = trial, value
+                    stats["relocations"] += 1
+                    improved = True
+                    break
+            if improved:
+                break
+        if not improved and deadline and time.monotonic() > deadline:
+            stats["budget_exhausted"] = True
+
+    schedule = schedule_route(route, durations, windows, service_s)
+    stats["initial_cost"] = initial
+    stats["final_cost"] = best
+    stats["total_lateness_s"] = sum(item["lateness_s"] for item in schedule)
+    stats["late_stops"] = sum(1 for item in schedule if item["lateness_s"] > 0)
+    stats["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+    return route[1:], schedule, stats
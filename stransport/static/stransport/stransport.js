@@ -392,7 +392,13 @@ document.addEventListener('DOMContentLoaded', function() {
 
       if (role === 'sick') {
         const key = json.suggestion_key || '';
-        const offers = Array.isArray(json.offers) ? json.offers : [];
+        let offers = Array.isArray(json.offers) ? json.offers : [];
+        // השיבוץ הגלובלי (מקומות פנויים נספרים) מוצג ראשון
+        const rec = json.recommended;
+        if (rec && rec.offer_id) {
+          offers = [{ id: rec.offer_id, raw_text: rec.raw_text, volunteer_username: rec.volunteer_username, score: rec.score }]
+            .concat(offers.filter(function(o) { return o.id !== rec.offer_id; }));
+        }
         if (!key || !offers.length) return;
         if (key === lastAutoAiKey) return;
         lastAutoAiKey = key;
@@ -404,7 +410,12 @@ document.addEventListener('DOMContentLoaded', function() {
         renderAiAgentMatches(offers);
       } else if (role === 'volunteer') {
         const key = json.suggestion_key || '';
-        const requests = Array.isArray(json.requests) ? json.requests : [];
+        let requests = Array.isArray(json.requests) ? json.requests : [];
+        const recIds = (Array.isArray(json.recommended) ? json.recommended : []).map(function(r) { return r.request_id; });
+        if (recIds.length) {
+          requests = requests.filter(function(r) { return recIds.indexOf(r.id) !== -1; })
+            .concat(requests.filter(function(r) { return recIds.indexOf(r.id) === -1; }));
+        }
         if (!key || !requests.length) return;
         if (key === lastAutoAiKey) return;
         lastAutoAiKey = key;
@@ -788,6 +799,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
   var dateEl = document.getElementById('vol-offer-date');
   var timeEl = document.getElementById('vol-offer-time');
+  var seatsEl = document.getElementById('vol-offer-seats');
   var notesEl = document.getElementById('vol-offer-notes');
   var phoneEl = document.getElementById('vol-offer-phone');
   var errorEl = document.getElementById('vol-offer-error');
@@ -830,6 +842,7 @@ document.addEventListener('DOMContentLoaded', function() {
         to: to,
         date: date,
         time: time,
+        seats: seatsEl && seatsEl.value,
         notes: notes,
         phone: phone,
         from_lat: fromLat && fromLat.value,
@@ -938,17 +951,12 @@ async function suggestRoute() {
     if (routeResults) routeResults.innerHTML = '...מחשב מסלול';
 
     try {
-      const res = await fetch('/api/route/suggest/', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken') },
-        body: JSON.stringify({
-          start_lat: startLat,
-          start_lng: startLng,
-          request_ids: validRequestIds,
-          mode,
-        }),
+      const json = await requestRoutePlan({
+        start_lat: startLat,
+        start_lng: startLng,
+        request_ids: validRequestIds,
+        mode,
       });
-      const json = await safeJson(res);
       if (json.__error || !json.success) {
         const message = json.error || 'נכשל לחשב מסלול.';
         setFieldError(routeError, message);
@@ -1153,6 +1161,109 @@ async function safeJson(res) {
   }
 }
 
+// מבקש תכנון מסלול כעבודה אסינכרונית: השרת מחזיר 202 + job_id, והתוצאה מגיעה
+// ב-WebSocket (event "route_plan") או ב-poll על status_url – מה שמגיע ראשון.
+// מחזיר JSON באותו מבנה כמו התשובה הסינכרונית של /api/route/suggest/.
+async function requestRoutePlan(body, { pollMs = 1000, timeoutMs = 60000 } = {}) {
+  const res = await fetch('/api/route/suggest/', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken') },
+    body: JSON.stringify({ ...body, async: true }),
+  });
+  const json = await safeJson(res);
+  if (res.status !== 202 || json.__error || !json.job_id) return json;
+
+  return new Promise((resolve) => {
+    let done = false;
+    let socket = null;
+    let timer = null;
+    const deadline = Date.now() + timeoutMs;
+
+    const finish = (job) => {
+      if (done) return;
+      done = true;
+      clearTimeout(timer);
+      if (socket) socket.close();
+      if (!job) {
+        resolve({ success: false, error: 'חישוב המסלול לוקח יותר מדי זמן.' });
+      } else {
+        resolve(job.result || { success: false, error: 'נכשל לחשב מסלול.' });
+      }
+    };
+
+    try {
+      const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+      socket = new WebSocket(`${scheme}://${window.location.host}/ws/requests/`);
+      socket.onmessage = (e) => {
+        try {
+          const msg = JSON.parse(e.data);
+          if (msg.event === 'route_plan' && msg.job_id === json.job_id && msg.status !== 'pending') finish(msg);
+        } catch (err) {
+          // הודעה אחרת בערוץ – מתעלמים
+        }
+      };
+    } catch (err) {
+      socket = null;
+    }
+
+    const poll = async () => {
+      if (done) return;
+      try {
+        const job = await safeJson(await fetch(json.status_url));
+        if (!job.__error && job.status && job.status !== 'pending') return finish(job);
+      } catch (err) {
+        // שגיאת רשת זמנית – ננסה שוב
+      }
+      if (Date.now() > deadline) return finish(null);
+      timer = setTimeout(poll, pollMs);
+    };
+    timer = setTimeout(poll, pollMs);
+  });
+}
+
+// עמוד אחד של feed מעומד (next_cursor); בלי cursor – העמוד הראשון
+async function fetchPage(url, cursor) {
+  const sep = url.includes('?') ? '&' : '?';
+  const res = await fetch(cursor ? url + sep + 'cursor=' + encodeURIComponent(cursor) : url);
+  return safeJson(res);
+}
+
+// "טען עוד" בסוף רשימה מעומדת: loadMore(cursor) מוסיף את העמוד הבא וקורא שוב ל-appendLoadMore.
+// נטען גם אוטומטית כשהכפתור נגלל לתצוגה.
+function appendLoadMore(container, nextCursor, loadMore) {
+  container.querySelectorAll(':scope > .load-more-wrap').forEach(el => el.remove());
+  if (!nextCursor) return;
+  const wrap = document.createElement('div');
+  wrap.className = 'load-more-wrap';
+  wrap.style.marginTop = '8px';
+  const btn = document.createElement('button');
+  btn.type = 'button';
+  btn.className = 'button load-more-btn';
+  btn.textContent = 'טען עוד';
+  let observer = null;
+  btn.onclick = async () => {
+    if (btn.disabled) return;
+    btn.disabled = true;
+    btn.textContent = '...טוען';
+    if (observer) observer.disconnect();
+    try {
+      await loadMore(nextCursor);
+    } catch (e) {
+      console.warn('loadMore', e);
+      btn.disabled = false;
+      btn.textContent = 'טען עוד';
+    }
+  };
+  wrap.appendChild(btn);
+  container.appendChild(wrap);
+  if ('IntersectionObserver' in window) {
+    observer = new IntersectionObserver(entries => {
+      if (entries.some(e => e.isIntersecting)) btn.click();
+    });
+    observer.observe(wrap);
+  }
+}
+
 // אל תאפס __placesReady/__placesInit כאן – layout.html כבר מאתחל, ואיפוס אחרי טעינת Google יבטל את החיפוש
 if (typeof window.__placesReady === 'undefined') window.__placesReady = false;
 if (typeof window.__placesInit === 'undefined') window.__placesInit = null;
@@ -1653,6 +1764,7 @@ function runAppInit() {
   let routeLine = null;
   let routeStartMarker = null;
   const selectedRouteIds = new Set();
+  const MAX_ROUTE_STOPS = 50;
   const requestMeta = new Map();
   let patientLiveInterval = null;
   let patientLiveSetupTimer = null;
@@ -2860,8 +2972,8 @@ function hidePanel(el) {
     if (!patientMap) initPatientMap();
 
     try {
-      const res = await fetch('/api/requests/closed/' + (guestMode ? guestSimpleQuery : ''));
-      const json = await safeJson(res);
+      // רק העמוד הראשון (החדשות ביותר) – הבדיקה רצה כל דקה
+      const json = await fetchPage('/api/requests/closed/' + (guestMode ? guestSimpleQuery : ''));
       if (json.__error || !Array.isArray(json.requests)) return;
 
       const now = new Date();
@@ -3204,6 +3316,164 @@ function hidePanel(el) {
     }
   }
 
+  let openRequestsGen = 0;
+  let openRequestsShown = [];
+
+  function filterOpenRequests(requests) {
+    return requests.filter(r =>
+      role === 'volunteer' ? r.status === 'open' : r.status === 'open' || r.status === 'accepted'
+    );
+  }
+
+  function renderOpenRequestCard(r) {
+    const expired = isRequestExpired(r);
+    const card = document.createElement('div');
+    card.className = 'request-card ' + (r.status === 'open' ? 'open' : r.status);
+    if (expired) card.classList.add('request-expired');
+
+    const hasPickupCoords = isInsideIsrael(Number(r.pickup_lat), Number(r.pickup_lng));
+    const hasDestCoords = isInsideIsrael(Number(r.dest_lat), Number(r.dest_lng));
+    requestMeta.set(r.id, { hasPickupCoords, hasDestCoords });
+
+    let volHtml = '';
+    if (r.volunteer) {
+      volHtml = `<div class="volunteer-info">מתנדב: ${r.volunteer.username} — ${r.volunteer.phone || '-'}<\/div>`;
+    } else if (r.no_volunteers_available) {
+      volHtml = `<div class="volunteer-info no-volunteers">אין מתנדבים זמינים<\/div>`;
+    }
+    const expiredMsgHtml = expired
+      ? '<div class="request-expired-msg">התאריך חלף – הבקשה תימחק למחרת<\/div>'
+      : '';
+
+    card.innerHTML = `
+      <div class="request-info">
+        <div class="route">${formatRoute(r.pickup, r.destination)}<\/div>
+        <div class="status">${r.requested_time} · ${r.status_display}<\/div>
+        <div style="margin-top:6px">הערות: ${r.notes || '-'}<\/div>
+        <div style="margin-top:6px">טלפון מטופל: ${r.phone || '-'}<\/div>
+        ${volHtml}
+        ${expiredMsgHtml}
+      <\/div>
+    `;
+
+    // מטופל: ביטול + עריכה (חסומים אם התאריך חלף)
+    if (role === 'sick' && r.status === 'open' && Number(r.sick_id) === Number(window.currentUserId) && !expired) {
+      const cancelBtn = document.createElement('button');
+      cancelBtn.className = 'button';
+      cancelBtn.textContent = 'בטל';
+      cancelBtn.onclick = async () => {
+        if (!confirm('לבטל את הבקשה?')) return;
+        const res = await fetch(`/api/requests/cancel/${r.id}/`, {
+          method: 'POST',
+          headers: { 'X-CSRFToken': getCookie('csrftoken') },
+        });
+        const json = await res.json().catch(() => ({}));
+        if (json.error) alert(json.error);
+        loadOpenRequests();
+      };
+
+      const editBtn = document.createElement('button');
+      editBtn.className = 'button';
+      editBtn.textContent = 'ערוך';
+      editBtn.onclick = () => openEditModal(r);
+
+      card.appendChild(cancelBtn);
+      card.appendChild(editBtn);
+    }
+
+    // מתנדב: קבל + דחה + בחירה למסלול (חסומים אם התאריך חלף)
+    if (role === 'volunteer' && r.status === 'open') {
+      const routeWrap = document.createElement('div');
+      routeWrap.style.marginTop = '8px';
+      const checkbox = document.createElement('input');
+      checkbox.type = 'checkbox';
+      checkbox.className = 'route-select';
+      checkbox.dataset.requestId = r.id;
+      if (!hasPickupCoords || expired) {
+        checkbox.disabled = true;
+      }
+      checkbox.checked = selectedRouteIds.has(r.id);
+      checkbox.addEventListener('change', e => {
+        if (e.target.checked) {
+          if (selectedRouteIds.size >= MAX_ROUTE_STOPS) {
+            e.target.checked = false;
+            alert(`אפשר לבחור עד ${MAX_ROUTE_STOPS} בקשות.`);
+            return;
+          }
+          selectedRouteIds.add(r.id);
+        } else {
+          selectedRouteIds.delete(r.id);
+        }
+        // Selection changed → any previously suggested route is no longer valid
+        clearRouteUI();
+        updateRouteButtonState();
+      });
+
+      const label = document.createElement('label');
+      label.style.marginRight = '6px';
+      label.textContent = expired ? 'התאריך חלף' : (!hasPickupCoords ? 'חסרות קואורדינטות לאיסוף' : 'בחר למסלול');
+      label.prepend(checkbox);
+      routeWrap.appendChild(label);
+      card.appendChild(routeWrap);
+
+      const acceptBtn = document.createElement('button');
+      acceptBtn.className = 'accept-btn';
+      acceptBtn.textContent = 'קבל';
+      acceptBtn.disabled = guestMode || !!expired;
+      acceptBtn.onclick = async () => {
+        if (guestMode) return;
+        const res = await fetch(`/api/requests/accept/${r.id}/`, {
+          method: 'POST',
+          headers: { 'X-CSRFToken': getCookie('csrftoken') },
+        });
+        const json = await res.json().catch(() => ({}));
+        if (json.error) alert(json.error);
+        loadOpenRequests();
+      };
+
+      const rejectBtn = document.createElement('button');
+      rejectBtn.className = 'button';
+      rejectBtn.textContent = 'דחה';
+      rejectBtn.disabled = guestMode || !!expired;
+      rejectBtn.onclick = async () => {
+        if (guestMode) return;
+        const res = await fetch(`/api/requests/reject/${r.id}/`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken') },
+          body: JSON.stringify({ reason: '' }),
+        });
+        const json = await res.json().catch(() => ({}));
+        if (json.error) alert(json.error);
+        loadOpenRequests();
+      };
+      card.appendChild(acceptBtn);
+      card.appendChild(rejectBtn);
+    }
+
+    return card;
+  }
+
+  function appendOpenRequests(reqs) {
+    reqs.forEach(r => requestsContainer.appendChild(renderOpenRequestCard(r)));
+    openRequestsShown = openRequestsShown.concat(reqs);
+    if (role === 'volunteer') {
+      updateMapMarkers(openRequestsShown);
+    }
+  }
+
+  async function loadMoreOpenRequests(url, cursor, gen) {
+    const json = await fetchPage(url, cursor);
+    // הרשימה רועננה בינתיים – העמוד הזה כבר לא רלוונטי
+    if (gen !== openRequestsGen) return;
+    if (json.__error || !Array.isArray(json.requests)) throw new Error('Failed to load requests page');
+    const reqs = filterOpenRequests(json.requests);
+    if (reqs.length > 0) {
+      requestsContainer.querySelectorAll(':scope > .no-requests').forEach(el => el.remove());
+    }
+    appendOpenRequests(reqs);
+    appendLoadMore(requestsContainer, json.next_cursor, next => loadMoreOpenRequests(url, next, gen));
+  }
+
   async function loadOpenRequests() {
     if (!requestsContainer) return;
     // Guest sick: no requests should be shown at all (they are not "the logged-in patient").
@@ -3212,11 +3482,14 @@ function hidePanel(el) {
         '<div class="field-hint" style="margin-top:8px;">בדמו אורח-מטופל: אין בקשות להצגה.</div>';
       return;
     }
+    const gen = ++openRequestsGen;
     try {
       selectedRouteIds.clear();
       requestMeta.clear();
-      const res = await fetch('/api/requests/' + (guestMode ? guestRequestsQuery : ''));
-      const json = await safeJson(res);
+      // גם בריענון התקופתי – רק העמוד הראשון; עמודים נוספים דרך "טען עוד"
+      const url = '/api/requests/' + (guestMode ? guestRequestsQuery : '');
+      const json = await fetchPage(url);
+      if (gen !== openRequestsGen) return;
       if (json.__error) {
         requestsContainer.innerHTML = '<p class="no-requests">שגיאת שרת. נסה להתחבר מחדש.</p>';
         return;
@@ -3227,151 +3500,16 @@ function hidePanel(el) {
         return;
       }
 
-      const reqs = json.requests.filter(r =>
-        role === 'volunteer' ? r.status === 'open' : r.status === 'open' || r.status === 'accepted'
-      );
+      const reqs = filterOpenRequests(json.requests);
 
       requestsContainer.innerHTML = '';
+      openRequestsShown = [];
 
       if (reqs.length === 0) {
         requestsContainer.innerHTML = '<p class="no-requests">אין בקשות פתוחות.</p>';
-        if (role === 'volunteer') {
-          updateMapMarkers([]);
-        }
-        return;
-      }
-
-      reqs.forEach(r => {
-        const expired = isRequestExpired(r);
-        const card = document.createElement('div');
-        card.className = 'request-card ' + (r.status === 'open' ? 'open' : r.status);
-        if (expired) card.classList.add('request-expired');
-
-        const hasPickupCoords = isInsideIsrael(Number(r.pickup_lat), Number(r.pickup_lng));
-        const hasDestCoords = isInsideIsrael(Number(r.dest_lat), Number(r.dest_lng));
-        requestMeta.set(r.id, { hasPickupCoords, hasDestCoords });
-
-        let volHtml = '';
-        if (r.volunteer) {
-          volHtml = `<div class="volunteer-info">מתנדב: ${r.volunteer.username} — ${r.volunteer.phone || '-'}<\/div>`;
-        } else if (r.no_volunteers_available) {
-          volHtml = `<div class="volunteer-info no-volunteers">אין מתנדבים זמינים<\/div>`;
-        }
-        const expiredMsgHtml = expired
-          ? '<div class="request-expired-msg">התאריך חלף – הבקשה תימחק למחרת<\/div>'
-          : '';
-
-        card.innerHTML = `
-          <div class="request-info">
-            <div class="route">${formatRoute(r.pickup, r.destination)}<\/div>
-            <div class="status">${r.requested_time} · ${r.status_display}<\/div>
-            <div style="margin-top:6px">הערות: ${r.notes || '-'}<\/div>
-            <div style="margin-top:6px">טלפון מטופל: ${r.phone || '-'}<\/div>
-            ${volHtml}
-            ${expiredMsgHtml}
-          <\/div>
-        `;
-
-        // מטופל: ביטול + עריכה (חסומים אם התאריך חלף)
-        if (role === 'sick' && r.status === 'open' && Number(r.sick_id) === Number(window.currentUserId) && !expired) {
-          const cancelBtn = document.createElement('button');
-          cancelBtn.className = 'button';
-          cancelBtn.textContent = 'בטל';
-          cancelBtn.onclick = async () => {
-            if (!confirm('לבטל את הבקשה?')) return;
-            const res = await fetch(`/api/requests/cancel/${r.id}/`, {
-              method: 'POST',
-              headers: { 'X-CSRFToken': getCookie('csrftoken') },
-            });
-            const json = await res.json().catch(() => ({}));
-            if (json.error) alert(json.error);
-            loadOpenRequests();
-          };
-
-          const editBtn = document.createElement('button');
-          editBtn.className = 'button';
-          editBtn.textContent = 'ערוך';
-          editBtn.onclick = () => openEditModal(r);
-
-          card.appendChild(cancelBtn);
-          card.appendChild(editBtn);
-        }
-
-        // מתנדב: קבל + דחה + בחירה למסלול (חסומים אם התאריך חלף)
-        if (role === 'volunteer' && r.status === 'open') {
-          const routeWrap = document.createElement('div');
-          routeWrap.style.marginTop = '8px';
-          const checkbox = document.createElement('input');
-          checkbox.type = 'checkbox';
-          checkbox.className = 'route-select';
-          checkbox.dataset.requestId = r.id;
-          if (!hasPickupCoords || expired) {
-            checkbox.disabled = true;
-          }
-          checkbox.checked = selectedRouteIds.has(r.id);
-          checkbox.addEventListener('change', e => {
-            if (e.target.checked) {
-              if (selectedRouteIds.size >= 6) {
-                e.target.checked = false;
-                alert('אפשר לבחור עד 6 בקשות.');
-                return;
-              }
-              selectedRouteIds.add(r.id);
-            } else {
-              selectedRouteIds.delete(r.id);
-            }
-            // Selection changed → any previously suggested route is no longer valid
-            clearRouteUI();
-            updateRouteButtonState();
-          });
-
-          const label = document.createElement('label');
-          label.style.marginRight = '6px';
-          label.textContent = expired ? 'התאריך חלף' : (!hasPickupCoords ? 'חסרות קואורדינטות לאיסוף' : 'בחר למסלול');
-          label.prepend(checkbox);
-          routeWrap.appendChild(label);
-          card.appendChild(routeWrap);
-
-          const acceptBtn = document.createElement('button');
-          acceptBtn.className = 'accept-btn';
-          acceptBtn.textContent = 'קבל';
-          acceptBtn.disabled = guestMode || !!expired;
-          acceptBtn.onclick = async () => {
-            if (guestMode) return;
-            const res = await fetch(`/api/requests/accept/${r.id}/`, {
-              method: 'POST',
-              headers: { 'X-CSRFToken': getCookie('csrftoken') },
-            });
-            const json = await res.json().catch(() => ({}));
-            if (json.error) alert(json.error);
-            loadOpenRequests();
-          };
-
-          const rejectBtn = document.createElement('button');
-          rejectBtn.className = 'button';
-          rejectBtn.textContent = 'דחה';
-          rejectBtn.disabled = guestMode || !!expired;
-          rejectBtn.onclick = async () => {
-            if (guestMode) return;
-            const res = await fetch(`/api/requests/reject/${r.id}/`, {
-              method: 'POST',
-              headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken') },
-              body: JSON.stringify({ reason: '' }),
-            });
-            const json = await res.json().catch(() => ({}));
-            if (json.error) alert(json.error);
-            loadOpenRequests();
-          };
-          card.appendChild(acceptBtn);
-          card.appendChild(rejectBtn);
-        }
-
-        requestsContainer.appendChild(card);
-      });
-
-      if (role === 'volunteer') {
-        updateMapMarkers(reqs);
       }
+      appendOpenRequests(reqs);
+      appendLoadMore(requestsContainer, json.next_cursor, cursor => loadMoreOpenRequests(url, cursor, gen));
 
     } catch (err) {
       console.error(err);
@@ -3449,17 +3587,12 @@ function hidePanel(el) {
     if (routeResults) routeResults.innerHTML = '...מחשב מסלול';
 
     try {
-      const res = await fetch('/api/route/suggest/', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken') },
-        body: JSON.stringify({
-          start_lat: startLat,
-          start_lng: startLng,
-          request_ids: validRequestIds,
-          mode,
-        }),
+      const json = await requestRoutePlan({
+        start_lat: startLat,
+        start_lng: startLng,
+        request_ids: validRequestIds,
+        mode,
       });
-      const json = await safeJson(res);
       if (json.__error || !json.success) {
         const message = json.error || 'נכשל לחשב מסלול.';
         setFieldError(routeError, message);
@@ -3561,6 +3694,39 @@ function hidePanel(el) {
     }
   }
 
+  let closedRequestsGen = 0;
+
+  function renderClosedRequestCard(r) {
+    const expired = isRequestExpired(r);
+    const card = document.createElement('div');
+    card.className = 'request-card closed' + (expired ? ' request-expired' : '');
+    const volHtml = r.volunteer
+      ? `<div class="volunteer-info">מתנדב: ${r.volunteer.username} — ${r.volunteer.phone || '-'}<\/div>`
+      : '';
+    const expiredMsgHtml = expired
+      ? '<div class="request-expired-msg">התאריך חלף – הבקשה תימחק למחרת<\/div>'
+      : '';
+    card.innerHTML = `
+      <div class="request-info">
+        <div class="route">${formatRoute(r.pickup, r.destination)}<\/div>
+        <div class="status">${r.requested_time} · ${r.status_display}<\/div>
+        <div style="margin-top:6px">הערות: ${r.notes || '-'}<\/div>
+        <div style="margin-top:6px">טלפון מטופל: ${r.phone || '-'}<\/div>
+        ${volHtml}
+        ${expiredMsgHtml}
+      <\/div>
+    `;
+    return card;
+  }
+
+  async function loadMoreClosedRequests(cursor, gen) {
+    const json = await fetchPage('/api/requests/closed/', cursor);
+    if (gen !== closedRequestsGen) return;
+    if (json.__error || !Array.isArray(json.requests)) throw new Error('Failed to load closed requests page');
+    json.requests.forEach(r => closedContainer.appendChild(renderClosedRequestCard(r)));
+    appendLoadMore(closedContainer, json.next_cursor, next => loadMoreClosedRequests(next, gen));
+  }
+
   async function loadClosedRequests() {
     if (!closedContainer) return;
 
@@ -3576,10 +3742,11 @@ function hidePanel(el) {
     }
 
     closedContainer.innerHTML = '<p>...טוען בקשות סגורות</p>';
+    const gen = ++closedRequestsGen;
 
     try {
-      const res = await fetch('/api/requests/closed/');
-      const json = await safeJson(res);
+      const json = await fetchPage('/api/requests/closed/');
+      if (gen !== closedRequestsGen) return;
       if (json.__error) {
         closedContainer.innerHTML = '<p class="no-requests">שגיאת שרת. נסה להתחבר מחדש.</p>';
         return;
@@ -3598,28 +3765,8 @@ function hidePanel(el) {
         return;
       }
 
-      reqs.forEach(r => {
-        const expired = isRequestExpired(r);
-        const card = document.createElement('div');
-        card.className = 'request-card closed' + (expired ? ' request-expired' : '');
-        const volHtml = r.volunteer
-          ? `<div class="volunteer-info">מתנדב: ${r.volunteer.username} — ${r.volunteer.phone || '-'}<\/div>`
-          : '';
-        const expiredMsgHtml = expired
-          ? '<div class="request-expired-msg">התאריך חלף – הבקשה תימחק למחרת<\/div>'
-          : '';
-        card.innerHTML = `
-          <div class="request-info">
-            <div class="route">${formatRoute(r.pickup, r.destination)}<\/div>
-            <div class="status">${r.requested_time} · ${r.status_display}<\/div>
-            <div style="margin-top:6px">הערות: ${r.notes || '-'}<\/div>
-            <div style="margin-top:6px">טלפון מטופל: ${r.phone || '-'}<\/div>
-            ${volHtml}
-            ${expiredMsgHtml}
-          <\/div>
-        `;
-        closedContainer.appendChild(card);
-      });
+      reqs.forEach(r => closedContainer.appendChild(renderClosedRequestCard(r)));
+      appendLoadMore(closedContainer, json.next_cursor, cursor => loadMoreClosedRequests(cursor, gen));
 
       if (requestsContainer) hidePanel(requestsContainer);
     } catch (err) {
@@ -3690,9 +3837,9 @@ function hidePanel(el) {
         checkbox.checked = selectedRouteIds.has(r.id);
         checkbox.addEventListener('change', e => {
           if (e.target.checked) {
-            if (selectedRouteIds.size >= 6) {
+            if (selectedRouteIds.size >= MAX_ROUTE_STOPS) {
               e.target.checked = false;
-              alert('אפשר לבחור עד 6 בקשות.');
+              alert(`אפשר לבחור עד ${MAX_ROUTE_STOPS} בקשות.`);
               return;
             }
             selectedRouteIds.add(r.id);
@@ -1,11 +1,13 @@
 import logging
+import time
 from datetime import timedelta
 
 from celery import shared_task
 from django.conf import settings
+from django.db import models
 from django.utils import timezone
 
-from .models import TransportRequest
+from .models import RequestOfferMatch, RouteJob, RouteMatrixCell, TransportRequest, expired_requests_q
 
 logger = logging.getLogger(__name__)
 
@@ -19,15 +21,130 @@ def notify_new_request(request_id):
 def auto_cancel_stale_requests():
     minutes = int(getattr(settings, "STALE_REQUEST_MINUTES", 30))
     cutoff = timezone.now() - timedelta(minutes=minutes)
-    updated = TransportRequest.objects.filter(
-        status="open",
-        created_at__lt=cutoff,
-    ).update(status="cancelled", cancel_reason="stale")
+    stale_ids = list(
+        TransportRequest.objects.filter(status="open", created_at__lt=cutoff).values_list("id", flat=True)
+    )
+    updated = TransportRequest.objects.filter(id__in=stale_ids, status="open").update(
+        status="cancelled", cancel_reason="stale", updated_at=timezone.now()
+    )
+    # update() לא עובר ב-save – מסירים את ההתאמות של הבקשות שבוטלו
+    RequestOfferMatch.objects.filter(request_id__in=stale_ids).delete()
     if updated:
         logger.info("Auto-cancelled %s stale requests", updated)
     return updated
 
 
+@shared_task
+def purge_expired_requests(batch_size=None, max_batches=None):
+    """
+    מחיקת בקשות שפג תוקפן (ראה expired_requests_q) במנות חסומות לפי id,
+    כך שכל טרנזקציה קצרה ונקודות הקריאה לא מבצעות מחיקות.
+    מחזיר מדדים: כמה נמחקו, כמה מנות, משך ריצה והאם נשארו שורות לריצה הבאה.
+    """
+    batch_size = int(batch_size or getattr(settings, "EXPIRED_PURGE_BATCH_SIZE", 500))
+    max_batches = int(max_batches or getattr(settings, "EXPIRED_PURGE_MAX_BATCHES", 20))
+    started = time.monotonic()
+    now = timezone.now()
+    expired = TransportRequest.objects.filter(expired_requests_q(now)).order_by("id")
+
+    deleted = 0
+    batches = 0
+    last_id = 0
+    has_more = False
+    while batches < max_batches:
+        ids = list(expired.filter(id__gt=last_id).values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+        TransportRequest.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+        batches += 1
+        last_id = ids[-1]
+        if len(ids) < batch_size:
+            break
+    else:
+        has_more = expired.filter(id__gt=last_id).exists()
+
+    metrics = {
+        "deleted": deleted,
+        "batches": batches,
+        "duration_ms": round((time.monotonic() - started) * 1000, 1),
+        "has_more": has_more,
+    }
+    if deleted:
+        logger.info("purge_expired_requests: %s", metrics)
+    return metrics
+
+
+@shared_task
+def prune_route_matrix_cache():
+    """
+    פינוי מטמון מטריצת OSRM: תאים ישנים מ-OSRM_CACHE_TTL_SECONDS, ואז הישנים ביותר מעבר ל-OSRM_CACHE_MAX_CELLS.
+    """
+    ttl = int(getattr(settings, "OSRM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+    max_cells = int(getattr(settings, "OSRM_CACHE_MAX_CELLS", 200000))
+    expired, _ = RouteMatrixCell.objects.filter(fetched_at__lt=timezone.now() - timedelta(seconds=ttl)).delete()
+
+    overflow = 0
+    # התא החדש ביותר שחורג מהתקרה – ממנו והלאה (ישנים יותר) נמחק
+    boundary = list(
+        RouteMatrixCell.objects.order_by("-fetched_at", "-id").values_list("fetched_at", "id")[max_cells:max_cells + 1]
+    )
+    if boundary:
+        fetched_at, pk = boundary[0]
+        overflow, _ = RouteMatrixCell.objects.filter(
+            models.Q(fetched_at__lt=fetched_at) | models.Q(fetched_at=fetched_at, id__lte=pk)
+        ).delete()
+
+    if expired or overflow:
+        logger.info("prune_route_matrix_cache: expired=%s overflow=%s", expired, overflow)
+    return {"expired": expired, "overflow": overflow}
+
+
+@shared_task
+def prune_route_jobs():
+    """מחיקת עבודות תכנון מסלול ישנות מ-ROUTE_JOB_TTL_SECONDS (התוצאה כבר נדחפה או פגה)."""
+    ttl = int(getattr(settings, "ROUTE_JOB_TTL_SECONDS", 900))
+    deleted, _ = RouteJob.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=ttl)).delete()
+    if deleted:
+        logger.info("prune_route_jobs: deleted=%s", deleted)
+    return {"deleted": deleted}
+
+
+@shared_task
+def run_dispatch_optimizer():
+    """הרצה מלאה של ה-dispatch optimizer (ראו dispatch.py) – מחליפה את כל הצעות השיבוץ."""
+    from .dispatch import run_dispatch
+
+    stats = run_dispatch()
+    logger.info("run_dispatch_optimizer: %s", stats)
+    return stats
+
+
+@shared_task
+def dispatch_request_changed(request_id):
+    """עדכון אינקרמנטלי של הצעות השיבוץ אחרי יצירה/ביטול/תפיסה של בקשה."""
+    from .dispatch import dispatch_request_changed as update
+
+    return update(request_id)
+
+
+@shared_task
+def refresh_matches(kind, object_id):
+    """ניקוד מחדש של הזוגות של בקשה/הצעה בטבלת ההתאמות (נשלח מ-save דרך enqueue_match_refresh)."""
+    from .matching import refresh_matches_for
+
+    return refresh_matches_for(kind, object_id)
+
+
+@shared_task
+def plan_route_job(job_id, data):
+    """עבודת תכנון מסלול אסינכרונית (suggest_route_api עם async) – התוצאה ב-RouteJob וב-WebSocket."""
+    from .views import run_route_job
+
+    job = run_route_job(job_id, data)
+    return {"job_id": job_id, "status": job.status}
+
+
 @shared_task
 def generate_ai_summary(request_id):
     try:
@@ -46,6 +163,6 @@ def generate_ai_summary(request_id):
         summary = f"Stub summary: {notes[:200]}"
 
     req.ai_summary = summary
-    req.save(update_fields=["ai_summary"])
+    req.save(update_fields=["ai_summary", "updated_at"])
     logger.info("Generated AI summary for request %s", request_id)
     return summary
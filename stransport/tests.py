@@ -1,13 +1,47 @@
 import json
+import math
+import random
+from contextlib import contextmanager
 from datetime import timedelta
-from unittest.mock import patch
+from io import StringIO
+from unittest.mock import Mock, patch
 
+import numpy as np
 from django.contrib.auth.models import User
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import connection, models
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
-from .models import Profile, TransportAssignment, TransportRequest, TransportRejection
+from .models import (
+    DispatchProposal,
+    Profile,
+    RequestOfferMatch,
+    RideOffer,
+    RouteJob,
+    RouteMatrixCell,
+    TransportAssignment,
+    TransportRequest,
+    TransportRejection,
+)
+from . import (
+    ai_matching,
+    assignment,
+    dispatch,
+    geo,
+    geocoding,
+    http_client,
+    matching,
+    osrm,
+    road_graph,
+    route_bench,
+    route_optimizer,
+    tasks,
+)
+from .tasks import prune_route_jobs, prune_route_matrix_cache, purge_expired_requests
+from .views import run_route_job, serialize_request, serialize_request_values, serializer_queryset
 
 
 class TransportAppTests(TestCase):
@@ -35,6 +69,28 @@ class TransportAppTests(TestCase):
             notes="urgent",
         )
 
+    @contextmanager
+    def refreshing_matches(self):
+        """מריץ בתוך הבדיקה את ניקוד טבלת ההתאמות שנשלח ל-worker אחרי ה-commit."""
+        with patch("stransport.tasks.refresh_matches.delay", side_effect=tasks.refresh_matches):
+            with self.captureOnCommitCallbacks(execute=True):
+                yield
+
+    def assertConstantQueryCount(self, url, add_rows, sizes=(1, 5)):
+        """
+        מוודא שמספר השאילתות של endpoint לא תלוי בגודל הרשימה (ללא N+1).
+        add_rows(n) יוצר n שורות נוספות לפני כל מדידה.
+        """
+        counts = []
+        for n in sizes:
+            add_rows(n)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertGreaterEqual(len(response.json()["requests"]), n)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(len(set(counts)), 1, f"query count grows with list size: {counts}")
+
     def test_home_page_requires_login(self):
         response = self.client.get(reverse("home"))
         self.assertEqual(response.status_code, 302)
@@ -198,3 +254,1403 @@ class TransportAppTests(TestCase):
         data = response.json()
         self.assertEqual(len(data["google_legs"]), 10)
         self.assertEqual(data["warning"], "Too many stops. Limited to 10.")
+
+    def test_requests_api_filters_expired_without_deleting(self):
+        expired = self.create_request()
+        expired.requested_time = timezone.now() - timedelta(hours=2)
+        expired.save()
+        live = self.create_request()
+        self.login_volunteer()
+        response = self.client.get(reverse("requests_api"))
+        self.assertEqual(response.status_code, 200)
+        ids = [r["id"] for r in response.json()["requests"]]
+        self.assertEqual(ids, [live.id])
+        self.assertTrue(TransportRequest.objects.filter(id=expired.id).exists())
+
+    def test_purge_expired_requests_deletes_in_batches(self):
+        now = timezone.now()
+        for _ in range(5):
+            TransportRequest.objects.create(
+                sick=self.sick_user,
+                pickup_address="Home",
+                destination="Hospital",
+                requested_time=now - timedelta(hours=3),
+            )
+        recent_cancel = TransportRequest.objects.create(
+            sick=self.sick_user,
+            pickup_address="Home",
+            destination="Hospital",
+            requested_time=now - timedelta(hours=3),
+            status="cancelled",
+            cancelled_at=now - timedelta(hours=1),
+        )
+        live = self.create_request()
+
+        metrics = purge_expired_requests(batch_size=2)
+        self.assertEqual(metrics["deleted"], 5)
+        self.assertEqual(metrics["batches"], 3)
+        self.assertFalse(metrics["has_more"])
+        self.assertEqual(
+            set(TransportRequest.objects.values_list("id", flat=True)),
+            {recent_cancel.id, live.id},
+        )
+
+        metrics = purge_expired_requests(batch_size=1, max_batches=1)
+        self.assertEqual(metrics["deleted"], 0)
+
+    def test_list_endpoints_query_count_is_constant(self):
+        def add_open(n):
+            for _ in range(n):
+                self.create_request()
+
+        def add_accepted(n):
+            for _ in range(n):
+                req = self.create_request()
+                req.status = "accepted"
+                req.save()
+                TransportAssignment.objects.create(request=req, volunteer=self.volunteer_user)
+
+        self.login_volunteer()
+        self.assertConstantQueryCount(reverse("requests_api"), add_open)
+        self.assertConstantQueryCount(reverse("accepted_requests_api"), add_accepted)
+        self.client.logout()
+        self.login_sick()
+        self.assertConstantQueryCount(reverse("closed_requests_api"), add_accepted)
+
+    def test_values_serializer_matches_model_serializer(self):
+        open_req = self.create_request()
+        accepted = self.create_request()
+        accepted.status = "accepted"
+        accepted.save()
+        TransportAssignment.objects.create(request=accepted, volunteer=self.volunteer_user)
+        cancelled = self.create_request()
+        cancelled.status = "cancelled"
+        cancelled.no_volunteers_available = True
+        cancelled.save()
+
+        qs = TransportRequest.objects.filter(id__in=[open_req.id, accepted.id, cancelled.id]).order_by("id")
+        expected = [serialize_request(r) for r in serializer_queryset(qs)]
+        self.assertEqual(serialize_request_values(qs), expected)
+
+    def test_explain_feeds_command_covers_endpoints(self):
+        out = StringIO()
+        call_command("explain_feeds", stdout=out)
+        output = out.getvalue()
+        for label in ("requests_api (volunteer)", "accepted_requests_api", "closed_requests_api", "purge_expired_requests"):
+            self.assertIn(label, output)
+
+    def test_requests_api_cursor_pagination(self):
+        created = [self.create_request() for _ in range(5)]
+        self.login_volunteer()
+        seen = []
+        cursor = None
+        pages = 0
+        while True:
+            params = {"page_size": 2}
+            if cursor:
+                params["cursor"] = cursor
+            data = self.client.get(reverse("requests_api"), params).json()
+            self.assertLessEqual(len(data["requests"]), 2)
+            seen.extend(r["id"] for r in data["requests"])
+            pages += 1
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(seen, [r.id for r in reversed(created)])
+
+    def test_closed_requests_api_paginates_in_requested_time_order(self):
+        now = timezone.now()
+        reqs = []
+        for hours in (3, 1, 2):
+            r = self.create_request()
+            r.requested_time = now + timedelta(hours=hours)
+            r.status = "cancelled"
+            r.cancelled_at = now
+            r.save()
+            reqs.append(r)
+        self.login_sick()
+        first = self.client.get(reverse("closed_requests_api"), {"page_size": 2}).json()
+        second = self.client.get(
+            reverse("closed_requests_api"), {"page_size": 2, "cursor": first["next_cursor"]}
+        ).json()
+        self.assertEqual(
+            [r["id"] for r in first["requests"] + second["requests"]],
+            [reqs[1].id, reqs[2].id, reqs[0].id],
+        )
+        self.assertIsNone(second["next_cursor"])
+
+    def test_requests_api_returns_304_when_feed_unchanged(self):
+        req = self.create_request()
+        self.login_volunteer()
+        first = self.client.get(reverse("requests_api"))
+        etag = first["ETag"]
+        self.assertTrue(etag)
+
+        with patch("stransport.views.serialize_request_values") as mock_serialize:
+            again = self.client.get(reverse("requests_api"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(again.status_code, 304)
+        mock_serialize.assert_not_called()
+
+        req.notes = "changed"
+        req.save()
+        changed = self.client.get(reverse("requests_api"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+
+    def test_auto_suggestions_etag_uses_suggestion_key(self):
+        self.create_request()
+        RideOffer.objects.create(
+            volunteer=self.volunteer_user,
+            raw_text="ride",
+            parsed_from="Home",
+            parsed_to="Hospital",
+        )
+        self.login_sick()
+        first = self.client.get(reverse("ai_auto_suggestions_api"))
+        data = first.json()
+        self.assertTrue(first["ETag"].startswith('"' + data["suggestion_key"] + ":"))
+
+        with patch("stransport.views._sick_suggestions") as mock_suggest:
+            again = self.client.get(reverse("ai_auto_suggestions_api"), HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        mock_suggest.assert_not_called()
+
+    def test_geo_cells_follow_coordinates_on_save(self):
+        req = self.create_request()
+        self.assertEqual((req.pickup_cell, req.dest_cell), ("", ""))
+        req.pickup_lat, req.pickup_lng = 32.0853, 34.7818
+        req.save(update_fields=["pickup_lat", "pickup_lng"])
+        req.refresh_from_db()
+        self.assertEqual(req.pickup_cell, geo.geohash_encode(32.0853, 34.7818))
+        offer = RideOffer.objects.create(volunteer=self.volunteer_user, raw_text="ride", to_lat=31.7683, to_lng=35.2137)
+        self.assertEqual(RideOffer.objects.get(pk=offer.pk).to_cell, geo.geohash_encode(31.7683, 35.2137))
+
+    def test_offer_departure_at_is_normalised_on_save(self):
+        when = timezone.localtime(timezone.now() + timedelta(days=1)).replace(second=0, microsecond=0)
+        parsed = RideOffer.objects.create(
+            volunteer=self.volunteer_user, raw_text="ride", parsed_date=when.date(), parsed_time=when.time()
+        )
+        self.assertEqual(parsed.departure_at, when)
+        from_text = RideOffer.objects.create(
+            volunteer=self.volunteer_user,
+            raw_text=f"נסיעה עתידית מ-A אל B בתאריך {when:%Y-%m-%d} בשעה {when:%H:%M}",
+        )
+        self.assertEqual(RideOffer.objects.get(pk=from_text.pk).departure_at, when)
+        self.assertIsNone(RideOffer.objects.create(volunteer=self.volunteer_user, raw_text="soon").departure_at)
+
+        from_text.raw_text = "no date"
+        from_text.save(update_fields=["raw_text"])
+        self.assertIsNone(RideOffer.objects.get(pk=from_text.pk).departure_at)
+        self.assertEqual(RideOffer.objects.filter(departure_at=when).count(), 1)
+
+    def test_sick_suggestions_find_offers_in_time_window_from_the_index(self):
+        with self.refreshing_matches():
+            req = self.create_request()
+        when = timezone.localtime(req.requested_time + timedelta(minutes=30))
+        with self.refreshing_matches():
+            timed = RideOffer.objects.create(
+                volunteer=self.volunteer_user, raw_text="x", parsed_date=when.date(), parsed_time=when.time()
+            )
+            for i in range(35):
+                RideOffer.objects.create(volunteer=self.volunteer_user, raw_text=f"later {i}",
+                                         parsed_date=(when + timedelta(days=3)).date(), parsed_time=when.time())
+        self.login_sick()
+        offers = self.client.get(reverse("ai_auto_suggestions_api")).json()["offers"]
+        self.assertEqual([o["id"] for o in offers], [timed.id])
+
+    def test_suggestions_find_nearby_items_beyond_the_recency_window(self):
+        with self.refreshing_matches():
+            req = self.create_request()
+            req.pickup_lat, req.pickup_lng = 32.0853, 34.7818
+            req.dest_lat, req.dest_lng = 32.0460, 34.8420
+            req.save()
+        # הצעה ישנה ליד האיסוף והיעד, ואחריה 35 הצעות חדשות רחוקות
+        with self.refreshing_matches():
+            near = RideOffer.objects.create(
+                volunteer=self.volunteer_user,
+                raw_text="old ride",
+                from_lat=32.0900,
+                from_lng=34.7800,
+                to_lat=32.0470,
+                to_lng=34.8400,
+            )
+        with self.refreshing_matches():
+            for i in range(35):
+                RideOffer.objects.create(
+                    volunteer=self.volunteer_user, raw_text=f"far {i}", from_lat=31.25, from_lng=34.79
+                )
+        self.login_sick()
+        offers = self.client.get(reverse("ai_auto_suggestions_api")).json()["offers"]
+        self.assertEqual(offers[0]["id"], near.id)
+
+        # צד המתנדב: הבקשה הקרובה מוקדמת יותר מ-20 בקשות רחוקות
+        with self.refreshing_matches():
+            for i in range(25):
+                far = self.create_request()
+                far.requested_time += timedelta(days=2)
+                far.pickup_lat, far.pickup_lng = 29.55, 34.95
+                far.save()
+        RideOffer.objects.exclude(pk=near.pk).delete()
+        self.client.logout()
+        self.login_volunteer()
+        requests = self.client.get(reverse("ai_auto_suggestions_api")).json()["requests"]
+        self.assertEqual([r["id"] for r in requests], [req.id])
+
+    def test_match_table_is_maintained_on_create_and_cancel(self):
+        with self.refreshing_matches():
+            req = self.create_request()
+        later = timezone.localtime(req.requested_time + timedelta(days=3))
+        with self.refreshing_matches():
+            offer = RideOffer.objects.create(
+                volunteer=self.volunteer_user, raw_text="ride", parsed_from="Home", parsed_to="Hospital"
+            )
+            other = RideOffer.objects.create(
+                volunteer=self.volunteer_user, raw_text="ride", parsed_date=later.date(), parsed_time=later.time()
+            )
+        self.assertEqual(list(RequestOfferMatch.objects.values_list("request_id", "offer_id")), [(req.id, offer.id)])
+        self.assertGreaterEqual(RequestOfferMatch.objects.get().score, 0.9)
+
+        # עדכון ההצעה מנקד מחדש רק את הזוגות שלה
+        with self.refreshing_matches():
+            other.parsed_to = "Hospital"
+            other.save(update_fields=["parsed_to"])
+        self.assertEqual(RequestOfferMatch.objects.filter(offer=other).count(), 1)
+        with self.refreshing_matches():
+            second = self.create_request()
+        self.assertEqual(RequestOfferMatch.objects.filter(request=second).count(), 2)
+
+        # שמירה שלא נוגעת בשדות הניקוד לא מנקדת מחדש
+        with patch("stransport.matching.enqueue_match_refresh") as mock_enqueue:
+            req.ai_summary = "summary"
+            req.save(update_fields=["ai_summary"])
+        mock_enqueue.assert_not_called()
+
+        with self.refreshing_matches():
+            req.status = "cancelled"
+            req.save(update_fields=["status"])
+            offer.status = "matched"
+            offer.save(update_fields=["status"])
+        self.assertEqual(list(RequestOfferMatch.objects.values_list("request_id", "offer_id")), [(second.id, other.id)])
+
+        other.delete()
+        self.assertFalse(RequestOfferMatch.objects.exists())
+        call_command("rebuild_matches", stdout=StringIO())
+        self.assertFalse(RequestOfferMatch.objects.exists())
+
+    def test_match_refresh_is_enqueued_after_commit(self):
+        with patch("stransport.tasks.refresh_matches.delay") as mock_delay:
+            with self.captureOnCommitCallbacks() as callbacks:
+                req = self.create_request()
+                RideOffer.objects.create(
+                    volunteer=self.volunteer_user, raw_text="ride", parsed_from="Home", parsed_to="Hospital"
+                )
+            # לא מנקדים בתוך ה-save, רק אחרי ה-commit וב-worker
+            mock_delay.assert_not_called()
+            for callback in callbacks:
+                callback()
+        self.assertEqual(mock_delay.call_args_list[0].args, ("request", req.id))
+        self.assertFalse(RequestOfferMatch.objects.exists())
+
+        # broker לא זמין – הניקוד רץ במקום
+        with patch("stransport.tasks.refresh_matches.delay", side_effect=ConnectionError):
+            with self.captureOnCommitCallbacks(execute=True):
+                req.save()
+        self.assertEqual(RequestOfferMatch.objects.filter(request=req).count(), 1)
+
+    def test_suggestions_are_read_from_the_match_table(self):
+        with self.refreshing_matches():
+            req = self.create_request()
+            offer = RideOffer.objects.create(
+                volunteer=self.volunteer_user, raw_text="ride", parsed_from="Home", parsed_to="Hospital"
+            )
+        RequestOfferMatch.objects.filter(request=req, offer=offer).update(score=0.55)
+        self.login_sick()
+        with patch("stransport.views.score_request_against_offer") as mock_score:
+            offers = self.client.get(reverse("ai_auto_suggestions_api")).json()["offers"]
+        mock_score.assert_not_called()
+        # להצעה בלי מועד יציאה רכיב הזמן (0.2) מתווסף בקריאה מול "עכשיו"
+        self.assertEqual([(o["id"], o["score"]) for o in offers], [(offer.id, 0.75)])
+        with patch("stransport.matching.timezone.now", return_value=timezone.now() + timedelta(days=1)):
+            offers = self.client.get(reverse("ai_auto_suggestions_api")).json()["offers"]
+        self.assertEqual([(o["id"], o["score"]) for o in offers], [(offer.id, 0.55)])
+
+        self.client.logout()
+        self.login_volunteer()
+        data = self.client.get(reverse("ai_auto_suggestions_api")).json()
+        self.assertEqual([(r["id"], r["matched_offer_id"]) for r in data["requests"]], [(req.id, offer.id)])
+        self.assertEqual(data["suggestion_key"], f"vol|{req.id}|{offer.id}")
+
+        call_command("rebuild_matches", stdout=StringIO())
+        self.assertGreaterEqual(RequestOfferMatch.objects.get().score, 0.9)
+
+    def test_suggestions_recommend_a_global_pairing_within_seats(self):
+        other_sick = User.objects.create_user(username="patient2", password="1234")
+        Profile.objects.create(user=other_sick, role="sick")
+        first = self.create_request()
+        second = self.create_request()
+        second.sick = other_sick
+        second.save()
+        single_seat = RideOffer.objects.create(volunteer=self.volunteer_user, raw_text="ride 1")
+        fallback = RideOffer.objects.create(volunteer=self.volunteer_user, raw_text="ride 2")
+        RequestOfferMatch.objects.all().delete()
+        RequestOfferMatch.objects.bulk_create([
+            RequestOfferMatch(request=first, offer=single_seat, score=0.6),
+            RequestOfferMatch(request=second, offer=single_seat, score=0.7),
+            RequestOfferMatch(request=second, offer=fallback, score=0.45),
+        ])
+
+        # לבד, המטופל השני היה מקבל את המקום היחיד; בשיבוץ הגלובלי הוא מקבל את החלופה
+        self.client.login(username="patient2", password="1234")
+        data = self.client.get(reverse("ai_auto_suggestions_api")).json()
+        self.assertEqual(data["offers"][0]["id"], single_seat.id)
+        self.assertEqual(data["recommended"]["offer_id"], fallback.id)
+        self.client.logout()
+        self.login_sick()
+        self.assertEqual(self.client.get(reverse("ai_auto_suggestions_api")).json()["recommended"]["offer_id"], single_seat.id)
+
+        single_seat.seats = 2
+        single_seat.save(update_fields=["seats"])
+        self.client.logout()
+        self.login_volunteer()
+        recommended = self.client.get(reverse("ai_auto_suggestions_api")).json()["recommended"]
+        self.assertEqual(
+            [(r["request_id"], r["offer_id"]) for r in recommended],
+            [(second.id, single_seat.id), (first.id, single_seat.id)],
+        )
+
+    def test_ai_offer_api_validates_seats(self):
+        self.login_volunteer()
+        payload = {"from": "Home", "to": "Hospital", "date": "2030-01-01", "time": "09:00",
+                   "from_lat": 32.08, "from_lng": 34.78, "to_lat": 32.05, "to_lng": 34.84}
+        response = self.client.post(reverse("ai_offer_api"), json.dumps({**payload, "seats": 9}),
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse("ai_offer_api"), json.dumps({**payload, "seats": 3}),
+                                    content_type="application/json")
+        self.assertEqual(RideOffer.objects.get(id=response.json()["id"]).seats, 3)
+
+    @patch("stransport.views.osrm_table", return_value=None)
+    @patch("stransport.views.geocode_many")
+    def test_suggest_route_geocodes_missing_coords_in_one_batch(self, mock_geocode_many, _mock_osrm):
+        first = self.create_request()
+        second = self.create_request()
+        second.pickup_address = "Clinic"
+        second.save()
+        mock_geocode_many.return_value = {"Home": (32.08, 34.78), "Clinic": (32.10, 34.80)}
+        self.login_volunteer()
+        response = self.client.post(
+            reverse("suggest_route_api"),
+            json.dumps({"start_lat": 32.0, "start_lng": 34.7, "request_ids": [first.id, second.id]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        mock_geocode_many.assert_called_once()
+        self.assertEqual(len(response.json()["stops"]), 2)
+        second.refresh_from_db()
+        self.assertEqual((second.pickup_lat, second.pickup_lng), (32.10, 34.80))
+
+    @patch("stransport.views.osrm_table", return_value=None)
+    def test_suggest_route_plans_thirty_stops(self, _mock_osrm):
+        ids = []
+        for i in range(30):
+            req = self.create_request()
+            req.pickup_lat, req.pickup_lng = 31.5 + (i * 7 % 30) * 0.02, 34.6 + (i * 11 % 30) * 0.01
+            req.save()
+            ids.append(req.id)
+        self.login_volunteer()
+        response = self.client.post(
+            reverse("suggest_route_api"),
+            json.dumps({"start_lat": 31.5, "start_lng": 34.6, "request_ids": ids}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(sorted(stop["request_id"] for stop in data["stops"]), sorted(ids))
+        self.assertLessEqual(data["optimizer"]["final_cost"], data["optimizer"]["initial_cost"])
+        self.assertAlmostEqual(data["total_distance_m"], data["optimizer"]["final_cost"], places=3)
+
+    @patch("stransport.views.osrm_table", return_value=None)
+    def test_suggest_route_interleaves_dropoffs_within_capacity(self, _mock_osrm):
+        ids = []
+        for i in range(3):
+            req = self.create_request()
+            req.pickup_lat, req.pickup_lng = 32.0 + 0.05 * (i + 1), 34.8
+            req.dest_lat, req.dest_lng = 32.02 + 0.05 * (i + 1), 34.8
+            req.save()
+            ids.append(req.id)
+        self.login_volunteer()
+        response = self.client.post(
+            reverse("suggest_route_api"),
+            json.dumps(
+                {
+                    "start_lat": 32.0,
+                    "start_lng": 34.8,
+                    "request_ids": ids,
+                    "mode": "pickup_then_dropoff",
+                    "capacity": 1,
+                }
+            ),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        stops = [(stop["type"], stop["request_id"]) for stop in response.json()["stops"]]
+        self.assertEqual(
+            stops,
+            [(kind, req_id) for req_id in ids for kind in ("pickup", "dropoff")],
+        )
+
+    @patch("stransport.views.osrm_table", return_value=None)
+    def test_suggest_route_time_windows_orders_by_requested_time(self, _mock_osrm):
+        departure = timezone.now() + timedelta(minutes=5)
+        late_near = self.create_request()
+        late_near.pickup_lat, late_near.pickup_lng = 32.01, 34.80
+        late_near.requested_time = departure + timedelta(hours=2)
+        late_near.save()
+        early_far = self.create_request()
+        early_far.pickup_lat, early_far.pickup_lng = 32.10, 34.80
+        early_far.requested_time = departure + timedelta(minutes=20)
+        early_far.save()
+        self.login_volunteer()
+        response = self.client.post(
+            reverse("suggest_route_api"),
+            json.dumps(
+                {
+                    "start_lat": 32.0,
+                    "start_lng": 34.8,
+                    "request_ids": [late_near.id, early_far.id],
+                    "time_windows": True,
+                    "departure_time": departure.isoformat(),
+                }
+            ),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([stop["request_id"] for stop in data["stops"]], [early_far.id, late_near.id])
+        self.assertTrue(data["schedule"]["feasible"])
+        self.assertTrue(all(stop["on_time"] for stop in data["stops"]))
+        self.assertGreater(data["stops"][1]["wait_s"], 0)
+
+    @patch("stransport.views.osrm_table", return_value=None)
+    def test_suggest_route_plan_is_cached_until_a_request_changes(self, mock_osrm):
+        from django.core.cache import cache
+
+        cache.clear()
+        first = self.create_request()
+        second = self.create_request()
+        for i, req in enumerate((first, second)):
+            req.pickup_lat, req.pickup_lng = 32.0 + 0.01 * i, 34.8
+            req.save()
+        self.login_volunteer()
+
+        def plan(start_lat):
+            return self.client.post(
+                reverse("suggest_route_api"),
+                json.dumps({"start_lat": start_lat, "start_lng": 34.7, "request_ids": [second.id, first.id]}),
+                content_type="application/json",
+            ).json()
+
+        self.assertEqual(plan(31.9)["cache"], "miss")
+        # תזוזה של כמה מטרים – אותה משבצת מוצא
+        hit = plan(31.90002)
+        self.assertEqual(hit["cache"], "hit")
+        self.assertEqual(mock_osrm.call_count, 1)
+
+        second.pickup_lat = 32.05
+        second.save()
+        self.assertEqual(plan(31.9)["cache"], "miss")
+        first.status = "accepted"
+        first.save()
+        TransportAssignment.objects.create(request=first, volunteer=self.volunteer_user)
+        self.assertEqual(plan(31.9)["cache"], "miss")
+        self.assertEqual(mock_osrm.call_count, 3)
+
+    @patch("stransport.views.publish_route_plan")
+    @patch("stransport.views.osrm_table", return_value=None)
+    def test_async_route_job_returns_id_then_result(self, _mock_osrm, mock_publish):
+        req = self.create_request()
+        req.pickup_lat, req.pickup_lng = 32.01, 34.8
+        req.save()
+        body = {"start_lat": 32.0, "start_lng": 34.8, "request_ids": [req.id], "async": True}
+        self.login_volunteer()
+        with patch("stransport.views.plan_route_job.delay") as mock_delay:
+            response = self.client.post(reverse("suggest_route_api"), json.dumps(body), content_type="application/json")
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["job_id"]
+        self.assertEqual(self.client.get(response.json()["status_url"]).json()["status"], "pending")
+
+        # ה-worker מריץ את המשימה עם אותם נתונים
+        (args, _kwargs), = mock_delay.call_args_list
+        self.assertEqual(args[0], job_id)
+        run_route_job(*args)
+        mock_publish.assert_called_once()
+        job = self.client.get(reverse("route_job_api", args=[job_id])).json()
+        self.assertEqual(job["status"], "done")
+        self.assertEqual([stop["request_id"] for stop in job["result"]["stops"]], [req.id])
+
+        # משתמש אחר לא רואה את העבודה
+        self.client.logout()
+        self.login_sick()
+        self.assertEqual(self.client.get(reverse("route_job_api", args=[job_id])).status_code, 404)
+
+    @patch("stransport.views.publish_route_plan")
+    @patch("stransport.views.osrm_table", return_value=None)
+    def test_async_route_job_runs_inline_when_broker_is_down(self, _mock_osrm, _mock_publish):
+        req = self.create_request()
+        req.pickup_lat, req.pickup_lng = 32.01, 34.8
+        req.save()
+        self.login_volunteer()
+        with patch("stransport.views.plan_route_job.delay", side_effect=ConnectionError):
+            response = self.client.post(
+                reverse("suggest_route_api"),
+                json.dumps({"start_lat": 32.0, "start_lng": 34.8, "request_ids": [req.id], "async": True}),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["stops"]), 1)
+        self.assertEqual(RouteJob.objects.get(job_id=response.json()["job_id"]).status, "done")
+
+    @override_settings(ROUTE_JOB_TTL_SECONDS=60)
+    def test_expired_route_jobs_are_pruned_by_the_beat_task(self):
+        self.login_volunteer()
+        old = RouteJob.objects.create(job_id="old", user=self.volunteer_user, status="done")
+        RouteJob.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        fresh = RouteJob.objects.create(job_id="fresh", user=self.volunteer_user)
+        # ה-view לא מוחק בעצמו, אבל לא מחזיר עבודה שפג תוקפה
+        self.assertEqual(self.client.get(reverse("route_job_api", args=["old"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("route_job_api", args=["fresh"])).status_code, 200)
+        self.assertTrue(RouteJob.objects.filter(pk=old.pk).exists())
+
+        self.assertEqual(prune_route_jobs(), {"deleted": 1})
+        self.assertEqual(list(RouteJob.objects.values_list("pk", flat=True)), [fresh.pk])
+
+
+@override_settings(DISPATCH_MAX_REQUESTS_PER_VEHICLE=2, ROUTE_VEHICLE_CAPACITY=2)
+class DispatchOptimizerTests(TestCase):
+    def setUp(self):
+        self.sick_user = User.objects.create_user(username="patient1", password="1234")
+        Profile.objects.create(user=self.sick_user, role="sick", phone="050-1234567")
+        self.volunteers = []
+        for i in range(2):
+            user = User.objects.create_user(username=f"volunteer{i}", password="1234")
+            Profile.objects.create(user=user, role="volunteer", phone="052-7654321")
+            self.volunteers.append(user)
+        self.when = timezone.localtime(timezone.now() + timedelta(hours=3)).replace(second=0, microsecond=0)
+
+    def create_offer(self, volunteer, start, end, when=None):
+        when = when or self.when
+        return RideOffer.objects.create(
+            volunteer=volunteer,
+            raw_text="ride",
+            parsed_date=when.date(),
+            parsed_time=when.time(),
+            from_lat=start[0],
+            from_lng=start[1],
+            to_lat=end[0],
+            to_lng=end[1],
+        )
+
+    def create_request(self, pickup, dest, when=None):
+        return TransportRequest.objects.create(
+            sick=self.sick_user,
+            pickup_address="p",
+            destination="d",
+            pickup_lat=pickup[0],
+            pickup_lng=pickup[1],
+            dest_lat=dest[0],
+            dest_lng=dest[1],
+            requested_time=when or self.when,
+        )
+
+    def test_run_assigns_requests_to_the_offer_with_least_detour(self):
+        north = self.create_offer(self.volunteers[0], (32.80, 35.00), (32.80, 35.20))
+        south = self.create_offer(self.volunteers[1], (31.25, 34.80), (31.25, 35.00))
+        near_north = self.create_request((32.80, 35.05), (32.80, 35.15))
+        near_south = self.create_request((31.25, 34.85), (31.25, 34.95))
+        wrong_day = self.create_request((32.80, 35.05), (32.80, 35.15), when=self.when + timedelta(hours=20))
+
+        stats = dispatch.run_dispatch()
+        self.assertEqual(stats["assigned"], 2)
+        proposals = {p.request_id: p for p in DispatchProposal.objects.all()}
+        self.assertEqual(proposals[near_north.id].offer_id, north.id)
+        self.assertEqual(proposals[near_south.id].offer_id, south.id)
+        self.assertNotIn(wrong_day.id, proposals)
+        self.assertLess(proposals[near_north.id].detour_m, 1000)
+
+    def test_incremental_insert_and_removal(self):
+        offer = self.create_offer(self.volunteers[0], (32.00, 34.80), (32.00, 35.00))
+        first = self.create_request((32.00, 34.90), (32.00, 34.95))
+        dispatch.run_dispatch()
+        alone = DispatchProposal.objects.get(request=first)
+
+        second = self.create_request((32.00, 34.82), (32.00, 34.85))
+        result = dispatch.dispatch_request_changed(second.id)
+        self.assertEqual(result["action"], "assigned")
+        order = list(DispatchProposal.objects.filter(offer=offer).order_by("pickup_index").values_list("request_id", flat=True))
+        self.assertEqual(order, [second.id, first.id])
+
+        # הרכב מלא (DISPATCH_MAX_REQUESTS_PER_VEHICLE=2)
+        third = self.create_request((32.00, 34.83), (32.00, 34.86))
+        self.assertEqual(dispatch.dispatch_request_changed(third.id)["action"], "unassigned")
+
+        second.status = "cancelled"
+        second.save()
+        self.assertEqual(dispatch.dispatch_request_changed(second.id)["action"], "removed")
+        self.assertEqual(list(DispatchProposal.objects.values_list("request_id", flat=True)), [first.id])
+        # העצירות של הבקשה שנשארה זזו קדימה והעקיפה חושבה מחדש (כמו לפני שנוספה second)
+        remaining = DispatchProposal.objects.get(request=first)
+        self.assertEqual((remaining.pickup_index, remaining.dropoff_index), (alone.pickup_index, alone.dropoff_index))
+        self.assertAlmostEqual(remaining.detour_m, alone.detour_m, places=3)
+
+    def test_incremental_update_reads_proposals_after_taking_the_vehicle_lock(self):
+        offer = self.create_offer(self.volunteers[0], (32.00, 34.80), (32.00, 35.00))
+        first = self.create_request((32.00, 34.90), (32.00, 34.95))
+        dispatch.run_dispatch()
+        second = self.create_request((32.00, 34.82), (32.00, 34.85))
+        third = self.create_request((32.00, 34.83), (32.00, 34.86))
+        lock = dispatch._lock_vehicles
+
+        def concurrent_insert(vehicles):
+            # עדכון מקביל של second נכנס לאותו רכב ועשה commit בזמן שחיכינו לנעילה
+            lock(vehicles)
+            DispatchProposal.objects.filter(request=first).update(pickup_index=2, dropoff_index=3)
+            DispatchProposal.objects.create(
+                run_id="other", request=second, volunteer=self.volunteers[0], offer=offer,
+                pickup_index=0, dropoff_index=1, detour_m=0,
+            )
+
+        with patch("stransport.dispatch._lock_vehicles", side_effect=concurrent_insert) as mock_lock:
+            result = dispatch.dispatch_request_changed(third.id)
+        self.assertEqual([call.args[0][0]["offer_id"] for call in mock_lock.call_args_list], [offer.id])
+        # הרכב מלא (DISPATCH_MAX_REQUESTS_PER_VEHICLE=2) – לא נכנסת בקשה שלישית
+        self.assertEqual(result["action"], "unassigned")
+        self.assertEqual(DispatchProposal.objects.filter(offer=offer).count(), 2)
+
+    def test_cancel_enqueues_dispatch_update_and_api_lists_proposals(self):
+        self.create_offer(self.volunteers[0], (32.00, 34.80), (32.00, 35.00))
+        req = self.create_request((32.00, 34.90), (32.00, 34.95))
+        dispatch.run_dispatch()
+
+        client = Client()
+        client.login(username="volunteer0", password="1234")
+        data = client.get(reverse("dispatch_proposals_api")).json()
+        self.assertEqual([p["request"]["id"] for p in data["proposals"]], [req.id])
+
+        client.login(username="patient1", password="1234")
+        with patch("stransport.views.dispatch_request_changed.delay") as mock_delay, patch(
+            "stransport.tasks.refresh_matches.delay"
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.post(reverse("cancel_request_api", args=[req.id]))
+        self.assertEqual(response.status_code, 200)
+        mock_delay.assert_called_once_with(req.id)
+
+    @override_settings(DISPATCH_MAX_REQUESTS_PER_VEHICLE=6, ROUTE_VEHICLE_CAPACITY=3)
+    def test_run_scales_to_hundreds_of_requests(self):
+        rng = random.Random(3)
+        for i in range(20):
+            start = (rng.uniform(31.5, 32.5), rng.uniform(34.7, 35.0))
+            self.create_offer(self.volunteers[i % 2], start, (start[0] + 0.1, start[1] + 0.1))
+        for _ in range(200):
+            pickup = (rng.uniform(31.5, 32.5), rng.uniform(34.7, 35.0))
+            self.create_request(pickup, (pickup[0] + 0.05, pickup[1] + 0.05))
+        stats = dispatch.run_dispatch()
+        self.assertEqual(stats["requests"], 200)
+        self.assertGreater(stats["assigned"], 0)
+        self.assertEqual(stats["assigned"] + stats["unassigned"], 200)
+        per_offer = DispatchProposal.objects.values("offer_id").annotate(n=models.Count("id"))
+        self.assertTrue(all(row["n"] <= 6 for row in per_offer))
+
+
+class GeoKernelTests(TestCase):
+    def test_vectorized_haversine_matches_scalar(self):
+        rng = random.Random(5)
+        sources = [(rng.uniform(29.5, 33.3), rng.uniform(34.2, 35.9)) for _ in range(12)]
+        destinations = [(rng.uniform(29.5, 33.3), rng.uniform(34.2, 35.9)) for _ in range(7)]
+        matrix = geo.haversine_many_to_many(sources, destinations)
+        self.assertEqual(matrix.shape, (12, 7))
+        row = geo.haversine_one_to_many(sources[3][0], sources[3][1], destinations)
+        for i, a in enumerate(sources):
+            for j, b in enumerate(destinations):
+                expected = geo.haversine_meters(a[0], a[1], b[0], b[1])
+                self.assertAlmostEqual(matrix[i, j], expected, places=3)
+        self.assertEqual(row.tolist(), matrix[3].tolist())
+        self.assertEqual(geo.haversine_matrix(sources)[2][2], 0.0)
+
+    def test_missing_coordinates_are_nan(self):
+        matrix = geo.haversine_many_to_many([(32.0, 34.8), (None, None)], [(32.1, 34.8)])
+        self.assertAlmostEqual(matrix[0, 0], 11119.5, places=0)
+        self.assertTrue(matrix[1, 0] != matrix[1, 0])
+
+    def test_geohash_cells_within_cover_the_radius(self):
+        self.assertEqual(geo.geohash_encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+        rng = random.Random(5)
+        for lat, lng in [(32.0853, 34.7818), (29.5577, 34.9519), (33.2, 35.6)]:
+            cells = geo.geohash_cells_within(lat, lng, 2000)
+            self.assertLess(len(cells), 60)
+            for _ in range(300):
+                # נקודה אקראית עד 2 ק"מ מהמרכז
+                distance, bearing = 2000 * rng.random() ** 0.5, rng.uniform(0, 6.283)
+                p_lat = lat + distance * math.cos(bearing) / 111320
+                p_lng = lng + distance * math.sin(bearing) / (111320 * math.cos(math.radians(lat)))
+                self.assertLessEqual(geo.haversine_meters(lat, lng, p_lat, p_lng), 2001)
+                self.assertIn(geo.geohash_encode(p_lat, p_lng), cells)
+
+    def test_bench_geo_command(self):
+        out = StringIO()
+        call_command("bench_geo", sizes="10,20", repeat=1, stdout=out)
+        self.assertIn("20x20", out.getvalue())
+
+
+class MatchScoringTests(TestCase):
+    def random_pairs(self, rng, n_reqs, n_offers):
+        from types import SimpleNamespace
+
+        now = timezone.now()
+        places = ["Tel Aviv", "tel aviv ", "Sheba Hospital", "sheba", "Haifa", "Ichilov", "", None]
+        centers = [(32.0853, 34.7818), (32.0460, 34.8420), (32.7940, 34.9896)]
+
+        def point():
+            if rng.random() < 0.2:
+                return None, None
+            lat, lng = rng.choice(centers)
+            return lat + rng.uniform(-0.03, 0.03), lng + rng.uniform(-0.03, 0.03)
+
+        def when():
+            roll = rng.random()
+            if roll < 0.1:
+                return None
+            value = now + timedelta(minutes=rng.choice([-240, -180, -60, 0, 90, 180, 181, 600]))
+            return value.replace(tzinfo=None) if roll < 0.25 else value
+
+        reqs, offers, whens = [], [], []
+        for _ in range(n_reqs):
+            (p_lat, p_lng), (d_lat, d_lng) = point(), point()
+            reqs.append(SimpleNamespace(
+                pickup_address=rng.choice(places), destination=rng.choice(places), requested_time=when(),
+                pickup_lat=p_lat, pickup_lng=p_lng, dest_lat=d_lat, dest_lng=d_lng,
+            ))
+        for _ in range(n_offers):
+            (f_lat, f_lng), (t_lat, t_lng) = point(), point()
+            offers.append(SimpleNamespace(
+                parsed_from=rng.choice(places), parsed_to=rng.choice(places),
+                from_lat=f_lat, from_lng=f_lng, to_lat=t_lat, to_lng=t_lng,
+            ))
+            whens.append(when())
+        return reqs, offers, whens
+
+    def test_score_matrix_matches_scalar_scores(self):
+        for seed in range(8):
+            rng = random.Random(seed)
+            reqs, offers, whens = self.random_pairs(rng, rng.randint(0, 25), rng.randint(0, 25))
+            scores = matching.score_matrix(reqs, offers, whens)
+            self.assertEqual(scores.shape, (len(reqs), len(offers)))
+            for i, req in enumerate(reqs):
+                for j, offer in enumerate(offers):
+                    self.assertEqual(
+                        scores[i, j], matching.score_request_against_offer(req, offer, whens[j]), (seed, i, j)
+                    )
+
+    def test_rebuild_matches_scores_all_open_pairs(self):
+        user = User.objects.create_user(username="vol", password="1234")
+        sick = User.objects.create_user(username="sick", password="1234")
+        when = timezone.now() + timedelta(hours=1)
+        req = TransportRequest.objects.create(
+            sick=sick, pickup_address="Home", destination="Hospital", requested_time=when
+        )
+        offers = [
+            RideOffer.objects.create(volunteer=user, raw_text=f"ride {i}", parsed_from="Home", parsed_to="Hospital")
+            for i in range(3)
+        ]
+        RequestOfferMatch.objects.all().delete()
+        with patch.object(matching, "REBUILD_CHUNK", 2):
+            self.assertEqual(matching.rebuild_all_matches(), 3)
+        self.assertEqual(
+            sorted(RequestOfferMatch.objects.filter(request=req).values_list("offer_id", flat=True)),
+            [o.id for o in offers],
+        )
+
+    def test_store_matches_upserts_a_pair_inserted_by_a_concurrent_refresh(self):
+        user = User.objects.create_user(username="vol", password="1234")
+        sick = User.objects.create_user(username="sick", password="1234")
+        req = TransportRequest.objects.create(
+            sick=sick, pickup_address="Home", destination="Hospital", requested_time=timezone.now() + timedelta(hours=1)
+        )
+        offer = RideOffer.objects.create(volunteer=user, raw_text="ride", parsed_from="Home", parsed_to="Hospital")
+        # ריענון ההצעה כבר הכניס את הזוג אחרי שריענון הבקשה מחק את השורות שלו
+        RequestOfferMatch.objects.create(request=req, offer=offer, score=0.01)
+        self.assertEqual(matching._store_matches([req], [offer]), 1)
+        self.assertGreaterEqual(RequestOfferMatch.objects.get(request=req, offer=offer).score, 0.9)
+
+    def test_min_cost_assignment_is_optimal(self):
+        import itertools
+
+        rng = random.Random(3)
+        for _ in range(60):
+            n, m = rng.randint(0, 5), rng.randint(0, 5)
+            cost = [[rng.choice([0, -0.2, -0.45, -0.65, -1.0]) for _ in range(m)] for _ in range(n)]
+            result = assignment.min_cost_assignment(np.array(cost).reshape(n, m))
+            cols = [j for j in result if j is not None]
+            self.assertEqual(len(cols), len(set(cols)))
+            self.assertEqual(len(cols), min(n, m))
+            if n <= m:
+                best = min((sum(cost[i][p[i]] for i in range(n)) for p in itertools.permutations(range(m), n)), default=0)
+            else:
+                best = min(sum(cost[p[j]][j] for j in range(m)) for p in itertools.permutations(range(n), m))
+            self.assertAlmostEqual(sum(cost[i][j] for i, j in enumerate(result) if j is not None), best)
+
+    def test_capacitated_matching_respects_seats(self):
+        scores = {("a", "x"): 0.9, ("b", "x"): 1.0, ("b", "y"): 0.65, ("c", "z"): 0.2, ("d", "x"): 0.3}
+        self.assertEqual(
+            assignment.capacitated_matching(scores, {"x": 1, "y": 1, "z": 1}), {"a": "x", "b": "y", "c": "z"}
+        )
+        self.assertEqual(
+            assignment.capacitated_matching(scores, {"x": 2, "y": 1, "z": 0}), {"a": "x", "b": "x"}
+        )
+
+    def test_bench_matching_command(self):
+        out = StringIO()
+        call_command("bench_matching", sizes="10,20", repeat=1, stdout=out)
+        self.assertIn("20x20", out.getvalue())
+
+
+class RouteOptimizerTests(TestCase):
+    def random_matrix(self, n, seed, asymmetric=False):
+        rng = random.Random(seed)
+        points = [(rng.uniform(31.0, 33.0), rng.uniform(34.5, 35.5)) for _ in range(n)]
+        matrix = geo.haversine_matrix(points)
+        if asymmetric:
+            matrix = [[v * rng.uniform(1.0, 1.3) for v in row] for row in matrix]
+        return matrix
+
+    def test_improve_route_matches_brute_force_on_small_instances(self):
+        import itertools
+
+        for seed in range(5):
+            matrix = self.random_matrix(7, seed, asymmetric=seed % 2 == 1)
+            stops = list(range(1, 7))
+            best = min(
+                route_optimizer.route_cost([0] + list(p), matrix) for p in itertools.permutations(stops)
+            )
+            order, stats = route_optimizer.improve_route(
+                route_optimizer.nearest_neighbor_order(matrix, stops), matrix
+            )
+            self.assertEqual(sorted(order), stops)
+            self.assertAlmostEqual(stats["final_cost"], route_optimizer.route_cost([0] + order, matrix))
+            # local search – לא תמיד אופטימלי, אבל קרוב
+            self.assertLessEqual(stats["final_cost"], best * 1.05)
+
+    def test_pickup_delivery_respects_precedence_and_capacity(self):
+        for seed in range(6):
+            n = 8
+            matrix = self.random_matrix(2 * n + 1, seed, asymmetric=True)
+            pairs = [(i, i + n) for i in range(1, n + 1)]
+            capacity = 1 + seed % 3
+            order, stats = route_optimizer.solve_pickup_delivery(matrix, pairs, capacity)
+            self.assertEqual(sorted(order), list(range(1, 2 * n + 1)))
+            position = {node: k for k, node in enumerate(order)}
+            load = 0
+            for node in order:
+                load += 1 if node <= n else -1
+                self.assertLessEqual(load, capacity)
+            for pickup, dropoff in pairs:
+                self.assertLess(position[pickup], position[dropoff])
+            self.assertLessEqual(stats["final_cost"], stats["initial_cost"] + 1e-6)
+
+    def test_pickup_delivery_beats_all_pickups_first(self):
+        # שלושה מטופלים לאורך ציר, כל אחד נוסע קצת קדימה
+        points = [(32.00, 34.80)]
+        pickups = [(32.00 + 0.05 * i, 34.80) for i in range(1, 4)]
+        dropoffs = [(32.02 + 0.05 * i, 34.80) for i in range(1, 4)]
+        matrix = geo.haversine_matrix(points + pickups + dropoffs)
+        pairs = [(i, i + 3) for i in range(1, 4)]
+        order, stats = route_optimizer.solve_pickup_delivery(matrix, pairs, capacity=1)
+        self.assertEqual(order, [1, 4, 2, 5, 3, 6])
+        sequential = route_optimizer.route_cost([0, 1, 2, 3, 4, 5, 6], matrix)
+        self.assertLess(stats["final_cost"], sequential * 0.6)
+
+    def test_time_windows_reduce_lateness_and_respect_precedence(self):
+        for seed in range(4):
+            rng = random.Random(seed)
+            n = 6
+            durations = [[v / 11.11 for v in row] for row in self.random_matrix(2 * n + 1, seed)]
+            windows = {}
+            for node in range(1, n + 1):
+                opens = rng.uniform(0, 4 * 3600)
+                windows[node] = (opens, opens + 1200)
+            pairs = [(i, i + n) for i in range(1, n + 1)]
+            order, schedule, stats = route_optimizer.solve_time_windows(
+                durations, windows, pairs=pairs, capacity=2, service_s=60, time_budget_ms=500
+            )
+            position = {node: k for k, node in enumerate(order)}
+            for pickup, dropoff in pairs:
+                self.assertLess(position[pickup], position[dropoff])
+            self.assertEqual(len(schedule), 2 * n)
+            self.assertLessEqual(stats["final_cost"], stats["initial_cost"] + 1e-6)
+            distance_only, _ = route_optimizer.solve_pickup_delivery(durations, pairs, 2)
+            naive_late = sum(
+                item["lateness_s"]
+                for item in route_optimizer.schedule_route([0] + distance_only, durations, windows, 60)
+            )
+            self.assertLessEqual(stats["total_lateness_s"], naive_late + 1e-6)
+
+    def test_fifty_stops_respect_time_budget(self):
+        matrix = self.random_matrix(51, seed=42, asymmetric=True)
+        stops = list(range(1, 51))
+        order, stats = route_optimizer.improve_route(stops, matrix, time_budget_ms=200)
+        self.assertEqual(sorted(order), stops)
+        self.assertLess(stats["final_cost"], stats["initial_cost"])
+        self.assertLess(stats["elapsed_ms"], 1000)
+
+    def test_exact_open_route_matches_brute_force(self):
+        import itertools
+
+        matrix = self.random_matrix(7, seed=3, asymmetric=True)
+        stops = list(range(1, 7))
+        best = min(route_optimizer.route_cost([0] + list(p), matrix) for p in itertools.permutations(stops))
+        order, cost = route_bench.exact_open_route(matrix, stops)
+        self.assertAlmostEqual(cost, best, places=6)
+        self.assertAlmostEqual(route_optimizer.route_cost([0] + order, matrix), best, places=6)
+
+    def test_bench_routing_json_reports_gap_per_solver(self):
+        out = StringIO()
+        call_command("bench_routing", sizes="6,12", format="json", stdout=out)
+        rows = json.loads(out.getvalue())["results"]
+        self.assertEqual({row["scenario"] for row in rows}, {"hospital", "intercity"})
+        small = [row for row in rows if row["size"] == 6 and row["variant"] == "pickup_only"]
+        self.assertTrue(small and all(row["reference"] == "exact" for row in small))
+        # פתרון חוקי לא יכול להיות טוב מהאופטימום / מהטוב ביותר שנמצא
+        self.assertTrue(all(row["gap_pct"] >= -1e-6 for row in rows if row["feasible"]))
+        self.assertTrue(
+            all(row["feasible"] for row in rows if row["solver"] in ("pickup_delivery", "local_search"))
+        )
+
+    def test_bench_routing_runs_against_recorded_osrm_fixture(self):
+        import os
+        import tempfile
+
+        def fake_fetch_table(coords, base_url, sources=None, destinations=None):
+            # "כבישים": haversine מוארך ולא סימטרי
+            distances = [
+                [d * (1.3 if i < j else 1.4) for j, d in enumerate(row)]
+                for i, row in enumerate(geo.haversine_matrix(coords))
+            ]
+            return {"distances": distances, "durations": [[d / 12.0 for d in row] for row in distances]}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "osrm.json")
+            with patch("stransport.route_bench.osrm.fetch_table", side_effect=fake_fetch_table):
+                call_command("bench_routing", sizes="5", scenarios="hospital", record_osrm=path, stdout=StringIO())
+            out = StringIO()
+            call_command("bench_routing", sizes="5", scenarios="hospital", matrix="osrm", fixture=path,
+                         format="csv", stdout=out)
+        lines = out.getvalue().strip().splitlines()
+        self.assertTrue(lines[0].startswith("instance,scenario,variant"))
+        self.assertEqual(len(lines), 1 + 4 + 3)
+        self.assertIn(",osrm,", lines[1])
+
+
+@override_settings(OUTBOUND_FAILURE_THRESHOLD=2, OUTBOUND_COOLDOWN_SECONDS=30)
+class OutboundHttpClientTests(TestCase):
+    def setUp(self):
+        http_client.reset()
+        self.addCleanup(http_client.reset)
+
+    def test_provider_session_is_reused_with_provider_timeout(self):
+        with patch("stransport.http_client.requests.Session.request", return_value=Mock(status_code=200)) as mock_request:
+            http_client.get("osrm", "http://osrm/a")
+            http_client.get("osrm", "http://osrm/b")
+        self.assertIs(http_client.get_session("osrm"), http_client.get_session("osrm"))
+        self.assertIsNot(http_client.get_session("osrm"), http_client.get_session("openai"))
+        self.assertEqual(mock_request.call_args.kwargs["timeout"], 6)
+        stats = http_client.provider_stats()["osrm"]
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["errors"], 0)
+
+    def test_circuit_opens_after_failures_and_fails_fast(self):
+        with patch("stransport.http_client.requests.Session.request", return_value=Mock(status_code=503)) as mock_request:
+            http_client.get("osrm", "http://osrm/a")
+            http_client.get("osrm", "http://osrm/a")
+            with self.assertRaises(http_client.CircuitOpenError):
+                http_client.get("osrm", "http://osrm/a")
+            # ספק אחר לא מושפע
+            http_client.post("groq", "http://groq/chat")
+        self.assertEqual(mock_request.call_count, 3)
+        stats = http_client.provider_stats()
+        self.assertTrue(stats["osrm"]["circuit_open"])
+        self.assertEqual(stats["osrm"]["short_circuited"], 1)
+        self.assertEqual(stats["osrm"]["error_rate"], 1.0)
+
+        # אחרי ה-cooldown – ניסיון אחד (half-open), הצלחה סוגרת את ה-circuit
+        with patch("stransport.http_client.time.monotonic", return_value=http_client.time.monotonic() + 31):
+            with patch("stransport.http_client.requests.Session.request", return_value=Mock(status_code=200)):
+                http_client.get("osrm", "http://osrm/a")
+        self.assertFalse(http_client.provider_stats()["osrm"]["circuit_open"])
+
+    def test_cache_stats_endpoint_is_staff_only_and_reports_live_counters(self):
+        geocoding.clear_memory_cache()
+        ai_matching.clear_match_cache()
+        self.addCleanup(geocoding.clear_memory_cache)
+        self.addCleanup(ai_matching.clear_match_cache)
+        user = User.objects.create_user(username="ops", password="pass")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse("debug_cache_stats")).status_code, 403)
+
+        user.is_staff = True
+        user.save(update_fields=["is_staff"])
+        before = self.client.get(reverse("debug_cache_stats")).json()
+        self.assertEqual(before["providers"], {})
+        self.assertEqual(before["geocoding"]["misses"], 0)
+        self.assertEqual(before["ai_matching"]["misses"], 0)
+
+        geo_resp = Mock(status_code=200)
+        geo_resp.json.return_value = {"status": "ZERO_RESULTS", "results": []}
+        with override_settings(GOOGLE_PLACES_API_KEY="test-key"), patch(
+            "stransport.http_client.requests.Session.request", return_value=geo_resp
+        ):
+            geocoding.geocode_address("Nowhere street")
+        key = ai_matching.match_cache_key({"pickup": "Home"}, [{"id": 1, "raw_text": "ride"}])
+        ai_matching._cached_scores(key, lambda: ({1: 0.5}, 10))
+        ai_matching._cached_scores(key, lambda: ({1: 0.5}, 10))
+
+        after = self.client.get(reverse("debug_cache_stats")).json()
+        self.assertEqual(after["providers"]["google_geocoding"]["requests"], 1)
+        self.assertEqual(after["geocoding"]["misses"], 1)
+        self.assertEqual(after["ai_matching"]["hits"], 1)
+        self.assertEqual(after["ai_matching"]["misses"], 1)
+
+
+@override_settings(AI_API_KEY="test-key")
+class AiMatchCacheTests(TestCase):
+    offers = [
+        {"id": 1, "raw_text": "נסיעה מתל אביב לשיבא", "volunteer_username": "v1"},
+        {"id": 2, "raw_text": "נסיעה מחיפה לרמב\"ם", "volunteer_username": "v2"},
+    ]
+
+    def setUp(self):
+        ai_matching.clear_match_cache()
+        http_client.reset()
+
+    def fake_response(self):
+        resp = Mock(status_code=200)
+        resp.json.return_value = {
+            "choices": [{"message": {"content": '[{"id": 1, "score": 0.9, "reason": "תואם"}]'}}],
+            "usage": {"total_tokens": 321},
+        }
+        return resp
+
+    @patch("stransport.http_client.requests.Session.request")
+    def test_repeated_request_is_served_from_cache(self, mock_post):
+        mock_post.return_value = self.fake_response()
+        summary = {"pickup": "תל אביב", "destination": "שיבא", "time_text": "מחר ב-9"}
+        first = ai_matching.ai_match_offers_to_request(summary, self.offers)
+        again = ai_matching.ai_match_offers_to_request(
+            {"pickup": " תל  אביב", "destination": "שיבא", "time_text": "מחר ב-9 "}, list(reversed(self.offers))
+        )
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(first, again)
+        self.assertEqual((first[0]["id"], first[0]["score"], first[0]["reason"]), (1, 0.9, "תואם"))
+        stats = ai_matching.match_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["tokens_saved"]), (1, 1, 321))
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+        # טקסט הצעה שהשתנה = מפתח חדש; תשובה שלא פוענחה לא נשמרת
+        changed = [dict(self.offers[0], raw_text="נסיעה אחרת"), self.offers[1]]
+        mock_post.return_value.json.return_value = {"choices": [{"message": {"content": "not json"}}]}
+        ai_matching.ai_match_offers_to_request(summary, changed)
+        ai_matching.ai_match_offers_to_request(summary, changed)
+        self.assertEqual(mock_post.call_count, 3)
+
+    @patch("stransport.http_client.requests.Session.request")
+    def test_cache_expires_and_evicts_least_recent(self, mock_post):
+        mock_post.return_value = self.fake_response()
+        summaries = [{"pickup": p, "destination": "שיבא", "time_text": ""} for p in ("a", "b", "c")]
+        with override_settings(AI_MATCH_CACHE_SIZE=2):
+            for summary in summaries:
+                ai_matching.ai_match_offers_to_request(summary, self.offers)
+            ai_matching.ai_match_offers_to_request(summaries[2], self.offers)
+            ai_matching.ai_match_offers_to_request(summaries[0], self.offers)
+        self.assertEqual(mock_post.call_count, 4)
+        self.assertEqual(ai_matching.match_cache_stats()["evictions"], 2)
+
+        with override_settings(AI_MATCH_CACHE_TTL_SECONDS=0):
+            ai_matching.ai_match_offers_to_request(summaries[1], self.offers)
+        ai_matching.ai_match_offers_to_request(summaries[1], self.offers)
+        self.assertEqual(mock_post.call_count, 6)
+        self.assertEqual(ai_matching.match_cache_stats()["expired"], 1)
+
+    @patch("stransport.http_client.requests.Session.request")
+    def test_concurrent_duplicates_share_one_call(self, mock_post):
+        import threading
+        import time
+
+        release = threading.Event()
+
+        def slow_call(*args, **kwargs):
+            release.wait(5)
+            return self.fake_response()
+
+        mock_post.side_effect = slow_call
+        summary = {"pickup": "תל אביב", "destination": "שיבא", "time_text": ""}
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(ai_matching.ai_match_offers_to_request(summary, self.offers)))
+            for _ in range(3)
+        ]
+        for t in threads:
+            t.start()
+        deadline = time.monotonic() + 5
+        while ai_matching.match_cache_stats()["coalesced"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join(5)
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(ai_matching.match_cache_stats()["hits"], 2)
+
+
+@override_settings(GOOGLE_PLACES_API_KEY="test-key")
+class GeocodingCacheTests(TestCase):
+    def setUp(self):
+        geocoding.clear_memory_cache()
+        http_client.reset()
+
+    def fake_response(self, payload):
+        resp = Mock(status_code=200)
+        resp.json.return_value = payload
+        return resp
+
+    @patch("stransport.http_client.requests.Session.request")
+    def test_repeat_address_served_from_memory_then_db(self, mock_get):
+        mock_get.return_value = self.fake_response(
+            {"status": "OK", "results": [{"geometry": {"location": {"lat": 32.1, "lng": 34.8}}}]}
+        )
+        self.assertEqual(geocoding.geocode_address("Sheba  Hospital"), (32.1, 34.8))
+        self.assertEqual(geocoding.geocode_address("sheba hospital "), (32.1, 34.8))
+        self.assertEqual(mock_get.call_count, 1)
+
+        geocoding.clear_memory_cache()
+        self.assertEqual(geocoding.geocode_address("Sheba Hospital"), (32.1, 34.8))
+        self.assertEqual(mock_get.call_count, 1)
+        stats = geocoding.geocode_cache_stats()
+        self.assertEqual(stats["db_hits"], 1)
+        self.assertEqual(stats["misses"], 0)
+
+    @patch("stransport.http_client.requests.Session.request")
+    def test_negative_results_cached_but_transient_errors_are_not(self, mock_get):
+        mock_get.return_value = self.fake_response({"status": "ZERO_RESULTS", "results": []})
+        self.assertIsNone(geocoding.geocode_address("nowhere"))
+        self.assertIsNone(geocoding.geocode_address("nowhere"))
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(geocoding.geocode_cache_stats()["negative_hits"], 1)
+
+        mock_get.side_effect = TimeoutError()
+        self.assertIsNone(geocoding.geocode_address("flaky"))
+        self.assertIsNone(geocoding.geocode_address("flaky"))
+        self.assertEqual(mock_get.call_count, 3)
+
+    def test_geocode_many_fetches_missing_addresses_concurrently(self):
+        import threading
+        import time
+
+        active = {"now": 0, "max": 0}
+        lock = threading.Lock()
+
+        def slow_get(method, url, params=None, timeout=None):
+            with lock:
+                active["now"] += 1
+                active["max"] = max(active["max"], active["now"])
+            time.sleep(0.05)
+            with lock:
+                active["now"] -= 1
+            return self.fake_response(
+                {"status": "OK", "results": [{"geometry": {"location": {"lat": 32.0, "lng": len(params["address"])}}}]}
+            )
+
+        with patch("stransport.http_client.requests.Session.request", side_effect=slow_get) as mock_get:
+            result = geocoding.geocode_many(["a", "bb", "ccc", "A ", "dddd"])
+        self.assertEqual(result["ccc"], (32.0, 3))
+        self.assertEqual(result["A "], result["a"])
+        self.assertEqual(mock_get.call_count, 4)
+        self.assertGreater(active["max"], 1)
+
+
+class OsrmMatrixCacheTests(TestCase):
+    def fake_osrm_get(self, method, url, params=None, timeout=None):
+        """OSRM מדומה: מרחק = הפרש קווי האורך * 100000."""
+        coords = [tuple(map(float, c.split(","))) for c in url.rsplit("/", 1)[1].split(";")]
+        everyone = list(range(len(coords)))
+        sources = [int(i) for i in params["sources"].split(";")] if "sources" in params else everyone
+        destinations = [int(i) for i in params["destinations"].split(";")] if "destinations" in params else everyone
+        matrix = [[abs(coords[s][0] - coords[d][0]) * 100000 for d in destinations] for s in sources]
+        resp = Mock(status_code=200)
+        resp.json.return_value = {"distances": matrix, "durations": matrix}
+        self.calls.append((len(sources), len(destinations)))
+        return resp
+
+    def setUp(self):
+        self.calls = []
+        http_client.reset()
+        patcher = patch("stransport.http_client.requests.Session.request", side_effect=self.fake_osrm_get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_replanning_with_one_new_stop_fetches_only_its_row_and_column(self):
+        stops = [(32.0, 34.70), (32.1, 34.75), (32.2, 34.80)]
+        first = osrm.osrm_table(stops, "http://osrm")
+        self.assertEqual(self.calls, [(3, 3)])
+
+        again = osrm.osrm_table(stops, "http://osrm")
+        self.assertEqual(again, first)
+        self.assertEqual(len(self.calls), 1)
+
+        result = osrm.osrm_table(stops + [(32.3, 34.90)], "http://osrm")
+        self.assertEqual(self.calls[1:], [(1, 4), (3, 1)])
+        self.assertAlmostEqual(result["distances"][0][3], 20000, places=3)
+        self.assertAlmostEqual(result["distances"][3][1], 15000, places=3)
+
+    def test_points_to_fetch_matches_the_reference_greedy_cover(self):
+        def reference(keys, cells):
+            known = set(range(len(keys)))
+
+            def missing_count(i):
+                return sum(((keys[i], keys[j]) not in cells) + ((keys[j], keys[i]) not in cells) for j in known)
+
+            while known:
+                worst = max(known, key=missing_count)
+                if missing_count(worst) == 0:
+                    break
+                known.remove(worst)
+            return [i for i in range(len(keys)) if i not in known]
+
+        rng = random.Random(7)
+        keys = [f"p{i}" for i in range(12)]
+        for _ in range(30):
+            cached = rng.sample(keys, rng.randint(1, len(keys)))
+            cells = {(a, b): (1.0, 1.0) for a in cached for b in cached if rng.random() > 0.05}
+            self.assertEqual(osrm._points_to_fetch(keys, cells), reference(keys, cells))
+
+        # מטמון קר – כל הנקודות בלי חישוב כיסוי
+        self.assertEqual(osrm._points_to_fetch(keys, {}), list(range(len(keys))))
+
+    def test_prune_route_matrix_cache_caps_size(self):
+        osrm.osrm_table([(32.0, 34.70), (32.1, 34.75)], "http://osrm")
+        self.assertEqual(RouteMatrixCell.objects.count(), 4)
+        with override_settings(OSRM_CACHE_MAX_CELLS=3):
+            result = prune_route_matrix_cache()
+        self.assertEqual(result["overflow"], 1)
+        self.assertEqual(RouteMatrixCell.objects.count(), 3)
+
+
+class RoadGraphTests(TestCase):
+    # רחוב דו-סטרי לאורך קו רוחב 32.080 ורחוב חד-סטרי (מערבה) לאורך 32.082, מחוברים בשני הקצוות
+    OSM_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="32.0800" lon="34.7800"/>
+  <node id="2" lat="32.0800" lon="34.7850"/>
+  <node id="3" lat="32.0800" lon="34.7900"/>
+  <node id="4" lat="32.0820" lon="34.7800"/>
+  <node id="5" lat="32.0820" lon="34.7900"/>
+  <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><tag k="highway" v="residential"/></way>
+  <way id="11"><nd ref="5"/><nd ref="4"/><tag k="highway" v="residential"/><tag k="oneway" v="yes"/></way>
+  <way id="12"><nd ref="1"/><nd ref="4"/><tag k="highway" v="residential"/></way>
+  <way id="13"><nd ref="3"/><nd ref="5"/><tag k="highway" v="residential"/></way>
+  <way id="14"><nd ref="2"/><nd ref="4"/><tag k="highway" v="footway"/></way>
+</osm>
+"""
+
+    def setUp(self):
+        import tempfile
+
+        road_graph.reset()
+        self.addCleanup(road_graph.reset)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.osm_path = f"{tmp.name}/roads.osm"
+        with open(self.osm_path, "w", encoding="utf-8") as fh:
+            fh.write(self.OSM_XML)
+        self.prepared_path = f"{tmp.name}/roads.json.gz"
+
+    def dijkstra(self, n, edges, source):
+        import heapq
+
+        adjacency = [[] for _ in range(n)]
+        for u, v, w, _d in edges:
+            adjacency[u].append((v, w))
+        best = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if cost > best[node]:
+                continue
+            for nxt, w in adjacency[node]:
+                if cost + w < best.get(nxt, float("inf")):
+                    best[nxt] = cost + w
+                    heapq.heappush(heap, (cost + w, nxt))
+        return best
+
+    def test_contraction_hierarchy_table_matches_dijkstra(self):
+        for seed in range(3):
+            rng = random.Random(seed)
+            k = 8
+            nodes = [(32.0 + i * 0.004, 34.8 + j * 0.004) for i in range(k) for j in range(k)]
+            edges = []
+            for u in range(k * k):
+                for v in ([u + 1] if u % k < k - 1 else []) + ([u + k] if u + k < k * k else []):
+                    d = rng.uniform(300, 600)
+                    if rng.random() < 0.85:
+                        edges.append((u, v, d / rng.uniform(8, 25), d))
+                    if rng.random() < 0.85:
+                        edges.append((v, u, d / rng.uniform(8, 25), d))
+            graph = road_graph.RoadGraph(nodes, edges)
+            picks = rng.sample(range(k * k), 12)
+            durations, _ = graph.table(picks, picks)
+            for i, source in enumerate(picks):
+                expected = self.dijkstra(k * k, edges, source)
+                for j, target in enumerate(picks):
+                    if target in expected:
+                        self.assertAlmostEqual(durations[i][j], expected[target], places=6)
+                        self.assertAlmostEqual(graph.route(source, target)[0], expected[target], places=6)
+                    else:
+                        self.assertIsNone(durations[i][j])
+
+    def test_osm_extract_prepared_and_served_like_osrm_table(self):
+        call_command("prepare_road_graph", self.osm_path, self.prepared_path, stdout=StringIO())
+        coords = [(32.0820, 34.7800), (32.0820, 34.7900), (31.0, 35.0)]
+        with override_settings(ROAD_GRAPH_PATH=self.prepared_path):
+            table = road_graph.local_table(coords)
+        # המזרח->מערב ברחוב החד-סטרי ישיר; בכיוון ההפוך מקיפים דרך הרחוב הדו-סטרי
+        self.assertGreater(table["distances"][0][1], table["distances"][1][0] * 1.3)
+        self.assertAlmostEqual(table["distances"][1][0], geo.haversine_meters(32.082, 34.79, 32.082, 34.78), delta=1)
+        self.assertGreater(table["durations"][0][1], 0)
+        # נקודה רחוקה מהגרף – None כמו תא ש-OSRM לא חישב
+        self.assertEqual(table["distances"][2], [None, None, 0.0])
+        self.assertIsNone(table["durations"][0][2])
+
+    @patch("stransport.views.osrm_table", return_value=None)
+    def test_suggest_route_falls_back_to_local_graph(self, mock_osrm):
+        user = User.objects.create_user(username="vol-local", password="1234")
+        Profile.objects.create(user=user, role="volunteer")
+        sick = User.objects.create_user(username="sick-local", password="1234")
+        req = TransportRequest.objects.create(
+            sick=sick,
+            pickup_address="Home",
+            destination="Hospital",
+            requested_time=timezone.now() + timedelta(hours=1),
+            pickup_lat=32.0820,
+            pickup_lng=34.7800,
+        )
+        client = Client()
+        client.login(username="vol-local", password="1234")
+        body = json.dumps({"start_lat": 32.0820, "start_lng": 34.7900, "request_ids": [req.id]})
+        with override_settings(ROAD_GRAPH_PATH=self.osm_path, ROUTE_PLAN_CACHE_SECONDS=0):
+            data = client.post(reverse("suggest_route_api"), body, content_type="application/json").json()
+            self.assertEqual(data["matrix_source"], "local")
+            mock_osrm.assert_called_once()
+            with override_settings(ROUTING_BACKEND="local"):
+                data = client.post(reverse("suggest_route_api"), body, content_type="application/json").json()
+            self.assertEqual(data["matrix_source"], "local")
+            mock_osrm.assert_called_once()
+        self.assertAlmostEqual(data["total_distance_m"], 940, delta=20)
@@ -20,7 +20,9 @@ urlpatterns = [
     path("api/requests/summary/<int:req_id>/", views.generate_summary_api, name="generate_summary_api"),
     path("api/requests/location/<int:req_id>/", views.volunteer_location_api, name="volunteer_location_api"),
     path("api/route/suggest/", views.suggest_route_api, name="suggest_route_api"),
+    path("api/route/jobs/<str:job_id>/", views.route_job_api, name="route_job_api"),
     path("api/route/links/", views.route_links_api, name="route_links_api"),
+    path("api/dispatch/proposals/", views.dispatch_proposals_api, name="dispatch_proposals_api"),
     path("guest/", views.guest_home, name="guest_home"),
     path("api/ai/offer/", views.ai_offer_api, name="ai_offer_api"),
     path("api/ai/request/", views.ai_request_api, name="ai_request_api"),
@@ -39,4 +41,6 @@ urlpatterns = [
     # Debug automation (token-protected, DEBUG only)
     path("api/debug/health/", debug_views.debug_health, name="debug_health"),
     path("api/debug/requests/location/<int:req_id>/", debug_views.debug_request_location, name="debug_request_location"),
+    # Cache/provider stats (staff only)
+    path("api/debug/cache-stats/", debug_views.debug_cache_stats, name="debug_cache_stats"),
 ]
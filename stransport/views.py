@@ -10,31 +10,59 @@ class FaviconView(View):
             raise Http404()
         return FileResponse(open(path, 'rb'), content_type='image/x-icon')
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from functools import wraps
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import UserCreationForm
 from django.http import JsonResponse
-from django.db import models
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.db import models, transaction
 from django.utils.dateparse import parse_datetime
 from django.contrib.auth.models import User
 from django.conf import settings
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 import logging
-import math
-import requests
 from django.core.exceptions import ValidationError
 from .models import (
+    DispatchProposal,
+    RouteJob,
     TransportRequest,
     TransportAssignment,
     Profile,
     TransportRejection,
     VolunteerLocation,
+    RequestOfferMatch,
     RideOffer,
+    expired_requests_q,
     normalize_israeli_phone,
+    refresh_geo_cells,
 )
-from .tasks import notify_new_request, generate_ai_summary
+from .tasks import dispatch_request_changed, notify_new_request, generate_ai_summary, plan_route_job
+from .geocoding import geocode_address, geocode_many
+from .osrm import osrm_table
+from .road_graph import local_table
+from .geo import haversine_matrix
+from .matching import (
+    MATCH_MIN_SCORE,
+    assignment_stamp,
+    enqueue_match_refresh,
+    live_score,
+    recommended_pairing,
+    score_request_against_offer,
+)
+from .route_optimizer import (
+    improve_route,
+    nearest_neighbor_order,
+    solve_pickup_delivery,
+    solve_time_windows,
+)
+from . import http_client
+import base64
+import hashlib
+import uuid
 import json
 import re
 import urllib.parse
@@ -189,7 +217,6 @@ def cors_json_response(response):
 # --- HOME ---
 @login_required
 def home(request):
-    delete_expired_requests()
     return render(request, "stransport/home.html", {"current_user": request.user})
 
 
@@ -200,12 +227,16 @@ def rides_api(request):
         return cors_json_response(resp)
     try:
         # Return recent transport requests as { id, from, to } for frontend
-        qs = TransportRequest.objects.all().order_by("-created_at")[:100]
+        page, next_cursor = keyset_page(TransportRequest.objects.all(), request)
+        rows = page.values_list("id", "pickup_address", "destination")
         data = [
-            {"id": r.id, "from": r.pickup_address or "", "to": r.destination or ""}
-            for r in qs
+            {"id": rid, "from": pickup or "", "to": destination or ""}
+            for rid, pickup, destination in rows
         ]
         resp = JsonResponse(data, safe=False)
+        # הגוף נשאר מערך (תאימות ל-frontend); הסמן לעמוד הבא נשלח בכותרת
+        if next_cursor:
+            resp["X-Next-Cursor"] = next_cursor
         return cors_json_response(resp)
     except Exception as e:
         resp = JsonResponse({"error": str(e)}, status=500)
@@ -213,6 +244,25 @@ def rides_api(request):
 
 
 # --- SERIALIZER ---
+SERIALIZER_RELATIONS = (
+    "sick",
+    "sick__profile",
+    "transportassignment",
+    "transportassignment__volunteer",
+    "transportassignment__volunteer__profile",
+)
+
+
+def serializer_queryset(qs=None):
+    """
+    מחיל select_related על כל מה ש-serialize_request קורא (מטופל, פרופיל, שיוך, מתנדב),
+    כך שרשימה בכל גודל נטענת בשאילתה אחת במקום 3–5 שאילתות לכל שורה.
+    """
+    if qs is None:
+        qs = TransportRequest.objects.all()
+    return qs.select_related(*SERIALIZER_RELATIONS)
+
+
 def serialize_request(r):
     assignment = getattr(r, "transportassignment", None)
     volunteer_info = None
@@ -253,45 +303,100 @@ def serialize_request(r):
     }
 
 
-def delete_expired_requests():
+# --- FAST SERIALIZER (values-based, for the JSON feeds) ---
+STATUS_LABELS = dict(TransportRequest.STATUS_CHOICES)
+
+SERIALIZER_VALUES = (
+    "id",
+    "sick_id",
+    "sick__username",
+    "sick__profile__phone",
+    "pickup_address",
+    "pickup_lat",
+    "pickup_lng",
+    "destination",
+    "dest_lat",
+    "dest_lng",
+    "requested_time",
+    "status",
+    "notes",
+    "no_volunteers_available",
+    "cancel_reason",
+    "ai_summary",
+    "transportassignment__id",
+    "transportassignment__volunteer_id",
+    "transportassignment__volunteer__username",
+    "transportassignment__volunteer__profile__phone",
+)
+
+
+def format_local_times(values):
     """
-    מחק: (1) בקשות שמועד האיסוף עבר (לפחות 30 דקות), מלבד בוטלו לאחרונה.
-    (2) בקשות מבוטלות ישנות – בוטלו לפני יותר מ־48 שעות (עד למחרת הביטול).
+    ממיר רשימת datetimes למחרוזות "%Y-%m-%d %H:%M" בשעון המקומי בבת אחת:
+    אזור הזמן נשלף פעם אחת, ובלי strftime לכל שורה.
     """
-    try:
-        now = timezone.now()
-        cutoff = now - timedelta(minutes=30)
-        cancel_keep = now - timedelta(days=2)
-
-        # (1) בקשות שמועדן עבר – לא למחוק בוטלו לאחרונה
-        qs = TransportRequest.objects.filter(requested_time__lt=cutoff).exclude(
-            models.Q(status="cancelled")
-            & (
-                models.Q(cancelled_at__gte=cancel_keep)
-                | (models.Q(cancelled_at__isnull=True) & models.Q(requested_time__gte=cancel_keep))
-            )
-        )
-        deleted_count, _ = qs.delete()
-        if deleted_count:
-            logger.info("delete_expired_requests: deleted %d request(s) with requested_time before %s", deleted_count, cutoff)
-
-        # (2) בקשות מבוטלות ישנות – בוטלו לפני יותר מ־48 שעות
-        old_cancelled = TransportRequest.objects.filter(
-            status="cancelled"
-        ).filter(
-            models.Q(cancelled_at__lt=cancel_keep) | models.Q(cancelled_at__isnull=True, requested_time__lt=cancel_keep)
-        )
-        cancelled_count, _ = old_cancelled.delete()
-        if cancelled_count:
-            logger.info("delete_expired_requests: deleted %d old cancelled request(s)", cancelled_count)
-    except Exception:
-        logger.warning("Failed to delete expired transport requests", exc_info=True)
+    tz = timezone.get_current_timezone()
+    out = []
+    for value in values:
+        if not timezone.is_naive(value):
+            value = value.astimezone(tz)
+        out.append(f"{value.year:04d}-{value.month:02d}-{value.day:02d} {value.hour:02d}:{value.minute:02d}")
+    return out
+
+
+def serialize_request_values(qs, now=None):
+    """
+    אותו פלט JSON כמו serialize_request, אבל מתוך values() – בלי ליצור מופעי מודל.
+    אם מועבר now, מוסיף גם את השדה "expired" כמו ב-feeds.
+    """
+    rows = list(qs.values(*SERIALIZER_VALUES))
+    times = format_local_times([row["requested_time"] for row in rows])
+    data = []
+    for row, requested_time in zip(rows, times):
+        status = row["status"]
+        status_display = STATUS_LABELS.get(status, status)
+        volunteer_info = None
+        if row["transportassignment__id"] is not None:
+            volunteer_info = {
+                "id": row["transportassignment__volunteer_id"],
+                "username": row["transportassignment__volunteer__username"],
+                "phone": row["transportassignment__volunteer__profile__phone"] or "",
+            }
+        d = {
+            "id": row["id"],
+            "sick_id": row["sick_id"],
+            "sick_username": row["sick__username"],
+            "pickup": row["pickup_address"],
+            "pickup_lat": row["pickup_lat"],
+            "pickup_lng": row["pickup_lng"],
+            "destination": row["destination"],
+            "dest_lat": row["dest_lat"],
+            "dest_lng": row["dest_lng"],
+            "requested_time": requested_time,
+            "status": status,
+            "status_display": status_display,
+            "status_label": (
+                "No volunteers available"
+                if (status == "cancelled" and row["no_volunteers_available"])
+                else status_display
+            ),
+            "notes": row["notes"],
+            "phone": row["sick__profile__phone"] or "",
+            "volunteer": volunteer_info,
+            "no_volunteers_available": row["no_volunteers_available"],
+            "cancel_reason": row["cancel_reason"],
+            "ai_summary": row["ai_summary"],
+        }
+        if now is not None:
+            d["expired"] = row["requested_time"] < now
+        data.append(d)
+    return data
 
 
 def check_request_not_expired(ride_request):
     """
     Block actions on a request whose time has passed.
-    Do not delete here; deletion happens the next day in delete_expired_requests().
+    Do not delete here; deletion happens in the scheduled purge_expired_requests task.
     """
     if ride_request.requested_time < timezone.now():
         return JsonResponse(
@@ -313,134 +418,6 @@ def parse_optional_float(value):
         return None
 
 
-def haversine_meters(lat1, lng1, lat2, lng2):
-    radius = 6371000
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lng2 - lng1)
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return radius * c
-
-
-def osrm_table(coords, base_url):
-    if not coords:
-        return None
-
-    coord_str = ";".join([f"{lng},{lat}" for lat, lng in coords])
-    url = f"{base_url.rstrip('/')}/table/v1/driving/{coord_str}"
-    try:
-        resp = requests.get(
-            url,
-            params={"annotations": "distance,duration"},
-            timeout=6,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        return {
-            "distances": data.get("distances"),
-            "durations": data.get("durations"),
-        }
-    except Exception:
-        logger.warning("OSRM table failed", exc_info=True)
-        return None
-
-
-def geocode_address(address=None, place_id=None):
-    api_key = getattr(settings, "GOOGLE_PLACES_API_KEY", "")
-    if not api_key or (not address and not place_id):
-        return None
-    try:
-        params = {"key": api_key, "region": "IL"}
-        if place_id:
-            params["place_id"] = place_id
-        else:
-            params["address"] = address
-        resp = requests.get(
-            "https://maps.googleapis.com/maps/api/geocode/json",
-            params=params,
-            timeout=6,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        if data.get("status") != "OK":
-            return None
-        result = (data.get("results") or [None])[0]
-        if not result:
-            return None
-        location = result.get("geometry", {}).get("location")
-        if not location:
-            return None
-        return (location.get("lat"), location.get("lng"))
-    except Exception:
-        logger.warning("Geocoding failed", exc_info=True)
-        return None
-
-
-def nearest_neighbor_order(start_coord, pickup_coords, matrix=None):
-    if not pickup_coords:
-        return []
-
-    remaining = set(range(len(pickup_coords)))
-    order = []
-    current = start_coord
-    current_index = 0
-
-    while remaining:
-        best = None
-        best_dist = None
-        for idx in remaining:
-            if matrix:
-                dist = matrix[current_index][idx + 1]
-            else:
-                dist = haversine_meters(current[0], current[1], pickup_coords[idx][0], pickup_coords[idx][1])
-            if best is None or dist < best_dist:
-                best = idx
-                best_dist = dist
-        order.append(best)
-        current = pickup_coords[best]
-        current_index = best + 1
-        remaining.remove(best)
-    return order
-
-
-def two_opt(order, coords, start_coord, matrix=None):
-    if len(order) < 4:
-        return order
-
-    def route_length(ord_list):
-        total = 0
-        prev = start_coord
-        prev_index = 0
-        for idx in ord_list:
-            next_coord = coords[idx]
-            if matrix:
-                total += matrix[prev_index][idx + 1]
-            else:
-                total += haversine_meters(prev[0], prev[1], next_coord[0], next_coord[1])
-            prev = next_coord
-            prev_index = idx + 1
-        return total
-
-    improved = True
-    best = order[:]
-    best_len = route_length(best)
-
-    while improved:
-        improved = False
-        for i in range(1, len(best) - 1):
-            for j in range(i + 1, len(best)):
-                candidate = best[:i] + best[i:j][::-1] + best[j:]
-                cand_len = route_length(candidate)
-                if cand_len < best_len:
-                    best = candidate
-                    best_len = cand_len
-                    improved = True
-        order = best
-    return best
-
-
 def broadcast_request_event(event, request_obj, notify_volunteers=True, notify_patient=True):
     channel_layer = get_channel_layer()
     if not channel_layer:
@@ -461,34 +438,176 @@ def broadcast_request_event(event, request_obj, notify_volunteers=True, notify_p
         logger.warning("Failed to broadcast realtime event", exc_info=True)
 
 
+def enqueue_dispatch_update(request_id):
+    """עדכון אינקרמנטלי של הצעות השיבוץ – אחרי ה-commit, כדי שה-worker יראה את השינוי."""
+
+    def enqueue():
+        try:
+            dispatch_request_changed.delay(request_id)
+        except Exception:
+            logger.warning("Failed to enqueue dispatch_request_changed", exc_info=True)
+
+    transaction.on_commit(enqueue)
+
+
+# --- CURSOR (KEYSET) PAGINATION ---
+def feed_page_size(request, default=None):
+    """page_size מה-querystring, חסום ל-FEED_MAX_PAGE_SIZE."""
+    default = default or getattr(settings, "FEED_PAGE_SIZE", 100)
+    max_size = getattr(settings, "FEED_MAX_PAGE_SIZE", 500)
+    try:
+        size = int(request.GET.get("page_size") or default)
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, max_size))
+
+
+def encode_cursor(value, pk):
+    raw = json.dumps([value.isoformat(), pk]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """מחזיר (datetime, id) או None אם הטוקן לא תקין."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        parsed = parse_datetime(value)
+        if parsed is None:
+            return None
+        return parsed, int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_page(qs, request, field="created_at", descending=True, default_size=None):
+    """
+    עימוד keyset על (field, id): מחזיר (queryset של העמוד, next_cursor או None).
+    שאילתת המפתחות נעשית לפני שאילתת העמוד, והעמוד נשלף לפי id – כך ששורות חדשות
+    שנוספו בין הבקשות לא מזיזות את הסמן ולא גורמות לדילוג.
+    """
+    size = feed_page_size(request, default_size)
+    token = request.GET.get("cursor")
+    cursor = decode_cursor(token) if token else None
+    if cursor:
+        value, pk = cursor
+        if descending:
+            qs = qs.filter(models.Q(**{f"{field}__lt": value}) | models.Q(**{field: value, "id__lt": pk}))
+        else:
+            qs = qs.filter(models.Q(**{f"{field}__gt": value}) | models.Q(**{field: value, "id__gt": pk}))
+    ordering = (f"-{field}", "-id") if descending else (field, "id")
+    qs = qs.order_by(*ordering)
+
+    keys = list(qs.values_list(field, "id")[: size + 1])
+    next_cursor = None
+    if len(keys) > size:
+        keys = keys[:size]
+        next_cursor = encode_cursor(*keys[-1])
+    page = qs.model.objects.filter(id__in=[pk for _value, pk in keys]).order_by(*ordering)
+    return page, next_cursor
+
+
+# --- CONDITIONAL GET (ETag) FOR POLLED FEEDS ---
+def version_digest(*parts):
+    return hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:24]
+
+
+def make_etag(*parts):
+    return f'"{version_digest(*parts)}"'
+
+
+def feed_stamp(qs, now):
+    """
+    חותמת גרסה זולה ל-feed: max(updated_at) + מספר שורות + כמה מהן כבר "expired"
+    (הדגל expired משתנה עם הזמן גם בלי שינוי בנתונים). שאילתת aggregate אחת.
+    """
+    agg = qs.order_by().aggregate(
+        last=models.Max("updated_at"),
+        total=models.Count("id"),
+        expired=models.Count("id", filter=models.Q(requested_time__lt=now)),
+    )
+    last = agg["last"].isoformat() if agg["last"] else ""
+    return f"{last}:{agg['total']}:{agg['expired']}"
+
+
+def conditional_json(request, etag, build):
+    """
+    מחזיר 304 אם If-None-Match תואם ל-etag, אחרת בונה את התשובה (build) ומצמיד ETag.
+    Cache-Control: no-cache גורם לדפדפן לאמת מחדש בכל poll.
+    """
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        patch_cache_control(not_modified, private=True, no_cache=True)
+        return not_modified
+    response = build()
+    if response.status_code == 200:
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+# --- FEED QUERYSETS (shared by the API views and the explain_feeds command) ---
+def open_feed_queryset(role, user, now):
+    """
+    בקשות פתוחות מהיממה האחרונה לפי תפקיד. user=None = קריאת אורח (ללא סינון לפי משתמש).
+    """
+    cutoff = now - timedelta(days=1)
+    if role == "volunteer":
+        qs = TransportRequest.objects.filter(status="open", no_volunteers_available=False)
+        if user is not None:
+            qs = qs.exclude(rejections__volunteer=user)
+    elif role == "sick":
+        # guest: show open requests read-only; user: show only their requests
+        if user is None:
+            qs = TransportRequest.objects.filter(status="open")
+        else:
+            qs = TransportRequest.objects.filter(sick=user, status="open")
+    else:
+        qs = TransportRequest.objects.none()
+    return qs.filter(requested_time__gte=cutoff).exclude(expired_requests_q(now)).order_by("-created_at")
+
+
+def accepted_feed_queryset(volunteer, now):
+    cutoff = now - timedelta(days=1)
+    return (
+        TransportRequest.objects.filter(
+            transportassignment__volunteer=volunteer,
+            status="accepted",
+            requested_time__gte=cutoff,
+        )
+        .exclude(expired_requests_q(now))
+        .distinct()
+        .order_by("requested_time")
+    )
+
+
+def closed_feed_queryset(sick, now):
+    cutoff = now - timedelta(days=1)
+    # בקשות מבוטלות: להציג עד למחרת הביטול (48 שעות)
+    cancel_cutoff = now - timedelta(days=2)
+    return TransportRequest.objects.filter(sick=sick).filter(
+        models.Q(status="done", requested_time__gte=cutoff)
+        | models.Q(status="accepted", transportassignment__isnull=False, requested_time__gte=cutoff)
+        | models.Q(status="cancelled", cancelled_at__gte=cancel_cutoff)
+        | models.Q(status="cancelled", cancelled_at__isnull=True, requested_time__gte=cancel_cutoff)
+    ).exclude(expired_requests_q(now)).order_by("requested_time")
+
+
 # --- API: OPEN REQUESTS ---
 @login_required_json
 def requests_api(request):
     try:
-        delete_expired_requests()
         is_guest_read = request.GET.get("guest") == "1" and not request.user.is_authenticated
         role = getattr(request.user.profile, "role", "") if not is_guest_read else (request.GET.get("role") or "sick")
         now = timezone.now()
-        cutoff = now - timedelta(days=1)
-        if role == "volunteer":
-            qs = TransportRequest.objects.filter(status="open", no_volunteers_available=False)
-            if not is_guest_read:
-                qs = qs.exclude(rejections__volunteer=request.user)
-        elif role == "sick":
-            # guest: show open requests read-only; user: show only their requests
-            if is_guest_read:
-                qs = TransportRequest.objects.filter(status="open")
-            else:
-                qs = TransportRequest.objects.filter(sick=request.user, status="open")
-        else:
-            qs = TransportRequest.objects.none()
-        qs = qs.filter(requested_time__gte=cutoff).order_by("-created_at")
-        data = []
-        for r in qs:
-            d = serialize_request(r)
-            d["expired"] = r.requested_time < now
-            data.append(d)
-        return JsonResponse({"requests": data})
+        qs = open_feed_queryset(role, None if is_guest_read else request.user, now)
+        etag = make_etag("requests", role, request.user.pk, request.GET.urlencode(), feed_stamp(qs, now))
+
+        def build():
+            page, next_cursor = keyset_page(qs, request)
+            return JsonResponse({"requests": serialize_request_values(page, now), "next_cursor": next_cursor})
+
+        return conditional_json(request, etag, build)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -564,6 +683,7 @@ def create_request_api(request):
         except Exception:
             logger.warning("Failed to enqueue notify_new_request", exc_info=True)
         broadcast_request_event("request_created", r)
+        enqueue_dispatch_update(r.id)
         return JsonResponse({"success": True, "id": r.id})
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
@@ -589,6 +709,7 @@ def accept_request_api(request, req_id):
         ride_request.save()
         TransportRejection.objects.filter(request=ride_request).delete()
         broadcast_request_event("request_accepted", ride_request)
+        enqueue_dispatch_update(ride_request.id)
         return JsonResponse({"success": True})
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
@@ -627,6 +748,7 @@ def reject_request_api(request, req_id):
             ride_request.cancel_reason = "no_volunteers"
             ride_request.cancelled_at = timezone.now()
             ride_request.save()
+            enqueue_dispatch_update(ride_request.id)
 
         broadcast_request_event("request_rejected", ride_request)
 
@@ -660,6 +782,7 @@ def cancel_request_api(request, req_id):
         ride_request.cancelled_at = timezone.now()
         ride_request.save()
         broadcast_request_event("request_cancelled", ride_request)
+        enqueue_dispatch_update(ride_request.id)
         return JsonResponse({"success": True})
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
@@ -669,29 +792,24 @@ def cancel_request_api(request, req_id):
 @login_required_json
 def accepted_requests_api(request):
     try:
-        delete_expired_requests()
         is_guest_read = request.GET.get("guest") == "1" and not request.user.is_authenticated
         if is_guest_read:
             return JsonResponse({"requests": []})
         if request.user.profile.role != "volunteer":
             return JsonResponse({"requests": []})
         now = timezone.now()
-        cutoff = now - timedelta(days=1)
-        reqs = (
-            TransportRequest.objects.filter(
-                transportassignment__volunteer=request.user,
-                status="accepted",
-                requested_time__gte=cutoff,
-            )
-            .distinct()
-            .order_by("requested_time")
-        )
-        data = []
-        for r in reqs:
-            d = serialize_request(r)
-            d["expired"] = r.requested_time < now
-            data.append(d)
-        return JsonResponse({"requests": data})
+        qs = accepted_feed_queryset(request.user, now)
+        etag = make_etag("accepted", request.user.pk, feed_stamp(qs, now))
+
+        def build():
+            data = []
+            for r in serializer_queryset(qs):
+                d = serialize_request(r)
+                d["expired"] = r.requested_time < now
+                data.append(d)
+            return JsonResponse({"requests": data})
+
+        return conditional_json(request, etag, build)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -700,7 +818,6 @@ def accepted_requests_api(request):
 @login_required_json
 def closed_requests_api(request):
     try:
-        delete_expired_requests()
         is_guest_read = request.GET.get("guest") == "1" and not request.user.is_authenticated
         if is_guest_read:
             return JsonResponse({"requests": []})
@@ -708,22 +825,17 @@ def closed_requests_api(request):
             return JsonResponse({"requests": []})
 
         now = timezone.now()
-        cutoff = now - timedelta(days=1)
-        # בקשות מבוטלות: להציג עד למחרת הביטול (48 שעות)
-        cancel_cutoff = now - timedelta(days=2)
-        qs = TransportRequest.objects.filter(sick=request.user).filter(
-            models.Q(status="done", requested_time__gte=cutoff)
-            | models.Q(status="accepted", transportassignment__isnull=False, requested_time__gte=cutoff)
-            | models.Q(status="cancelled", cancelled_at__gte=cancel_cutoff)
-            | models.Q(status="cancelled", cancelled_at__isnull=True, requested_time__gte=cancel_cutoff)
-        ).order_by("requested_time")
+        # עימוד לפי (requested_time, id) עולה – שומר על סדר התצוגה הקיים
+        page, next_cursor = keyset_page(
+            closed_feed_queryset(request.user, now), request, field="requested_time", descending=False
+        )
 
         data = []
-        for r in qs:
+        for r in serializer_queryset(page):
             d = serialize_request(r)
             d["expired"] = r.requested_time < now
             data.append(d)
-        return JsonResponse({"requests": data})
+        return JsonResponse({"requests": data, "next_cursor": next_cursor})
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -859,118 +971,238 @@ def volunteer_location_api(request, req_id):
 
 
 # --- API: ROUTE SUGGESTION ---
-@csrf_exempt
-@login_required_json
-def suggest_route_api(request):
-    if request.method != "POST":
-        return JsonResponse({"error": "Invalid request"}, status=400)
-    try:
-        if request.user.profile.role != "volunteer":
-            return JsonResponse({"error": "Only volunteers can suggest routes"}, status=403)
-
-        delete_expired_requests()
-
-        data = json.loads(request.body or "{}")
-        start_lat = parse_optional_float(data.get("start_lat"))
-        start_lng = parse_optional_float(data.get("start_lng"))
-        request_ids = data.get("request_ids", [])
-        mode = data.get("mode", "pickup_only")
-
-        if start_lat is None or start_lng is None:
-            return JsonResponse({"error": "Missing start location"}, status=400)
-        if not isinstance(request_ids, list) or not request_ids:
-            return JsonResponse({"error": "No requests selected"}, status=400)
-        if len(request_ids) > 6:
-            return JsonResponse({"error": "Max 6 requests"}, status=400)
-        if mode not in {"pickup_only", "pickup_then_dropoff"}:
-            return JsonResponse({"error": "Invalid mode"}, status=400)
-
-        now = timezone.now()
-        # אפשר לבחור גם בקשות פתוחות וגם בקשות מאושרות (שהמתנדב מקושר אליהן)
-        qs = TransportRequest.objects.filter(id__in=request_ids).filter(
-            models.Q(
-                status="open",
-                no_volunteers_available=False,
-                requested_time__gte=now,
-            )
-            | models.Q(
-                status="accepted",
-                transportassignment__volunteer=request.user,
-            )
-        ).distinct()
-        requests_map = {r.id: r for r in qs}
-        if len(requests_map) != len(request_ids):
-            return JsonResponse({"error": "Some requests are not available or not assigned to you"}, status=400)
-
-        for req in requests_map.values():
-            updated = False
-            if req.pickup_address and (req.pickup_lat is None or req.pickup_lng is None):
-                coords = geocode_address(req.pickup_address)
-                if coords:
-                    req.pickup_lat, req.pickup_lng = coords
-                    updated = True
-            if mode == "pickup_then_dropoff" and req.destination and (req.dest_lat is None or req.dest_lng is None):
-                coords = geocode_address(req.destination)
-                if coords:
-                    req.dest_lat, req.dest_lng = coords
-                    updated = True
-            if updated:
-                req.save(update_fields=["pickup_lat", "pickup_lng", "dest_lat", "dest_lng"])
-
-        missing_coords = [
-            r.id
-            for r in requests_map.values()
-            if r.pickup_lat is None
-            or r.pickup_lng is None
-            or (mode == "pickup_then_dropoff" and (r.dest_lat is None or r.dest_lng is None))
-        ]
+def route_plan_cache_key(start_coord, requests, mode, capacity, use_time_windows, departure_time):
+    """
+    מפתח מטמון לתוצאת suggest_route_api: נקודת מוצא מעוגלת (ROUTE_PLAN_START_PRECISION),
+    הבקשות לפי id עם status/קואורדינטות/updated_at, מצב, קיבולת וחלונות זמן.
+    כל שינוי בבקשה (סטטוס, קואורדינטות, עדכון) יוצר מפתח חדש – הישן פשוט פג ב-TTL.
+    """
+    precision = int(getattr(settings, "ROUTE_PLAN_START_PRECISION", 3))
+    start = (round(start_coord[0], precision), round(start_coord[1], precision))
+    versions = [
+        (r.id, r.status, r.pickup_lat, r.pickup_lng, r.dest_lat, r.dest_lng, r.updated_at.isoformat())
+        for r in sorted(requests, key=lambda r: r.id)
+    ]
+    departure = departure_time.strftime("%Y%m%d%H%M") if use_time_windows and departure_time else ""
+    return "route-plan:" + version_digest(start, versions, mode, capacity, use_time_windows, departure)
 
-        missing_dest = [
-            r.id
-            for r in requests_map.values()
-            if mode == "pickup_then_dropoff" and (r.dest_lat is None or r.dest_lng is None)
-        ]
 
-        warning = None
-        if mode == "pickup_then_dropoff" and missing_dest:
-            mode = "pickup_only"
-            warning = "יש בקשות ללא יעד. מחשב מסלול לאיסופים בלבד."
+def compute_route_plan(user, data):
+    """
+    חישוב מסלול למתנדב (גוף suggest_route_api): בדיקת הבקשות, גיאוקודינג, מטריצה ואופטימיזציה.
+    רץ בתוך ה-view (סינכרוני) או ב-plan_route_job (Celery). מחזיר (payload, http_status).
+    """
+    start_lat = parse_optional_float(data.get("start_lat"))
+    start_lng = parse_optional_float(data.get("start_lng"))
+    request_ids = data.get("request_ids", [])
+    mode = data.get("mode", "pickup_only")
+
+    if start_lat is None or start_lng is None:
+        return {"error": "Missing start location"}, 400
+    if not isinstance(request_ids, list) or not request_ids:
+        return {"error": "No requests selected"}, 400
+    max_stops = int(getattr(settings, "ROUTE_MAX_STOPS", 50))
+    if len(request_ids) > max_stops:
+        return {"error": f"Max {max_stops} requests"}, 400
+    if mode not in {"pickup_only", "pickup_then_dropoff"}:
+        return {"error": "Invalid mode"}, 400
+    try:
+        capacity = int(data.get("capacity") or getattr(settings, "ROUTE_VEHICLE_CAPACITY", 3))
+    except (TypeError, ValueError):
+        return {"error": "Invalid capacity"}, 400
+    if not 1 <= capacity <= 8:
+        return {"error": "Invalid capacity"}, 400
+    use_time_windows = bool(data.get("time_windows"))
+    departure_time = None
+    if data.get("departure_time"):
+        departure_time = parse_datetime(str(data.get("departure_time")))
+        if departure_time is None:
+            return {"error": "Invalid departure_time"}, 400
+        if timezone.is_naive(departure_time):
+            departure_time = timezone.make_aware(departure_time, timezone.get_current_timezone())
 
-        valid_requests = [r for r in requests_map.values() if r.id not in set(missing_coords)]
-        if not valid_requests:
-            return JsonResponse(
-                {
-                    "success": True,
-                    "mode": mode,
-                    "stops": [],
-                    "legs": [],
-                    "total_distance_m": 0,
-                    "total_duration_s": 0,
-                    "matrix_source": "n/a",
-                    "skipped": missing_coords,
-                    "warning": "אין בקשות עם קואורדינטות למסלול.",
-                }
+    now = timezone.now()
+    # אפשר לבחור גם בקשות פתוחות וגם בקשות מאושרות (שהמתנדב מקושר אליהן)
+    qs = TransportRequest.objects.filter(id__in=request_ids).filter(
+        models.Q(
+            status="open",
+            no_volunteers_available=False,
+            requested_time__gte=now,
+        )
+        | models.Q(
+            status="accepted",
+            transportassignment__volunteer=user,
+        )
+    ).exclude(expired_requests_q(now)).distinct()
+    requests_map = {r.id: r for r in qs}
+    if len(requests_map) != len(request_ids):
+        return {"error": "Some requests are not available or not assigned to you"}, 400
+
+    # קואורדינטות חסרות: גיאוקודינג מקבילי לכל הכתובות ואז bulk_update אחד
+    need_pickup = [
+        r for r in requests_map.values()
+        if r.pickup_address and (r.pickup_lat is None or r.pickup_lng is None)
+    ]
+    need_dest = [
+        r for r in requests_map.values()
+        if mode == "pickup_then_dropoff" and r.destination and (r.dest_lat is None or r.dest_lng is None)
+    ]
+    if need_pickup or need_dest:
+        resolved = geocode_many(
+            [r.pickup_address for r in need_pickup] + [r.destination for r in need_dest]
+        )
+        updated = {}
+        for req in need_pickup:
+            coords = resolved.get(req.pickup_address)
+            if coords:
+                req.pickup_lat, req.pickup_lng = coords
+                updated[req.id] = req
+        for req in need_dest:
+            coords = resolved.get(req.destination)
+            if coords:
+                req.dest_lat, req.dest_lng = coords
+                updated[req.id] = req
+        if updated:
+            for req in updated.values():
+                req.updated_at = now
+                # bulk_update לא עובר ב-save – מעדכנים את תאי ה-geohash כאן
+                refresh_geo_cells(req, req.GEO_CELLS, {})
+            TransportRequest.objects.bulk_update(
+                list(updated.values()),
+                ["pickup_lat", "pickup_lng", "dest_lat", "dest_lng", "pickup_cell", "dest_cell", "updated_at"],
             )
+            # וגם את טבלת ההתאמות – הקואורדינטות החדשות משנות את הניקוד
+            for req in updated.values():
+                enqueue_match_refresh("request", req.id)
+
+    plan_key = route_plan_cache_key(
+        (start_lat, start_lng),
+        requests_map.values(),
+        mode,
+        capacity,
+        use_time_windows,
+        departure_time or now,
+    )
+    cached_plan = cache.get(plan_key)
+    if cached_plan is not None:
+        return dict(cached_plan, cache="hit"), 200
+
+    missing_coords = [
+        r.id
+        for r in requests_map.values()
+        if r.pickup_lat is None
+        or r.pickup_lng is None
+        or (mode == "pickup_then_dropoff" and (r.dest_lat is None or r.dest_lng is None))
+    ]
+
+    missing_dest = [
+        r.id
+        for r in requests_map.values()
+        if mode == "pickup_then_dropoff" and (r.dest_lat is None or r.dest_lng is None)
+    ]
+
+    warning = None
+    if mode == "pickup_then_dropoff" and missing_dest:
+        mode = "pickup_only"
+        warning = "יש בקשות ללא יעד. מחשב מסלול לאיסופים בלבד."
+
+    valid_requests = [r for r in requests_map.values() if r.id not in set(missing_coords)]
+    if not valid_requests:
+        return (
+            {
+                "success": True,
+                "mode": mode,
+                "stops": [],
+                "legs": [],
+                "total_distance_m": 0,
+                "total_duration_s": 0,
+                "matrix_source": "n/a",
+                "skipped": missing_coords,
+                "warning": "אין בקשות עם קואורדינטות למסלול.",
+            },
+            200,
+        )
 
-        pickup_coords = [(r.pickup_lat, r.pickup_lng) for r in valid_requests]
-        pickups_list = list(valid_requests)
-        start_coord = (start_lat, start_lng)
+    pickup_coords = [(r.pickup_lat, r.pickup_lng) for r in valid_requests]
+    pickups_list = list(valid_requests)
+    start_coord = (start_lat, start_lng)
 
-        coords_for_matrix = [start_coord] + pickup_coords
-        if mode == "pickup_then_dropoff":
-            coords_for_matrix += [(r.dest_lat, r.dest_lng) for r in pickups_list]
+    coords_for_matrix = [start_coord] + pickup_coords
+    if mode == "pickup_then_dropoff":
+        coords_for_matrix += [(r.dest_lat, r.dest_lng) for r in pickups_list]
 
+    osrm = None
+    if getattr(settings, "ROUTING_BACKEND", "osrm") != "local":
         osrm = osrm_table(coords_for_matrix, settings.OSRM_BASE_URL)
-        matrix_dist = osrm["distances"] if osrm else None
-        matrix_dur = osrm["durations"] if osrm else None
-
-        order = nearest_neighbor_order(start_coord, pickup_coords, matrix_dist)
-        order = two_opt(order, pickup_coords, start_coord, matrix_dist)
-
-        ordered_requests = [pickups_list[idx] for idx in order]
+        matrix_source = "osrm"
+    if not osrm:
+        # OSRM לא זמין / לא בשימוש – גרף הכבישים המקומי, אם הוגדר
+        osrm = local_table(coords_for_matrix)
+        matrix_source = "local"
+    fallback = haversine_matrix(coords_for_matrix)
+    if osrm:
+        # תאים ש-OSRM לא הצליח לחשב (None) – קו אווירי
+        matrix_dist = [
+            [v if v is not None else fallback[i][j] for j, v in enumerate(row)]
+            for i, row in enumerate(osrm["distances"])
+        ]
+        matrix_dur = [
+            [v if v is not None else fallback[i][j] / 11.11 for j, v in enumerate(row)]
+            for i, row in enumerate(osrm["durations"])
+        ]
+    else:
+        matrix_dist = fallback
+        matrix_dur = [[v / 11.11 for v in row] for row in fallback]
+
+    # אינדקסים במטריצה: 0 = מוצא, 1..n = איסופים, n+1..2n = יעדים
+    count = len(pickups_list)
+    pickup_nodes = list(range(1, count + 1))
+    max_passes = int(getattr(settings, "ROUTE_MAX_PASSES", 200))
+    time_budget_ms = int(getattr(settings, "ROUTE_TIME_BUDGET_MS", 300))
+    schedule = None
+    if use_time_windows:
+        # חלון לאיסוף סביב requested_time; להורדות אין חלון
+        departure_time = departure_time or now
+        early = int(getattr(settings, "ROUTE_PICKUP_EARLY_MINUTES", 15)) * 60
+        grace = int(getattr(settings, "ROUTE_PICKUP_GRACE_MINUTES", 10)) * 60
+        windows = {}
+        for node in pickup_nodes:
+            offset = (pickups_list[node - 1].requested_time - departure_time).total_seconds()
+            windows[node] = (offset - early, offset + grace)
+        order, schedule, search_stats = solve_time_windows(
+            matrix_dur,
+            windows,
+            stops=pickup_nodes if mode == "pickup_only" else None,
+            pairs=[(node, node + count) for node in pickup_nodes] if mode == "pickup_then_dropoff" else None,
+            capacity=capacity if mode == "pickup_then_dropoff" else None,
+            service_s=int(getattr(settings, "ROUTE_SERVICE_SECONDS", 120)),
+            lateness_weight=float(getattr(settings, "ROUTE_LATENESS_WEIGHT", 10)),
+            max_passes=max_passes,
+            time_budget_ms=time_budget_ms,
+        )
+    elif mode == "pickup_then_dropoff":
+        # איסופים והורדות משולבים, הורדה אחרי האיסוף שלה ולא יותר מ-capacity נוסעים
+        order, search_stats = solve_pickup_delivery(
+            matrix_dist,
+            [(node, node + count) for node in pickup_nodes],
+            capacity,
+            max_passes=max_passes,
+            time_budget_ms=time_budget_ms,
+        )
+    else:
+        order = nearest_neighbor_order(matrix_dist, pickup_nodes)
+        order, search_stats = improve_route(
+            order,
+            matrix_dist,
+            max_passes=max_passes,
+            time_budget_ms=time_budget_ms,
+        )
+    route_nodes = [0] + order
 
-        stops = []
-        for req in ordered_requests:
+    stops = []
+    for node in order:
+        if node <= count:
+            req = pickups_list[node - 1]
             stops.append(
                 {
                     "type": "pickup",
@@ -980,69 +1212,201 @@ def suggest_route_api(request):
                     "lng": req.pickup_lng,
                 }
             )
-        if mode == "pickup_then_dropoff":
-            for req in ordered_requests:
-                stops.append(
-                    {
-                        "type": "dropoff",
-                        "request_id": req.id,
-                        "label": req.destination,
-                        "lat": req.dest_lat,
-                        "lng": req.dest_lng,
-                    }
-                )
+        else:
+            req = pickups_list[node - count - 1]
+            stops.append(
+                {
+                    "type": "dropoff",
+                    "request_id": req.id,
+                    "label": req.destination,
+                    "lat": req.dest_lat,
+                    "lng": req.dest_lng,
+                }
+            )
 
-        nodes = [
+    schedule_summary = None
+    if schedule is not None:
+        for position, (stop, item) in enumerate(zip(stops, schedule)):
+            window = windows.get(route_nodes[position + 1])
+            stop["eta"] = timezone.localtime(departure_time + timedelta(seconds=item["arrival_s"])).isoformat()
+            stop["wait_s"] = round(item["wait_s"])
+            stop["lateness_s"] = round(item["lateness_s"])
+            stop["on_time"] = item["lateness_s"] <= 0
+            if window:
+                stop["window_start"] = timezone.localtime(departure_time + timedelta(seconds=window[0])).isoformat()
+                stop["window_end"] = timezone.localtime(departure_time + timedelta(seconds=window[1])).isoformat()
+        schedule_summary = {
+            "feasible": search_stats["late_stops"] == 0,
+            "late_stops": search_stats["late_stops"],
+            "total_lateness_s": round(search_stats["total_lateness_s"]),
+            "departure_time": timezone.localtime(departure_time).isoformat(),
+            "finish_time": timezone.localtime(
+                departure_time + timedelta(seconds=schedule[-1]["departure_s"] if schedule else 0)
+            ).isoformat(),
+        }
+
+    nodes = [
+        {
+            "type": "start",
+            "label": "start",
+            "lat": start_lat,
+            "lng": start_lng,
+        }
+    ] + stops
+
+    total_distance = 0
+    total_duration = 0
+    legs = []
+
+    for idx in range(len(nodes) - 1):
+        a = nodes[idx]
+        b = nodes[idx + 1]
+        dist = matrix_dist[route_nodes[idx]][route_nodes[idx + 1]]
+        dur = matrix_dur[route_nodes[idx]][route_nodes[idx + 1]]
+
+        legs.append(
             {
-                "type": "start",
-                "label": "start",
-                "lat": start_lat,
-                "lng": start_lng,
+                "from": a,
+                "to": b,
+                "distance_m": dist,
+                "duration_s": dur,
             }
-        ] + stops
-
-        total_distance = 0
-        total_duration = 0
-        legs = []
-
-        for idx in range(len(nodes) - 1):
-            a = nodes[idx]
-            b = nodes[idx + 1]
-            if matrix_dist and matrix_dur:
-                dist = matrix_dist[idx][idx + 1]
-                dur = matrix_dur[idx][idx + 1]
-            else:
-                dist = haversine_meters(a["lat"], a["lng"], b["lat"], b["lng"])
-                dur = dist / 11.11
+        )
+        total_distance += dist
+        total_duration += dur
 
-            legs.append(
-                {
-                    "from": a,
-                    "to": b,
-                    "distance_m": dist,
-                    "duration_s": dur,
-                }
-            )
-            total_distance += dist
-            total_duration += dur
+    payload = {
+        "success": True,
+        "mode": mode,
+        "stops": stops,
+        "legs": legs,
+        "total_distance_m": total_distance,
+        "total_duration_s": total_duration,
+        "matrix_source": matrix_source if osrm else "haversine",
+        "skipped": missing_coords,
+        "warning": warning,
+        "optimizer": search_stats,
+        "schedule": schedule_summary,
+    }
+    cache.set(plan_key, payload, int(getattr(settings, "ROUTE_PLAN_CACHE_SECONDS", 300)))
+    return dict(payload, cache="miss"), 200
+
+
+def publish_route_plan(job):
+    """דחיפת התוצאה למתנדב דרך RequestsConsumer (קבוצת volunteer_<id>)."""
+    channel_layer = get_channel_layer()
+    if not channel_layer:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            f"volunteer_{job.user_id}",
+            {"type": "route.plan", "job_id": job.job_id, "status": job.status, "result": job.result},
+        )
+    except Exception:
+        logger.warning("Failed to publish route plan", exc_info=True)
 
+
+def run_route_job(job_id, data):
+    """מריץ עבודת תכנון, שומר את התוצאה ב-RouteJob ודוחף אותה. נקרא מ-plan_route_job או inline."""
+    job = RouteJob.objects.select_related("user").get(job_id=job_id)
+    try:
+        payload, status = compute_route_plan(job.user, data)
+        job.status = "done" if status == 200 else "failed"
+        job.http_status, job.result = status, payload
+    except Exception as e:
+        logger.exception("Route job %s failed", job_id)
+        job.status, job.http_status, job.result = "failed", 500, {"error": str(e)}
+    job.save(update_fields=["status", "http_status", "result", "updated_at"])
+    publish_route_plan(job)
+    return job
+
+
+@csrf_exempt
+@login_required_json
+def suggest_route_api(request):
+    """
+    סינכרוני כברירת מחדל. עם "async": true – מחזיר 202 עם job_id מיד, והחישוב רץ ב-Celery
+    (plan_route_job). התוצאה נדחפת ב-WebSocket (event "route_plan") וזמינה גם ב-route_job_api.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request"}, status=400)
+    try:
+        if request.user.profile.role != "volunteer":
+            return JsonResponse({"error": "Only volunteers can suggest routes"}, status=403)
+
+        data = json.loads(request.body or "{}")
+        if not data.get("async"):
+            payload, status = compute_route_plan(request.user, data)
+            return JsonResponse(payload, status=status)
+
+        job = RouteJob.objects.create(job_id=uuid.uuid4().hex, user=request.user)
+        job_id = job.job_id
+        try:
+            plan_route_job.delay(job_id, data)
+        except Exception:
+            # אין broker – מחשבים כאן כדי לא להיכשל
+            logger.warning("Failed to enqueue plan_route_job, running inline", exc_info=True)
+            job = run_route_job(job_id, data)
+            return JsonResponse(dict(job.result, job_id=job_id), status=job.http_status)
         return JsonResponse(
             {
                 "success": True,
-                "mode": mode,
-                "stops": stops,
-                "legs": legs,
-                "total_distance_m": total_distance,
-                "total_duration_s": total_duration,
-                "matrix_source": "osrm" if osrm else "haversine",
-                "skipped": missing_coords,
-                "warning": warning,
-            }
+                "job_id": job_id,
+                "status": "pending",
+                "status_url": reverse("route_job_api", args=[job_id]),
+            },
+            status=202,
         )
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@login_required_json
+def route_job_api(request, job_id):
+    """poll fallback לעבודת תכנון מסלול: pending / done / failed (+ result). עבודה שפג תוקפה (prune_route_jobs מוחק) – 404."""
+    ttl = int(getattr(settings, "ROUTE_JOB_TTL_SECONDS", 900))
+    job = RouteJob.objects.filter(
+        job_id=job_id, user=request.user, created_at__gte=timezone.now() - timedelta(seconds=ttl)
+    ).first()
+    if job is None:
+        return JsonResponse({"error": "Job not found"}, status=404)
+    return JsonResponse(
+        {
+            "job_id": job.job_id,
+            "status": job.status,
+            "http_status": job.http_status,
+            "result": job.result,
+        }
+    )
+
+
+# --- API: DISPATCH PROPOSALS ---
+@login_required_json
+def dispatch_proposals_api(request):
+    """הצעות השיבוץ של ה-dispatch optimizer למתנדב המחובר, לפי סדר האיסוף בכל נסיעה."""
+    try:
+        if request.user.profile.role != "volunteer":
+            return JsonResponse({"proposals": []})
+        proposals = DispatchProposal.objects.filter(
+            volunteer=request.user,
+            request__status="open",
+        ).select_related("request", *(f"request__{name}" for name in SERIALIZER_RELATIONS))
+        data = [
+            {
+                "request": serialize_request(p.request),
+                "offer_id": p.offer_id,
+                "pickup_index": p.pickup_index,
+                "dropoff_index": p.dropoff_index,
+                "detour_m": round(p.detour_m),
+                "run_id": p.run_id,
+            }
+            for p in proposals
+        ]
+        return JsonResponse({"proposals": data})
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
 # --- API: ROUTE LINKS ---
 @login_required_json
 def route_links_api(request):
@@ -1337,9 +1701,15 @@ def ai_offer_api(request):
         from_lng = parse_optional_float(data.get("from_lng"))
         to_lat = parse_optional_float(data.get("to_lat"))
         to_lng = parse_optional_float(data.get("to_lng"))
+        try:
+            seats = int(data.get("seats") or 1)
+        except (TypeError, ValueError):
+            seats = 0
 
         if not from_addr or not to_addr or not date or not time:
             return JsonResponse({"error": "יש למלא מוצא, יעד, תאריך ושעה."}, status=400)
+        if not 1 <= seats <= 8:
+            return JsonResponse({"error": "מספר המקומות הפנויים חייב להיות בין 1 ל-8."}, status=400)
 
         parsed_date = None
         parsed_time = None
@@ -1376,6 +1746,7 @@ def ai_offer_api(request):
             parsed_to=to_addr,
             parsed_date=parsed_date,
             parsed_time=parsed_time,
+            seats=seats,
             from_lat=from_lat,
             from_lng=from_lng,
             to_lat=to_lat,
@@ -1393,7 +1764,8 @@ def ai_offers_list_api(request):
     if request.method != "GET":
         return JsonResponse({"error": "Invalid request"}, status=400)
     try:
-        offers = RideOffer.objects.filter(status="open").select_related("volunteer").order_by("-created_at")[:50]
+        page, next_cursor = keyset_page(RideOffer.objects.filter(status="open"), request, default_size=50)
+        offers = page.select_related("volunteer")
         data = [
             {
                 "id": o.id,
@@ -1409,114 +1781,202 @@ def ai_offers_list_api(request):
             }
             for o in offers
         ]
-        return JsonResponse({"offers": data})
+        return JsonResponse({"offers": data, "next_cursor": next_cursor})
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
-@csrf_exempt
-@login_required_json
-def ai_auto_suggestions_api(request):
+def _suggestions_stamp(role, user, now):
     """
-    סוכן AI אוטומטי: מזהה התאמות בין המטופל למתנדב ומחזיר הצעות לרול הנוכחי.
-    אין כאן "דחיפה" אמיתית בזמן-אמת (ללא WebSockets בדף) — ה-frontend עושה Poll.
+    חותמת זולה לקלט של חישוב ההצעות (ללא ניקוד). None לרול לא מוכר.
+    כוללת חלון זמן של 10 דקות כי הניקוד תלוי גם בשעה הנוכחית, ואת חותמת השיבוץ הגלובלי
+    (recommended משתנה גם כשמשתמשים אחרים משנים בקשות/הצעות).
     """
-    if request.method != "GET":
-        return JsonResponse({"error": "Invalid request"}, status=400)
-
-    try:
-        role = getattr(request.user.profile, "role", None) or ""
-    except Exception:
-        role = ""
-
-    # Patient side: show matching RideOffers for the latest open TransportRequest
+    bucket = f"{int(now.timestamp() // 600)}:{assignment_stamp()}"
     if role == "sick":
         req = (
-            TransportRequest.objects.filter(sick=request.user, status="open")
+            TransportRequest.objects.filter(sick=user, status="open")
             .order_by("-created_at")
+            .values_list("id", "updated_at")
             .first()
         )
-        if not req:
-            return JsonResponse({"role": "sick", "suggestion_key": "", "offers": []})
-
-        offers_qs = (
-            RideOffer.objects.filter(status="open")
-            .select_related("volunteer")
-            .order_by("-created_at")[:30]
+        offers = RideOffer.objects.filter(status="open").aggregate(total=models.Count("id"), last=models.Max("id"))
+        matched = RequestOfferMatch.objects.filter(request_id=req[0] if req else None).aggregate(
+            total=models.Count("id"), last=models.Max("updated_at")
         )
-        scored_offers = []
-        for o in offers_qs:
-            offer_when = _parse_offer_datetime(o) or (timezone.now() + timedelta(hours=1))
-            sc = _score_request_against_offer(req, o, offer_when)
-            if sc >= 0.2:
-                scored_offers.append(
-                    {
-                        "id": o.id,
-                        "raw_text": o.raw_text,
-                        "volunteer_username": o.volunteer.username,
-                        "score": round(sc, 2),
-                    }
-                )
+        return f"sick:{req}:{offers['total']}:{offers['last']}:{matched['total']}:{matched['last']}:{bucket}"
+    if role == "volunteer":
+        offers = RideOffer.objects.filter(volunteer=user, status="open").aggregate(
+            total=models.Count("id"), last=models.Max("id")
+        )
+        reqs = TransportRequest.objects.filter(status="open", no_volunteers_available=False).aggregate(
+            total=models.Count("id"), last=models.Max("updated_at")
+        )
+        rejected = TransportRejection.objects.filter(volunteer=user).count()
+        matched = RequestOfferMatch.objects.filter(offer__volunteer=user).aggregate(
+            total=models.Count("id"), last=models.Max("updated_at")
+        )
+        return (
+            f"vol:{offers['total']}:{offers['last']}:{reqs['total']}:{reqs['last']}:{rejected}:"
+            f"{matched['total']}:{matched['last']}:{bucket}"
+        )
+    return None
 
-        scored_offers.sort(key=lambda x: x.get("score") or 0, reverse=True)
-        matches = scored_offers[:5]
 
-        best_offer_id = ''
-        if matches and isinstance(matches, list) and len(matches) > 0:
-            try:
-                best_offer_id = str(matches[0].get('id') or '')
-            except Exception:
-                best_offer_id = ''
-        suggestion_key = "sick|" + str(req.id) + "|" + best_offer_id
-        return JsonResponse({"role": "sick", "suggestion_key": suggestion_key, "offers": matches})
+def _suggestion_etag(suggestion_key, stamp):
+    return f'"{suggestion_key}:{version_digest(stamp)}"'
 
+
+def _sick_suggestions(user):
+    # Patient side: show matching RideOffers for the latest open TransportRequest
+    req = (
+        TransportRequest.objects.filter(sick=user, status="open")
+        .order_by("-created_at")
+        .first()
+    )
+    if not req:
+        return {"role": "sick", "suggestion_key": "", "offers": []}
+
+    # top-k מטבלת ההתאמות (matching) – הניקוד חושב כבר ב-save של הבקשה/ההצעות
+    rows = (
+        RequestOfferMatch.objects.filter(request=req, offer__status="open")
+        .annotate(live=live_score())
+        .filter(live__gte=MATCH_MIN_SCORE)
+        .select_related("offer__volunteer")
+        .order_by("-live", "-offer__created_at")[:5]
+    )
+    matches = [
+        {
+            "id": m.offer.id,
+            "raw_text": m.offer.raw_text,
+            "volunteer_username": m.offer.volunteer.username,
+            "score": round(m.live, 2),
+        }
+        for m in rows
+    ]
+
+    # השיבוץ הגלובלי: ההצעה שהבקשה מקבלת כשכל הבקשות משובצות יחד (מקומות פנויים נספרים)
+    recommended = None
+    assigned = recommended_pairing().get(req.id)
+    if assigned:
+        offer = RideOffer.objects.select_related("volunteer").filter(id=assigned[0]).first()
+        if offer:
+            recommended = {
+                "offer_id": offer.id,
+                "raw_text": offer.raw_text,
+                "volunteer_username": offer.volunteer.username,
+                "score": round(assigned[1], 2),
+            }
+
+    best_offer_id = ''
+    if matches and isinstance(matches, list) and len(matches) > 0:
+        try:
+            best_offer_id = str(matches[0].get('id') or '')
+        except Exception:
+            best_offer_id = ''
+    suggestion_key = "sick|" + str(req.id) + "|" + best_offer_id
+    return {"role": "sick", "suggestion_key": suggestion_key, "offers": matches, "recommended": recommended}
+
+
+def _volunteer_suggestions(user):
     # Volunteer side: show matching patient TransportRequests for the volunteer's open RideOffers
-    if role == "volunteer":
-        offers_qs = (
-            RideOffer.objects.filter(volunteer=request.user, status="open")
-            .order_by("-created_at")[:8]
-        )
-        offers_list = list(offers_qs)
-        if not offers_list:
-            return JsonResponse({"role": "volunteer", "suggestion_key": "", "requests": []})
-
-        requests_qs = (
-            TransportRequest.objects.filter(status="open", no_volunteers_available=False)
-            .exclude(rejections__volunteer=request.user)
-            .order_by("-requested_time")[:20]
+    offer_ids = set(RideOffer.objects.filter(volunteer=user, status="open").values_list("id", flat=True))
+    if not offer_ids:
+        return {"role": "volunteer", "suggestion_key": "", "requests": [], "recommended": []}
+
+    # top-k בקשות לפי הציון הטוב ביותר מול אחת ההצעות הפתוחות של המתנדב (טבלת ההתאמות)
+    rows = (
+        RequestOfferMatch.objects.filter(
+            offer__volunteer=user,
+            offer__status="open",
+            request__status="open",
+            request__no_volunteers_available=False,
         )
+        .exclude(request__rejections__volunteer=user)
+        .annotate(live=live_score())
+        .filter(live__gte=MATCH_MIN_SCORE)
+    )
+    top = list(
+        rows.values("request_id")
+        .annotate(best=models.Max("live"))
+        .order_by("-best", "-request__requested_time")[:5]
+    )
+    best_offers = {}
+    for m in rows.filter(request_id__in=[t["request_id"] for t in top]).order_by("-live", "-offer__created_at"):
+        best_offers.setdefault(m.request_id, m.offer_id)
+    requests_map = {
+        r.id: r for r in serializer_queryset(TransportRequest.objects.filter(id__in=[t["request_id"] for t in top]))
+    }
 
-        candidates = []
-        for r in requests_qs:
-            best_score = 0.0
-            best_offer_id = None
-            for o in offers_list:
-                offer_when = _parse_offer_datetime(o) or (timezone.now() + timedelta(hours=1))
-                sc = _score_request_against_offer(r, o, offer_when)
-                if sc > best_score:
-                    best_score = sc
-                    best_offer_id = o.id
+    candidates = []
+    for t in top:
+        r = requests_map.get(t["request_id"])
+        if r is None:
+            continue
+        sr = serialize_request(r)
+        sr["match_score"] = round(t["best"], 2)
+        sr["match_reason"] = "התאמה לפי קואורדינטות/כתובות וזמן"
+        sr["matched_offer_id"] = best_offers.get(r.id)
+        candidates.append(sr)
+
+    best_req_id = ''
+    best_offer_id = ''
+    if candidates and isinstance(candidates, list) and len(candidates) > 0:
+        best_req_id = str(candidates[0].get('id') or '')
+        best_offer_id = str(candidates[0].get('matched_offer_id') or '')
+    suggestion_key = "vol|" + best_req_id + "|" + best_offer_id
+    # השיבוץ הגלובלי: הבקשות שמשובצות להצעות של המתנדב (עד seats לכל הצעה)
+    recommended = sorted(
+        (
+            {"request_id": request_id, "offer_id": offer_id, "score": round(score, 2)}
+            for request_id, (offer_id, score) in recommended_pairing().items()
+            if offer_id in offer_ids
+        ),
+        key=lambda x: (x["offer_id"], -x["score"], x["request_id"]),
+    )
+    return {
+        "role": "volunteer",
+        "suggestion_key": suggestion_key,
+        "requests": candidates,
+        "recommended": recommended,
+    }
 
-            if best_score < 0.2:
-                continue
-            sr = serialize_request(r)
-            sr["match_score"] = round(best_score, 2)
-            sr["match_reason"] = "התאמה לפי קואורדינטות/כתובות וזמן"
-            sr["matched_offer_id"] = best_offer_id
-            candidates.append(sr)
 
-        candidates.sort(key=lambda x: (x.get("match_score") or 0), reverse=True)
-        candidates = candidates[:5]
+@csrf_exempt
+@login_required_json
+def ai_auto_suggestions_api(request):
+    """
+    סוכן AI אוטומטי: מזהה התאמות בין המטופל למתנדב ומחזיר הצעות לרול הנוכחי.
+    אין כאן "דחיפה" אמיתית בזמן-אמת (ללא WebSockets בדף) — ה-frontend עושה Poll.
+    ה-ETag בנוי מ-suggestion_key האחרון + חותמת הקלט, כך ש-poll ללא שינוי מקבל 304 בלי ניקוד מחדש.
+    recommended – השיבוץ הגלובלי (matching.recommended_pairing) ולא רק ההתאמות הטובות למשתמש הזה.
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Invalid request"}, status=400)
 
-        best_req_id = ''
-        best_offer_id = ''
-        if candidates and isinstance(candidates, list) and len(candidates) > 0:
-            best_req_id = str(candidates[0].get('id') or '')
-            best_offer_id = str(candidates[0].get('matched_offer_id') or '')
-        suggestion_key = "vol|" + best_req_id + "|" + best_offer_id
-        return JsonResponse({"role": "volunteer", "suggestion_key": suggestion_key, "requests": candidates})
+    try:
+        role = getattr(request.user.profile, "role", None) or ""
+    except Exception:
+        role = ""
 
-    return JsonResponse({"role": role, "suggestion_key": "", "offers": [], "requests": []})
+    stamp = _suggestions_stamp(role, request.user, timezone.now())
+    if stamp is None:
+        return JsonResponse({"role": role, "suggestion_key": "", "offers": [], "requests": []})
+
+    cache_key = f"ai-suggest:{request.user.pk}:{version_digest(stamp)}"
+    cached_suggestion_key = cache.get(cache_key)
+    if cached_suggestion_key is not None:
+        not_modified = get_conditional_response(request, etag=_suggestion_etag(cached_suggestion_key, stamp))
+        if not_modified is not None:
+            patch_cache_control(not_modified, private=True, no_cache=True)
+            return not_modified
+
+    payload = _sick_suggestions(request.user) if role == "sick" else _volunteer_suggestions(request.user)
+    cache.set(cache_key, payload["suggestion_key"], 600)
+    response = JsonResponse(payload)
+    response["ETag"] = _suggestion_etag(payload["suggestion_key"], stamp)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 @csrf_exempt
@@ -1573,103 +2033,6 @@ def ai_offer_cancel_api(request, offer_id):
         return JsonResponse({"error": str(e)}, status=500)
 
 
-def _parse_offer_datetime(offer):
-    """
-    ניסיון להוציא את התאריך/שעה מהנסיעה הפורסמה.
-    קודם משתמש ב-parsed_date/parsed_time ואז fallback דרך regex על raw_text.
-    """
-    try:
-        if getattr(offer, "parsed_date", None) and getattr(offer, "parsed_time", None):
-            dt = datetime.combine(offer.parsed_date, offer.parsed_time)
-            if timezone.is_naive(dt):
-                dt = timezone.make_aware(dt, timezone.get_current_timezone())
-            return dt
-    except Exception:
-        pass
-
-    # Fallback לפי הטקסט:
-    # "נסיעה עתידית מ-{from} אל {to} בתאריך YYYY-MM-DD בשעה HH:MM ..."
-    try:
-        raw = getattr(offer, "raw_text", "") or ""
-        m = re.search(r"בתאריך\s+(\d{4}-\d{2}-\d{2})\s+בשעה\s+(\d{2}:\d{2})", raw)
-        if not m:
-            return None
-        d = datetime.strptime(m.group(1), "%Y-%m-%d").date()
-        t = datetime.strptime(m.group(2), "%H:%M").time()
-        dt = datetime.combine(d, t)
-        if timezone.is_naive(dt):
-            dt = timezone.make_aware(dt, timezone.get_current_timezone())
-        return dt
-    except Exception:
-        return None
-
-
-def _score_request_against_offer(req, offer, offer_when):
-    """
-    ציון התאמה פשוט כדי לזהות אם יש ללקוח כבר TransportRequest פתוחה תואמת,
-    כדי שלא ניצור בקשה כפולה.
-    """
-    score = 0.0
-    pickup_req = (getattr(req, "pickup_address", "") or "").strip()
-    dest_req = (getattr(req, "destination", "") or "").strip()
-    pickup_offer = (getattr(offer, "parsed_from", "") or "").strip()
-    dest_offer = (getattr(offer, "parsed_to", "") or "").strip()
-
-    if pickup_req and pickup_offer:
-        a = pickup_req.lower()
-        b = pickup_offer.lower()
-        if b in a or a in b:
-            score += 0.45
-
-    if dest_req and dest_offer:
-        a = dest_req.lower()
-        b = dest_offer.lower()
-        if b in a or a in b:
-            score += 0.45
-
-    # ציון לפי מרחק קואורדינטות (אם קיימות)
-    try:
-        if (
-            getattr(req, "pickup_lat", None) is not None
-            and getattr(req, "pickup_lng", None) is not None
-            and getattr(offer, "from_lat", None) is not None
-            and getattr(offer, "from_lng", None) is not None
-        ):
-            dist_pickup = haversine_meters(req.pickup_lat, req.pickup_lng, offer.from_lat, offer.from_lng)
-            if dist_pickup <= 2000:
-                score += 0.15
-    except Exception:
-        pass
-
-    try:
-        if (
-            getattr(req, "dest_lat", None) is not None
-            and getattr(req, "dest_lng", None) is not None
-            and getattr(offer, "to_lat", None) is not None
-            and getattr(offer, "to_lng", None) is not None
-        ):
-            dist_dest = haversine_meters(req.dest_lat, req.dest_lng, offer.to_lat, offer.to_lng)
-            if dist_dest <= 2000:
-                score += 0.15
-    except Exception:
-        pass
-
-    # זמן (חלון ±3 שעות)
-    try:
-        if offer_when and getattr(req, "requested_time", None):
-            if timezone.is_naive(req.requested_time):
-                req_time = timezone.make_aware(req.requested_time, timezone.get_current_timezone())
-            else:
-                req_time = req.requested_time
-            delta_hours = abs((req_time - offer_when).total_seconds()) / 3600.0
-            if delta_hours <= 3.0:
-                score += 0.2
-    except Exception:
-        pass
-
-    return min(1.0, score)
-
-
 @csrf_exempt
 @login_required_json
 def ai_join_offer_api(request, offer_id):
@@ -1693,7 +2056,7 @@ def ai_join_offer_api(request, offer_id):
         destination = offer.parsed_to or "לא צוין יעד"
 
         # תאריך/שעה מתוך ההצעה (כדי להתאים לבקשה קיימת ולא ליצור כפילויות)
-        offer_when = _parse_offer_datetime(offer) or (timezone.now() + timedelta(hours=1))
+        offer_when = offer.departure_at or (timezone.now() + timedelta(hours=1))
 
         pickup_lat = offer.from_lat
         pickup_lng = offer.from_lng
@@ -1727,7 +2090,7 @@ def ai_join_offer_api(request, offer_id):
                 # אם כבר יש שיוך, אין טעם לעדכן
                 if TransportAssignment.objects.filter(request=r).exists():
                     continue
-                sc = _score_request_against_offer(r, offer, offer_when)
+                sc = score_request_against_offer(r, offer, offer_when)
                 if sc > best_score:
                     best_score = sc
                     existing_request = r
@@ -1760,6 +2123,7 @@ def ai_join_offer_api(request, offer_id):
                     "requested_time",
                     "notes",
                     "status",
+                    "updated_at",
                 ]
             )
         else:
@@ -1861,6 +2225,7 @@ def ai_request_api(request):
                 except Exception:
                     logger.warning("Failed to enqueue notify_new_request", exc_info=True)
                 broadcast_request_event("request_created", r)
+                enqueue_dispatch_update(r.id)
             except Exception as e:
                 logger.warning("AI create request failed: %s", e, exc_info=True)
         # התאמת AI: דירוג הצעות לפי התאמה לבקשה (OpenAI אם יש AI_API_KEY, אחרת מילות מפתח)
@@ -1998,7 +2363,8 @@ def ai_grok_chat_api(request):
             xai_messages.append({"role": role, "content": content[:2000]})
 
         try:
-            resp = requests.post(
+            resp = http_client.post(
+                "groq",
                 "https://api.groq.com/openai/v1/chat/completions",
                 headers={
                     "Authorization": f"Bearer {api_key}",
@@ -2011,7 +2377,6 @@ def ai_grok_chat_api(request):
                     "stream": False,
                     "max_tokens": 600,
                 },
-                timeout=40,
             )
             resp.raise_for_status()
             out = resp.json()
@@ -2098,11 +2463,10 @@ def ai_grok_volunteer_chat_api(request):
 
         # Candidate patient requests: open, not cancelled, upcoming
         now = timezone.now()
-        reqs = (
+        reqs = serializer_queryset(
             TransportRequest.objects.filter(status="open", requested_time__gte=now)
-            .select_related("sick", "sick__profile")
-            .order_by("requested_time")[:30]
-        )
+            .order_by("requested_time")
+        )[:30]
         reqs_payload = [
             {
                 "id": r.id,
@@ -2151,7 +2515,8 @@ def ai_grok_volunteer_chat_api(request):
             xai_messages.append({"role": role, "content": content[:2000]})
 
         try:
-            resp = requests.post(
+            resp = http_client.post(
+                "groq",
                 "https://api.groq.com/openai/v1/chat/completions",
                 headers={
                     "Authorization": f"Bearer {api_key}",
@@ -2164,7 +2529,6 @@ def ai_grok_volunteer_chat_api(request):
                     "stream": False,
                     "max_tokens": 600,
                 },
-                timeout=40,
             )
             resp.raise_for_status()
             out = resp.json()
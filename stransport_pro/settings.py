@@ -224,26 +224,102 @@ CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
 STALE_REQUEST_MINUTES = int(os.environ.get("STALE_REQUEST_MINUTES", "30"))
+EXPIRED_PURGE_BATCH_SIZE = int(os.environ.get("EXPIRED_PURGE_BATCH_SIZE", "500"))
+EXPIRED_PURGE_MAX_BATCHES = int(os.environ.get("EXPIRED_PURGE_MAX_BATCHES", "20"))
 CELERY_BEAT_SCHEDULE = {
     "auto-cancel-stale-requests": {
         "task": "stransport.tasks.auto_cancel_stale_requests",
         "schedule": crontab(minute="*/5"),
-    }
+    },
+    "purge-expired-requests": {
+        "task": "stransport.tasks.purge_expired_requests",
+        "schedule": crontab(minute="*/10"),
+    },
+    "prune-route-matrix-cache": {
+        "task": "stransport.tasks.prune_route_matrix_cache",
+        "schedule": crontab(minute=15),
+    },
+    "prune-route-jobs": {
+        "task": "stransport.tasks.prune_route_jobs",
+        "schedule": crontab(minute="*/5"),
+    },
+    "run-dispatch-optimizer": {
+        "task": "stransport.tasks.run_dispatch_optimizer",
+        "schedule": crontab(minute="*/15"),
+    },
 }
 
+# Feeds (cursor pagination)
+FEED_PAGE_SIZE = int(os.environ.get("FEED_PAGE_SIZE", "100"))
+FEED_MAX_PAGE_SIZE = int(os.environ.get("FEED_MAX_PAGE_SIZE", "500"))
+
 # AI (optional)
 AI_API_KEY = os.environ.get("AI_API_KEY", "")
 XAI_API_KEY = os.environ.get("XAI_API_KEY", "")
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY", "")
+# מטמון תשובות התאמת AI (ai_matching): מפתח = סיכום הבקשה + ההצעות, LRU בזיכרון עם TTL
+AI_MATCH_CACHE_SIZE = int(os.environ.get("AI_MATCH_CACHE_SIZE", "512"))
+AI_MATCH_CACHE_TTL_SECONDS = int(os.environ.get("AI_MATCH_CACHE_TTL_SECONDS", "900"))
+AI_MATCH_INFLIGHT_WAIT_SECONDS = int(os.environ.get("AI_MATCH_INFLIGHT_WAIT_SECONDS", "30"))
 
 # Google Places (optional)
 GOOGLE_PLACES_API_KEY = os.environ.get("GOOGLE_PLACES_API_KEY", "")
+GEOCODE_MEMORY_CACHE_SIZE = int(os.environ.get("GEOCODE_MEMORY_CACHE_SIZE", "2048"))
+GEOCODE_CACHE_TTL_SECONDS = int(os.environ.get("GEOCODE_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+GEOCODE_NEGATIVE_TTL_SECONDS = int(os.environ.get("GEOCODE_NEGATIVE_TTL_SECONDS", "3600"))
+GEOCODE_MAX_WORKERS = int(os.environ.get("GEOCODE_MAX_WORKERS", "6"))
 
 # Debug-only automation token (for local terminal watchers)
 DEBUG_AUTOMATION_TOKEN = os.environ.get("DEBUG_AUTOMATION_TOKEN", "")
 
 # OSRM (route matrix)
 OSRM_BASE_URL = os.environ.get("OSRM_BASE_URL", "https://router.project-osrm.org")
+OSRM_CACHE_PRECISION = int(os.environ.get("OSRM_CACHE_PRECISION", "4"))
+OSRM_CACHE_TTL_SECONDS = int(os.environ.get("OSRM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+OSRM_CACHE_MAX_CELLS = int(os.environ.get("OSRM_CACHE_MAX_CELLS", "200000"))
+
+# מנוע ניתוב מקומי (road_graph) – גרף כבישים מקובץ OSM / מוכן (prepare_road_graph).
+# ROUTING_BACKEND: "osrm" (גרף מקומי כגיבוי אם ROAD_GRAPH_PATH מוגדר) או "local" (בלי רשת בכלל)
+ROUTING_BACKEND = os.environ.get("ROUTING_BACKEND", "osrm")
+ROAD_GRAPH_PATH = os.environ.get("ROAD_GRAPH_PATH", "")
+ROAD_GRAPH_MAX_SNAP_M = int(os.environ.get("ROAD_GRAPH_MAX_SNAP_M", "1000"))
+
+# התאמות (ai_auto_suggestions_api): תקרת מועמדים משליפת התאים הסמוכים, מעבר לחלון האחרונים
+MATCH_MAX_CANDIDATES = int(os.environ.get("MATCH_MAX_CANDIDATES", "500"))
+# השיבוץ הגלובלי (recommended) נשמר ב-cache לפי חותמת טבלת ההתאמות; זה רק תקרת הזמן
+MATCH_ASSIGNMENT_CACHE_SECONDS = int(os.environ.get("MATCH_ASSIGNMENT_CACHE_SECONDS", "600"))
+
+# Route optimizer (suggest_route_api)
+ROUTE_MAX_STOPS = int(os.environ.get("ROUTE_MAX_STOPS", "50"))
+ROUTE_TIME_BUDGET_MS = int(os.environ.get("ROUTE_TIME_BUDGET_MS", "300"))
+ROUTE_MAX_PASSES = int(os.environ.get("ROUTE_MAX_PASSES", "200"))
+ROUTE_VEHICLE_CAPACITY = int(os.environ.get("ROUTE_VEHICLE_CAPACITY", "3"))
+# time_windows: חלון איסוף [requested_time - EARLY, requested_time + GRACE], זמן עצירה, משקל איחור
+ROUTE_PICKUP_EARLY_MINUTES = int(os.environ.get("ROUTE_PICKUP_EARLY_MINUTES", "15"))
+ROUTE_PICKUP_GRACE_MINUTES = int(os.environ.get("ROUTE_PICKUP_GRACE_MINUTES", "10"))
+ROUTE_SERVICE_SECONDS = int(os.environ.get("ROUTE_SERVICE_SECONDS", "120"))
+ROUTE_LATENESS_WEIGHT = float(os.environ.get("ROUTE_LATENESS_WEIGHT", "10"))
+# מטמון תוצאות suggest_route_api (נקודת מוצא מעוגלת ל-3 ספרות ≈ 110 מ')
+ROUTE_PLAN_CACHE_SECONDS = int(os.environ.get("ROUTE_PLAN_CACHE_SECONDS", "300"))
+ROUTE_PLAN_START_PRECISION = int(os.environ.get("ROUTE_PLAN_START_PRECISION", "3"))
+# עבודות תכנון אסינכרוניות (RouteJob) – כמה זמן התוצאה נשמרת ל-poll
+ROUTE_JOB_TTL_SECONDS = int(os.environ.get("ROUTE_JOB_TTL_SECONDS", "900"))
+
+# Dispatch optimizer (stransport/dispatch.py)
+DISPATCH_HORIZON_HOURS = int(os.environ.get("DISPATCH_HORIZON_HOURS", "24"))
+DISPATCH_MAX_DETOUR_M = float(os.environ.get("DISPATCH_MAX_DETOUR_M", "20000"))
+DISPATCH_MAX_REQUESTS_PER_VEHICLE = int(os.environ.get("DISPATCH_MAX_REQUESTS_PER_VEHICLE", "4"))
+DISPATCH_TIME_TOLERANCE_MINUTES = int(os.environ.get("DISPATCH_TIME_TOLERANCE_MINUTES", "90"))
+DISPATCH_LOCATION_MAX_AGE_MINUTES = int(os.environ.get("DISPATCH_LOCATION_MAX_AGE_MINUTES", "30"))
+
+# Outbound HTTP (stransport/http_client.py) – דריסות לפי ספק
+OUTBOUND_HTTP = {
+    "google_geocoding": {"pool_size": max(10, GEOCODE_MAX_WORKERS)},
+    "osrm": {"timeout": int(os.environ.get("OSRM_TIMEOUT_SECONDS", "6"))},
+    "groq": {"timeout": int(os.environ.get("GROQ_TIMEOUT_SECONDS", "40"))},
+}
+OUTBOUND_FAILURE_THRESHOLD = int(os.environ.get("OUTBOUND_FAILURE_THRESHOLD", "5"))
+OUTBOUND_COOLDOWN_SECONDS = int(os.environ.get("OUTBOUND_COOLDOWN_SECONDS", "30"))
 
 # Logging
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
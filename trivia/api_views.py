@@ -5,7 +5,7 @@ import hashlib
 import time
 from django.core.cache import cache
 
-import requests
+from stransport import http_client
 from functools import wraps
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
@@ -77,7 +77,8 @@ def _groq_request(messages, temperature=0.25, max_tokens=1200):
         "max_tokens": max_tokens,
     }
 
-    r = requests.post(
+    r = http_client.post(
+        "groq",
         GROQ_BASE_URL,
         headers={
             "Authorization": f"Bearer {api_key}",